@@ -1,24 +1,32 @@
-from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker
 import os
+import sys
+
+# Construção da engine compartilhada com scripts/database.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from conexao import criar_engine, criar_engine_assincrona, url_banco
 
 # Diretório do banco de dados
 DB_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
 os.makedirs(DB_DIR, exist_ok=True)
 
-# URL do banco SQLite
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{os.path.join(DB_DIR, 'smartspend.db')}"
+# URL do banco (DATABASE_URL do ambiente ou o SQLite em data/)
+SQLALCHEMY_DATABASE_URL = url_banco(f"sqlite:///{os.path.join(DB_DIR, 'smartspend.db')}")
+
+# Engine do SQLAlchemy (pool e ajustes por backend)
+engine = criar_engine(SQLALCHEMY_DATABASE_URL)
 
-# Engine do SQLAlchemy
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, 
-    connect_args={"check_same_thread": False}
-)
+# Engine assíncrona (aiosqlite/asyncpg)
+async_engine = criar_engine_assincrona(SQLALCHEMY_DATABASE_URL)
 
 # Session local
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Session assíncrona
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 # Base para os modelos
 Base = declarative_base()
 
@@ -32,6 +40,13 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """
+    Dependency para obter sessão assíncrona do banco
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def init_db():
     """
     Inicializa o banco de dados criando todas as tabelas
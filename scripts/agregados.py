@@ -0,0 +1,197 @@
+"""
+Agregados mensais do dashboard (tabela `agregados_mensais`).
+Em vez de reler e desserializar todas as notas a cada /dashboard, os totais
+por usuário/mês/categoria são atualizados incrementalmente na mesma
+transação que salva ou exclui a nota.
+"""
+from collections import defaultdict
+from datetime import date
+from typing import Dict, Any, List, Optional
+
+from sqlalchemy import func, cast, delete, select, String
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import AgregadoMensal, Nota, Item
+from serializacao import decodificar_itens
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+
+def desserializar_itens(itens_brutos) -> List[Dict[str, Any]]:
+    """
+    Converte o campo `itens` da nota em lista de dicionários.
+    Alguns registros antigos foram serializados duas vezes, por isso
+    a segunda decodificação quando a primeira ainda devolve string.
+    """
+    try:
+        if isinstance(itens_brutos, str):
+            itens_brutos = decodificar_itens(itens_brutos)
+        if isinstance(itens_brutos, str):
+            itens_brutos = decodificar_itens(itens_brutos)
+    except (TypeError, ValueError) as e:
+        log.error("Erro ao desserializar itens: %s", e)
+        return []
+    if not isinstance(itens_brutos, list):
+        return []
+    return [item for item in itens_brutos if isinstance(item, dict)]
+
+
+def _numero(valor) -> float:
+    try:
+        return float(valor or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def mes_referencia(data_compra: Optional[date]) -> str:
+    """Mês de referência YYYY-MM da data da compra"""
+    return (data_compra or date.today()).strftime('%Y-%m')
+
+
+def _mes_sql():
+    """Mesmo cálculo de mes_referencia, feito pelo banco (YYYY-MM-DD -> YYYY-MM)"""
+    return func.substr(cast(Nota.data_compra, String), 1, 7, type_=String)
+
+
+def _upsert(dialeto: str, user_id: int, mes: str, categoria: str, valores: Dict[str, float]):
+    """INSERT ... ON CONFLICT DO UPDATE somando os incrementos (atômico no banco)"""
+    if dialeto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = insert(AgregadoMensal).values(user_id=user_id, mes=mes, categoria=categoria, **valores)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id", "mes", "categoria"],
+        set_={
+            campo: getattr(AgregadoMensal, campo) + getattr(stmt.excluded, campo)
+            for campo in valores
+        }
+    )
+
+
+async def aplicar_nota(db: AsyncSession, user_id: int, data_compra: Optional[date], categoria_nota: str,
+                       total: float, itens: List[Dict[str, Any]], sinal: int = 1):
+    """
+    Soma (sinal=1) ou subtrai (sinal=-1) uma nota dos agregados.
+    Não faz commit: deve rodar na mesma transação que grava/exclui a nota.
+    """
+    mes = mes_referencia(data_compra)
+    incrementos = defaultdict(lambda: {
+        "valor_itens": 0.0, "quantidade_itens": 0, "valor_notas": 0.0, "quantidade_notas": 0
+    })
+
+    for item in itens:
+        categoria_item = item.get('categoria') or 'Outros'
+        incrementos[categoria_item]["valor_itens"] += sinal * _numero(item.get('valor'))
+        incrementos[categoria_item]["quantidade_itens"] += sinal
+
+    categoria_nota = categoria_nota or 'Outros'
+    incrementos[categoria_nota]["valor_notas"] += sinal * _numero(total)
+    incrementos[categoria_nota]["quantidade_notas"] += sinal
+
+    dialeto = db.bind.dialect.name
+    for categoria, valores in incrementos.items():
+        await db.execute(_upsert(dialeto, user_id, mes, categoria, valores))
+
+    if sinal < 0:
+        # Remove linhas que ficaram vazias depois da exclusão
+        await db.execute(delete(AgregadoMensal).where(
+            AgregadoMensal.user_id == user_id,
+            AgregadoMensal.mes == mes,
+            AgregadoMensal.quantidade_itens <= 0,
+            AgregadoMensal.quantidade_notas <= 0
+        ))
+
+
+def reconstruir_agregados(db: Session):
+    """
+    Recalcula todos os agregados a partir das tabelas `notas` e `itens`
+    (backfill / correção) com GROUP BY feito pelo banco
+    """
+    db.query(AgregadoMensal).delete(synchronize_session=False)
+
+    mes = _mes_sql().label("mes")
+    categoria_item = func.coalesce(Item.categoria, 'Outros').label("categoria")
+    categoria_nota = func.coalesce(Nota.categoria, 'Outros').label("categoria")
+
+    por_item = db.query(
+        Nota.user_id, mes, categoria_item, func.sum(Item.valor), func.count(Item.id)
+    ).join(Nota, Nota.id == Item.nota_id).group_by(Nota.user_id, mes, categoria_item).all()
+
+    por_nota = db.query(
+        Nota.user_id, mes, categoria_nota, func.sum(Nota.total), func.count(Nota.id)
+    ).group_by(Nota.user_id, mes, categoria_nota).all()
+
+    dialeto = db.get_bind().dialect.name
+    for user_id, mes_ref, categoria, valor, quantidade in por_item:
+        db.execute(_upsert(dialeto, user_id, mes_ref, categoria,
+                           {"valor_itens": valor or 0.0, "quantidade_itens": quantidade}))
+    for user_id, mes_ref, categoria, valor, quantidade in por_nota:
+        db.execute(_upsert(dialeto, user_id, mes_ref, categoria,
+                           {"valor_notas": valor or 0.0, "quantidade_notas": quantidade}))
+
+    db.commit()
+    log.info("Agregados do dashboard reconstruídos", extra={"grupos": len(por_item) + len(por_nota)})
+
+
+def garantir_agregados(db: Session):
+    """Faz o backfill na primeira subida com notas já existentes"""
+    if db.query(AgregadoMensal.id).first() is None and db.query(Nota.id).first() is not None:
+        reconstruir_agregados(db)
+
+
+async def resumo_dashboard(db: AsyncSession, user_id: int) -> Dict[str, Any]:
+    """Lê os totais do dashboard em O(categorias) linhas"""
+    linhas = (await db.execute(select(
+        AgregadoMensal.categoria,
+        func.sum(AgregadoMensal.valor_itens),
+        func.sum(AgregadoMensal.valor_notas),
+        func.sum(AgregadoMensal.quantidade_notas)
+    ).where(
+        AgregadoMensal.user_id == user_id
+    ).group_by(AgregadoMensal.categoria))).all()
+
+    categorias = {}
+    total_gasto = 0.0
+    quantidade_notas = 0
+    for categoria, valor_itens, valor_notas, qtd_notas in linhas:
+        categorias[categoria] = valor_itens or 0.0
+        total_gasto += valor_notas or 0.0
+        quantidade_notas += qtd_notas or 0
+
+    return {
+        "total_gasto": total_gasto,
+        "quantidade_notas": quantidade_notas,
+        "categorias": categorias
+    }
+
+
+async def resumo_periodo(db: AsyncSession, user_id: int, inicio: Optional[date], fim: Optional[date]) -> Dict[str, Any]:
+    """
+    Mesmo formato de resumo_dashboard para um período arbitrário (`from`/`to`).
+    Os agregados são mensais, então aqui as somas vêm direto de notas/itens,
+    limitadas pelo índice (user_id, data_compra).
+    """
+    from datas import filtrar_periodo
+
+    total_gasto, quantidade_notas = (await db.execute(filtrar_periodo(
+        select(func.sum(Nota.total), func.count(Nota.id)).where(Nota.user_id == user_id),
+        inicio, fim
+    ))).one()
+
+    categoria_item = func.coalesce(Item.categoria, 'Outros')
+    linhas = (await db.execute(filtrar_periodo(
+        select(categoria_item, func.sum(Item.valor))
+        .join(Nota, Nota.id == Item.nota_id)
+        .where(Nota.user_id == user_id),
+        inicio, fim
+    ).group_by(categoria_item))).all()
+
+    return {
+        "total_gasto": total_gasto or 0.0,
+        "quantidade_notas": quantidade_notas or 0,
+        "categorias": {categoria: valor or 0.0 for categoria, valor in linhas}
+    }
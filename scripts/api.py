@@ -1,16 +1,21 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException, Depends
+from fastapi import FastAPI, File, UploadFile, HTTPException, Depends, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse, Response
+import asyncio
 import json
+import logging
 import os
-from datetime import datetime
-from typing import Dict, Any
+import time
+from datetime import date, datetime
+from typing import Dict, Any, List, Optional, Union
 import uuid
 from google import genai
+from google.genai import types
 from dotenv import load_dotenv
 import io
 from PIL import Image
-from sqlalchemy.orm import Session
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 # Importações do banco de dados
 from database import get_db, init_db
@@ -22,12 +27,40 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 # Agora os seus imports vão funcionar:
-from database import get_db, init_db
+from database import get_async_db, init_db, SessionLocal, AsyncSessionLocal, engine, async_engine
 from models import Nota, Item
+from limitador import LimitadorConcorrencia
+from jobs import fila_jobs, criar_job, buscar_job, atualizar_job, STATUS_FINAIS
+from cache_notas import cache_notas, calcular_sha256
+from clientes_gemini import clientes_gemini
+from roteador_gemini import RoteadorGemini
+from hedging import ControleHedge, Largada
+from preprocessamento import preprocessar_imagem
+from categorizador import categoria_canonica, categorizador
+from cache_dashboard import cache_dashboard
+from serializacao import RespostaJSON, dumps, dumps_texto, estatisticas as estatisticas_serializacao
+from registro import obter_logger, id_requisicao, novo_id_requisicao
+from metricas import (metricas, TIPO_CONTEUDO, rotulo_chave, tempo_preprocessamento, tempo_gemini, tempo_json_parse,
+                      falhas_gemini, analises_notas, tempo_db_commit, tempo_dashboard, respostas_dashboard, tempo_http)
+from rastreamento import rastreador, TIPO_SERVIDOR
+from extracao import (RESPOSTA_GEMINI_CONFIG, RESPOSTA_ITENS_CONFIG, ItensExtraidos, NotaExtraida,
+                      RespostaInvalida, estatisticas_respostas, interpretar_resposta)
+from nfce import NFCE_SEM_ITENS, cabecalho_completo, conferir_com_chave, ler_nfce, montar_nota
+from conexao import estatisticas_engine
+from lote import (eh_zip, expandir_zip, remover_gravados, verificar_limites_lote,
+                  UPLOAD_LOTE_PARALELISMO, UPLOAD_LOTE_MAX_BYTES, UPLOAD_LOTE_MAX_MB)
+from armazenamento import armazenamento, sha_da_chave
+from ingestao import UploadGravado, gravar_upload, UPLOAD_MAX_BYTES, UPLOAD_MAX_MB, UPLOAD_MARGEM_MULTIPART
+from agregados import aplicar_nota, garantir_agregados, resumo_dashboard, resumo_periodo
+from itens import criar_itens, carregar_itens, excluir_itens, migrar_itens_json
+from paginacao import buscar_pagina, LIMITE_PADRAO, LIMITE_MAXIMO
+from datas import converter_data, contar_compras_mes, filtrar_periodo, migrar_datas, validar_periodo
 
 # Carregar variáveis de ambiente da pasta raiz
 load_dotenv(os.path.join(os.path.dirname(os.path.dirname(__file__)), '.env'))
 
+log = obter_logger(__name__)
+
 # ✅ CARREGAMENTO INTELIGENTE DE CHAVES
 def get_available_keys():
     """Varre ambiente buscando todas as chaves Gemini disponíveis"""
@@ -37,26 +70,54 @@ def get_available_keys():
     main_key = os.getenv("GEMINI_API_KEY")
     if main_key and len(main_key.strip()) >= 10:
         available_keys.append(main_key.strip())
-        print(f"✅ GEMINI_API_KEY encontrada: {main_key[:10]}...{main_key[-10:]}")
+        log.debug("GEMINI_API_KEY encontrada", extra={"chave": f"...{main_key.strip()[-4:]}"})
     
     # Busca GEMINI_KEY_1, GEMINI_KEY_2, etc.
     for i in range(1, 50):  # Busca até 50 chaves
         key = os.getenv(f"GEMINI_KEY_{i}")
         if key and len(key.strip()) >= 10:
             available_keys.append(key.strip())
-            print(f"✅ GEMINI_KEY_{i} encontrada: {key[:10]}...{key[-10:]}")
+            log.debug("GEMINI_KEY_%d encontrada", i, extra={"chave": f"...{key.strip()[-4:]}"})
     
     if not available_keys:
         raise ValueError("❌ Nenhuma chave Gemini encontrada! Configure GEMINI_API_KEY ou GEMINI_KEY_X no .env")
     
-    print(f"🔑 Total de {len(available_keys)} chaves Gemini carregadas para rodízio")
+    log.info("%d chaves Gemini carregadas para rodízio", len(available_keys))
     return available_keys
 
 # Lista global de chaves disponíveis
 AVAILABLE_KEYS = get_available_keys()
 
-# ✅ CLIENTE GLOBAL (será recriado dinamicamente sem http_options)
-client = genai.Client(api_key=AVAILABLE_KEYS[0])
+# ✅ CLIENTES REUTILIZÁVEIS: um por chave, criados uma única vez (pool HTTP com keep-alive)
+clientes_gemini.inicializar(AVAILABLE_KEYS)
+
+# ✅ MODELOS EM ORDEM DE PREFERÊNCIA (configurável por GEMINI_MODELOS=modelo1,modelo2)
+MODELOS_GEMINI = [
+    m.strip().replace('models/', '')
+    for m in os.getenv("GEMINI_MODELOS", "gemini-flash-latest,gemini-2.0-flash-exp,gemini-1.5-pro-latest").split(",")
+    if m.strip()
+]
+
+# Máximo de tentativas (pares chave/modelo) por nota
+GEMINI_MAX_TENTATIVAS = int(os.getenv("GEMINI_MAX_TENTATIVAS", "6"))
+
+# ✅ ROTEADOR COM CIRCUIT BREAKERS POR CHAVE E POR MODELO
+roteador_gemini = RoteadorGemini(AVAILABLE_KEYS, MODELOS_GEMINI)
+
+# ✅ LIMITE DE EXTRAÇÕES SIMULTÂNEAS POR PROCESSO
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+limitador_extracao = LimitadorConcorrencia(GEMINI_MAX_CONCURRENCY)
+
+# ✅ HEDGING OPCIONAL (GEMINI_HEDGING=1) CONTRA LATÊNCIA DE CAUDA
+# (o relógio só corre depois que a tentativa ganha vaga no limitador)
+controle_hedge = ControleHedge(limitador=limitador_extracao)
+
+# Estado instantâneo da extração no /metrics
+metricas.medidor("smartspend_extracoes_em_execucao", "Chamadas ao Gemini em andamento",
+                 lambda: limitador_extracao.em_execucao)
+metricas.medidor("smartspend_extracoes_na_fila", "Extrações esperando vaga no limitador",
+                 lambda: limitador_extracao.na_fila)
+metricas.medidor("smartspend_fila_jobs", "Jobs de upload esperando um worker", lambda: fila_jobs.tamanho())
 
 # ✅ SISTEMA DE RODÍZIO DE CHAVES API (COMENTADO TEMPORARIAMENTE)
 # def get_api_keys():
@@ -86,7 +147,7 @@ client = genai.Client(api_key=AVAILABLE_KEYS[0])
 #     print(f"🔑 Processando com Chave {key_index + 1} de {len(API_KEYS)} ({api_key[:10]}...{api_key[-10:]})")
 #     return genai.Client(api_key=api_key)
 
-app = FastAPI(title="SmartSpend-BR API", version="1.0.0")
+app = FastAPI(title="SmartSpend-BR API", version="1.0.0", default_response_class=RespostaJSON)
 
 # Configurar CORS para aceitar requisições do frontend
 app.add_middleware(
@@ -97,6 +158,56 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Corpo máximo por rota de upload: (bytes, mensagem do 413)
+LIMITES_CORPO_UPLOAD = {
+    "/upload": (UPLOAD_MAX_BYTES, f"Arquivo excede {UPLOAD_MAX_MB} MB"),
+    "/upload/batch": (UPLOAD_LOTE_MAX_BYTES, f"Lote excede {UPLOAD_LOTE_MAX_MB} MB"),
+}
+
+@app.middleware("http")
+async def limitar_tamanho_upload(request, call_next):
+    """Recusa /upload e /upload/batch grandes demais pelo Content-Length, antes de ler o corpo"""
+    limite = LIMITES_CORPO_UPLOAD.get(request.url.path) if request.method == "POST" else None
+    if limite:
+        maximo, detalhe = limite
+        tamanho = request.headers.get("content-length")
+        if tamanho and tamanho.isdigit() and int(tamanho) > maximo + UPLOAD_MARGEM_MULTIPART:
+            return JSONResponse(status_code=413, content={"detail": detalhe})
+    return await call_next(request)
+
+@app.middleware("http")
+async def registrar_requisicao(request: Request, call_next):
+    """
+    ID por requisição (X-Request-ID) nos logs e na resposta + uma linha de log por requisição.
+    Com o rastreamento ligado, a requisição é o span raiz do trace (X-Trace-ID na resposta).
+    """
+    requisicao = request.headers.get("x-request-id") or novo_id_requisicao()
+    token = id_requisicao.set(requisicao)
+    inicio = time.perf_counter()
+    try:
+        with rastreador.span(f"{request.method} {request.url.path}", {
+            "http.request.method": request.method, "url.path": request.url.path, "request_id": requisicao
+        }, tipo=TIPO_SERVIDOR, pai=request.headers.get("traceparent")) as span:
+            resposta = await call_next(request)
+            resposta.headers["X-Request-ID"] = requisicao
+            duracao = time.perf_counter() - inicio
+            log.info("%s %s %d", request.method, request.url.path, resposta.status_code, extra={
+                "status": resposta.status_code, "duracao_ms": round(duracao * 1000, 1)
+            })
+            # Rota pelo molde (/compras/{compra_id}), não pelo caminho, para não explodir as séries
+            rota = getattr(request.scope.get("route"), "path", "desconhecida")
+            tempo_http.observar(duracao, metodo=request.method, rota=rota, status=str(resposta.status_code))
+            span.renomear(f"{request.method} {rota}")
+            span.definir_atributos({"http.route": rota, "http.response.status_code": resposta.status_code})
+            if span.trace_id:
+                resposta.headers["X-Trace-ID"] = span.trace_id
+        return resposta
+    except Exception:
+        log.exception("Erro não tratado", extra={"metodo": request.method, "rota": request.url.path})
+        raise
+    finally:
+        id_requisicao.reset(token)
+
 # Estrutura de dados segura (padrão mockData.js)
 DEFAULT_DASHBOARD_DATA = {
     "totalGasto": 0.0,
@@ -136,129 +247,110 @@ def padronizar_categoria(categoria: str) -> str:
     """
     Força categoria para primeira letra maiúscula
     """
-    if not categoria:
-        return "Outros"
-    
-    categoria_normalizada = categoria.strip().lower()
-    
-    # Mapeamento de categorias válidas
-    categorias_validas = {
-        "alimentos": "Alimentos",
-        "bebidas": "Bebidas", 
-        "limpeza": "Limpeza",
-        "farmácia": "Farmácia",
-        "farmacia": "Farmácia",
-        "combustível": "Combustível",
-        "combustivel": "Combustível",
-        "restaurante": "Restaurante",
-        "lazer": "Lazer",
-        "serviços": "Serviços",
-        "servicos": "Serviços",
-        "outros": "Outros"
-    }
-    
-    return categorias_validas.get(categoria_normalizada, "Outros")
+    return categoria_canonica(categoria) or "Outros"
 
 # Inicializar banco de dados na startup
 @app.on_event("startup")
 async def startup_event():
     init_db()
     
-    # ✅ DIAGNÓSTICO DE MODELOS NO STARTUP
-    print("🔍 DIAGNÓSTICO: Listando modelos disponíveis...")
+    # ✅ MIGRAÇÃO DAS DATAS E DOS ITENS EM JSON + BACKFILL DOS AGREGADOS (só na primeira subida)
+    db = SessionLocal()
+    try:
+        migrar_datas(db)
+        migrar_itens_json(db)
+        garantir_agregados(db)
+    finally:
+        db.close()
+    
+    # ✅ WORKERS DA FILA DE UPLOADS (retoma jobs pendentes após restart)
+    await fila_jobs.iniciar(processar_job)
+    
+    # ✅ RETENÇÃO DAS IMAGENS (compacta/remove originais antigos periodicamente)
+    app.state.manutencao_imagens = asyncio.create_task(armazenamento.manutencao_periodica())
+    
+    # ✅ DIAGNÓSTICO DE MODELOS NO STARTUP (detalhe só com LOG_NIVEL=DEBUG)
+    if not log.isEnabledFor(logging.DEBUG):
+        return
     try:
         if AVAILABLE_KEYS:
-            # Usa primeira chave para diagnóstico (sem http_options)
-            diagnostic_client = genai.Client(api_key=AVAILABLE_KEYS[0])
+            # Usa o cliente já registrado da primeira chave
+            diagnostic_client = clientes_gemini.obter(AVAILABLE_KEYS[0])
             
             # Lista todos os modelos disponíveis (sem config)
             models = diagnostic_client.models.list()
             
-            print("📋 MODELOS DISPONÍVEIS:")
-            for model in models:
-                print(f"   MODELO: {model.name}")
-            
-            # Busca especificamente por modelos flash
-            flash_models = [m for m in models if 'flash' in m.name.lower()]
-            print(f"⚡ MODELOS FLASH ENCONTRADOS: {len(flash_models)}")
-            for model in flash_models:
-                print(f"   FLASH: {model.name}")
+            nomes = [model.name for model in models]
+            flash = [nome for nome in nomes if 'flash' in nome.lower()]
+            log.debug("Modelos disponíveis: %d (%d flash)", len(nomes), len(flash),
+                      extra={"modelos": nomes, "flash": flash})
         else:
-            print("❌ Nenhuma chave disponível para diagnóstico")
+            log.warning("Nenhuma chave disponível para diagnóstico de modelos")
             
-    except Exception as e:
-        print(f"❌ ERRO NO DIAGNÓSTICO DE MODELOS: {type(e).__name__} - {str(e)}")
-        import traceback
-        print(f"❌ TRACEBACK: {traceback.format_exc()}")
+    except Exception:
+        log.exception("Erro no diagnóstico de modelos")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await fila_jobs.parar()
+    app.state.manutencao_imagens.cancel()
+    await async_engine.dispose()
 
 # Funções auxiliares do banco
-def get_or_create_default_user(db: Session) -> User:
+USUARIO_PADRAO_ID = 1
+
+async def get_or_create_default_user(db: AsyncSession) -> User:
     """Obtém ou cria o usuário padrão (ID=1)"""
-    user = db.query(User).filter(User.id == 1).first()
+    user = await db.get(User, USUARIO_PADRAO_ID)
     if not user:
         user = User(
-            id=1,
+            id=USUARIO_PADRAO_ID,
             email="user@smartspend.com",
             nome="Usuário Padrão",
             password_hash="placeholder"
         )
         db.add(user)
-        db.commit()
-        db.refresh(user)
+        await db.commit()
     return user
 
-def calcular_dashboard_data(notas: list) -> Dict[str, Any]:
-    """Calcula dados do dashboard a partir das notas do usuário"""
+def nota_para_compra(nota: Nota, itens: Optional[list] = None) -> Dict[str, Any]:
+    """
+    Converte a nota do banco no formato de compra usado pelo frontend
+    (`itens=None` omite a lista de itens)
+    """
+    compra = {
+        "id": nota.id,
+        "mercado": nota.mercado,
+        "data": nota.data_compra.strftime('%d/%m/%Y') if nota.data_compra else nota.data,
+        "total": nota.total,
+        "categoria": nota.categoria,
+        "imagem": f"/compras/{nota.id}/imagem" if nota.imagem_chave else None
+    }
+    if itens is not None:
+        compra["itens"] = itens  # ✅ AGORA TEM ITENS!
+    return compra
+
+def calcular_dashboard_data(notas: list, resumo: Dict[str, Any], itens_por_nota: Dict[str, list],
+                            proximo_cursor: Optional[str] = None, legado: bool = False) -> Dict[str, Any]:
+    """
+    Monta o dashboard a partir dos agregados pré-calculados e das notas do usuário.
+    `legado` repete a lista em "feed" (formato antigo, só com ?completo=true).
+    """
     if not notas:
         return DEFAULT_DASHBOARD_DATA
     
-    # Calcular totais
-    total_gasto = sum(nota.total for nota in notas)
+    # ✅ TOTAIS VÊM DOS AGREGADOS (O(categorias), sem reler os itens de cada nota)
+    total_gasto = resumo["total_gasto"]
     
     # Economia estimada (10% do total - simplificado)
     economia_estimada = total_gasto * 0.1
     
-    # Contar compras do mês
-    compras_mes = len(notas)
-    
-    # ✅ CORREÇÃO: Agrupar por categoria de CADA ITEM (não da nota)
-    categorias_valores = {}
-    for nota in notas:
-        # Desserializa itens da nota
-        # Desserializa itens da nota
-        try:
-            itens_brutos = nota.itens
-            
-            # Camada 1: Se for string, tenta carregar
-            if isinstance(itens_brutos, str):
-                itens_brutos = json.loads(itens_brutos)
-            
-            # Camada 2: O segredo! Se carregou e AINDA é string, carrega de novo
-            # Isso resolve o erro de "letra por letra"
-            if isinstance(itens_brutos, str):
-                itens_brutos = json.loads(itens_brutos)
-                
-            itens = itens_brutos if isinstance(itens_brutos, list) else []
-            
-        except Exception as e:
-            print(f"❌ Erro ao limpar itens: {e}")
-            itens = []
-        # Agrupa por categoria de CADA ITEM
-        for item in itens:
-            if not isinstance(item, dict):
-                print(f"⚠️ Item não é dicionário: {type(item)} - {item}")
-                continue
-                
-            categoria_item = item.get('categoria', 'Outros')
-            valor_item = float(item.get('valor', 0))
-            
-            if categoria_item not in categorias_valores:
-                categorias_valores[categoria_item] = 0
-            categorias_valores[categoria_item] += valor_item
+    # Contar compras do mês (mês corrente, calculado por range query)
+    compras_mes = resumo["compras_mes"]
     
-    # Montar gráfico com cores
+    # Montar gráfico com cores (categoria de CADA ITEM, não da nota)
     grafico = []
-    for categoria, valor in categorias_valores.items():
+    for categoria, valor in resumo["categorias"].items():
         if valor > 0:  # Apenas categorias com valor
             grafico.append({
                 "name": categoria,
@@ -267,39 +359,10 @@ def calcular_dashboard_data(notas: list) -> Dict[str, Any]:
             })
     
     # ✅ CORREÇÃO: Montar compras com itens desserializados
-    compras = []
-    for nota in notas:
-        # Desserializa JSON dos itens
-        try:
-            if isinstance(nota.itens, str):
-                itens = json.loads(nota.itens)
-            elif isinstance(nota.itens, list):
-                itens = nota.itens
-            else:
-                print(f"⚠️ Tipo inesperado de itens: {type(nota.itens)}")
-                itens = []
-        except json.JSONDecodeError as e:
-            print(f"❌ Erro ao desserializar itens da nota {nota.id}: {e}")
-            itens = []
-        except Exception as e:
-            print(f"❌ Erro inesperado: {type(e).__name__} - {e}")
-            itens = []
-        
-        compras.append({
-            "id": nota.id,
-            "mercado": nota.mercado,
-            "data": nota.data,
-            "total": nota.total,
-            "categoria": nota.categoria,
-            "itens": itens  # ✅ AGORA TEM ITENS!
-        })
-    
-    compras.sort(key=lambda x: x["data"], reverse=True)
-    
-    # ATRIBUIÇÃO EXPLÍCITA
-    feed_data = compras  # Garante que a variável é a mesma
+    # (as notas já chegam ordenadas da mais recente para a mais antiga)
+    compras = [nota_para_compra(nota, itens_por_nota.get(nota.id, [])) for nota in notas]
     
-    return {
+    dashboard = {
         "totalGasto": round(total_gasto, 2),
         "economiaEstimada": round(economia_estimada, 2),
         "comprasMes": compras_mes,
@@ -307,11 +370,14 @@ def calcular_dashboard_data(notas: list) -> Dict[str, Any]:
         "categorias": grafico,
         "grafico": grafico,  # Compatibilidade
         
-        "compras": compras,  # Dados novos
-        "feed": feed_data,   # DADOS LEGADOS (CRÍTICO: Deve ser igual a compras)
+        "compras": compras,  # N mais recentes; as demais via GET /compras?cursor=proximoCursor
+        "proximoCursor": proximo_cursor,
         
         "ultimaNota": compras[0] if compras else None
     }
+    if legado:
+        dashboard["feed"] = compras  # DADOS LEGADOS (mesma lista de compras)
+    return dashboard
 
 def carregar_historico_compras() -> Dict[str, Any]:
     """Carrega dados do arquivo JSON ou retorna estrutura padrão"""
@@ -327,13 +393,13 @@ def carregar_historico_compras() -> Dict[str, Any]:
                 
                 # Verificação adicional para garantir que dados essenciais existam
                 if not merged_data.get('totalGasto') and not merged_data.get('feed'):
-                    print("Arquivo existe mas está vazio ou inválido, usando dados padrão")
+                    log.warning("Histórico existe mas está vazio ou inválido, usando dados padrão")
                     return DEFAULT_DASHBOARD_DATA.copy()
                 
                 return merged_data
         else:
             # Retorna estrutura com dados de exemplo para evitar erro de "dados vazios"
-            print("Arquivo de dados não encontrado, retornando dados de exemplo")
+            log.info("Histórico não encontrado, retornando dados de exemplo")
             example_data = DEFAULT_DASHBOARD_DATA.copy()
             example_data.update({
                 "totalGasto": 1254.80,
@@ -365,8 +431,8 @@ def carregar_historico_compras() -> Dict[str, Any]:
             })
             return example_data
             
-    except Exception as e:
-        print(f"Erro ao carregar dados: {e}")
+    except Exception:
+        log.exception("Erro ao carregar histórico")
         # Retorna dados de exemplo mesmo em caso de erro
         example_data = DEFAULT_DASHBOARD_DATA.copy()
         example_data.update({
@@ -376,162 +442,159 @@ def carregar_historico_compras() -> Dict[str, Any]:
         })
         return example_data
 
-def categorizar_produto(nome_produto: str) -> str:
+@rastreador.rastrear()
+async def extrair_dados_gemini(origem: Union[bytes, str], dados_nfce: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
-    Categoriza um produto baseado em regras heurísticas
+    Envia a imagem (bytes ou caminho do upload) ao Gemini (rodízio de chaves/modelos) e retorna o JSON extraído.
+    Com `dados_nfce` (QR lido localmente) o modelo só extrai o que o QR não traz.
     """
-    nome_lower = nome_produto.lower()
-    
-    # Bebidas alcoólicas
-    bebidas_alcoolicas = ['cerveja', 'vinho', 'refrigerante', 'suco', 'água', 'bebida', 'drink']
-    if any(bebida in nome_lower for bebida in bebidas_alcoolicas):
-        return 'Bebidas'
+    # ✅ PRÉ-PROCESSAMENTO: orientação, cinza, contraste, recorte e redução (fora do event loop)
+    with tempo_preprocessamento.medir(), rastreador.span("preprocessar_imagem"):
+        dados_envio, mime_envio, stats_preproc = await asyncio.to_thread(preprocessar_imagem, origem)
+    log.debug("Imagem preparada", extra={"dimensoes": [stats_preproc.get('dimensoes_original'),
+                                                        stats_preproc.get('dimensoes_enviadas')],
+                                         "bytes": [stats_preproc.get('bytes_original'), len(dados_envio)]})
+    imagem_envio = types.Part.from_bytes(data=dados_envio, mime_type=mime_envio)
     
-    # Limpeza
-    limpeza = ['sabão', 'detergente', 'limpa', 'papel', 'alvejante', 'desinfetante', 'vassoura', 'pano']
-    if any(item in nome_lower for item in limpeza):
-        return 'Limpeza'
-    
-    # Alimentos (padrão)
-    return 'Alimentos'
+    # Prompt otimizado para análise (o formato vem do schema em RESPOSTA_GEMINI_CONFIG)
+    prompt = """
+Analise esta nota fiscal e extraia o estabelecimento, a data, o total, a
+categoria principal e cada item comprado.
 
-async def analisar_nota(image_bytes: bytes) -> Dict[str, Any]:
-    """
-    Analisa nota fiscal usando Gemini AI com google-genai
-    """
-    try:
-        print("🔍 Iniciando análise da nota fiscal...")
-        
-        # ✅ INICIALIZAR VARIÁVEL
-        response = None
-        
-        # Converte bytes para imagem PIL
-        image_pil = Image.open(io.BytesIO(image_bytes))
-        print(f"📷 Imagem carregada: {image_pil.size}")
-        
-        # Prompt otimizado para análise
+REGRAS OBRIGATÓRIAS:
+1. CATEGORIA: Use uma destas: 'Alimentos', 'Bebidas', 'Limpeza', 'Farmácia', 'Combustível', 'Restaurante', 'Lazer', 'Serviços', 'Outros'
+2. VALORES: Números em reais (ex: 12.34), valor total de cada item
+3. DATA: Formato YYYY-MM-DD
+4. QUANTIDADE: Sempre inclua (padrão: 1)
+        """
+    config_resposta, esquema = RESPOSTA_GEMINI_CONFIG, NotaExtraida
+    
+    # ✅ NFC-e: data e total já vieram do QR code, o modelo lê só mercado e itens
+    if cabecalho_completo(dados_nfce):
         prompt = """
-Analise esta nota fiscal e extraia as informações em formato JSON.
-
-Retorne APENAS um JSON válido (sem ```json no início) com esta estrutura exata:
-{
-    "mercado": "nome do estabelecimento",
-    "data": "2026-01-30",
-    "total": 123.45,
-    "categoria": "Alimentos",
-    "itens": [
-        {
-            "nome": "nome do produto",
-            "valor": 12.34,
-            "quantidade": 1,
-            "categoria": "Alimentos"
-        }
-    ]
-}
+Esta é uma NFC-e; data e total já são conhecidos. Extraia apenas o nome do
+estabelecimento e cada item comprado.
 
 REGRAS OBRIGATÓRIAS:
 1. CATEGORIA: Use uma destas: 'Alimentos', 'Bebidas', 'Limpeza', 'Farmácia', 'Combustível', 'Restaurante', 'Lazer', 'Serviços', 'Outros'
-2. CAMPO VALOR: Use "valor" (NUNCA "preco") para cada item
-3. VALORES: Retorne números (float) para valores
-4. DATA: Formato YYYY-MM-DD
-5. QUANTIDADE: Sempre inclua (padrão: 1)
+2. VALORES: Números em reais (ex: 12.34), valor total de cada item
+3. QUANTIDADE: Sempre inclua (padrão: 1)
         """
-        
-        # ✅ SISTEMA DE RODÍZIO DE CHAVES COM RESILIÊNCIA
-        modelos_para_testar = [
-                  # Tentativa 1: O mais novo disponível
-            "gemini-flash-latest",    # Tentativa 2: O alias estável
-            "gemini-2.0-flash-exp",   # Tentativa 3: Experimental
-            "gemini-1.5-pro-latest"   # Tentativa 4: Backup robusto
-        ]
-        
-        print(f"🔍 Iniciando análise com {len(AVAILABLE_KEYS)} chaves e {len(modelos_para_testar)} modelos")
-        
-        for key_index, api_key in enumerate(AVAILABLE_KEYS):
-            for modelo in modelos_para_testar:
-                try:
-                    print(f"🔑 Chave {key_index + 1}/{len(AVAILABLE_KEYS)} (...{api_key[-4:]}) - Modelo: {modelo}")
-                    
-                    # ✅ TRATAMENTO DE PREFIXO
-                    modelo_final = modelo
-                    if modelo.startswith('models/'):
-                        # Tenta sem prefixo primeiro
-                        modelo_final = modelo.replace('models/', '')
-                        print(f"🔄 Removendo prefixo 'models/': {modelo_final}")
-                    
-                    # Cria cliente dinâmico para esta chave (sem http_options)
-                    current_client = genai.Client(api_key=api_key)
-                    
-                    print(f"✅ Conectado na API com sucesso!")
-                    print(f"🤖 Enviando para Gemini {modelo_final}...")
-                    
-                    # ✅ CHAMADA DIRETA COM CLIENTE DINÂMICO
-                    response = current_client.models.generate_content(
-                        model=modelo_final,
-                        contents=[prompt, image_pil]
-                    )
-                    
-                    print(f"✅ SUCESSO! Chave {key_index + 1} + Modelo {modelo_final} funcionaram! Resposta: {len(response.text)} caracteres")
-                    break  # Sai do loop de modelos
-                    
-                except Exception as e:
-                    error_msg = str(e).lower()
-                    error_type = type(e).__name__
-                    print(f"❌ Erro com chave {key_index + 1} + modelo {modelo}: {error_type}")
-                    print(f"   Mensagem: {str(e)[:200]}")  # Primeiros 200 caracteres
-                    
-                    # ClientError geralmente indica problema de autenticação ou permissão
-                    if error_type == "ClientError":
-                        print(f"⚠️ ClientError - possível problema com a chave API")
-                        # Tenta próxima chave
-                        break
-                    
-                    # Se for erro 404 (modelo não encontrado), tenta próximo modelo
-                    if "404" in error_msg or "not found" in error_msg:
-                        print(f"🔄 Modelo {modelo} não encontrado, tentando próximo modelo...")
-                        continue
-                    
-                    # Verifica se é erro de cota ou servidor Google
-                    if ("429" in error_msg or "quota" in error_msg or 
-                        "resource has been exhausted" in error_msg or 
-                        "500" in error_msg or "internal server error" in error_msg):
-                        print(f"⚠️ Chave terminada em ...{api_key[-4:]} falhou. Tentando próxima chave...")
-                        break  # Sai do loop de modelos e vai para próxima chave
-                    
-                    # Se for o último modelo e última chave, propaga erro
-                    if (key_index == len(AVAILABLE_KEYS) - 1 and 
-                        modelo == modelos_para_testar[-1]):
-                        print(f"❌ TODAS AS {len(AVAILABLE_KEYS)} CHAVES E {len(modelos_para_testar)} MODELOS FALHARAM!")
-                        print(f"❌ ERRO FINAL: {error_type}")
-                        print(f"❌ MENSAGEM: {str(e)}")
-                        import traceback
-                        print(f"❌ TRACEBACK: {traceback.format_exc()}")
-                        raise HTTPException(status_code=500, detail=f"Erro na análise: Todas as chaves/modelos esgotados. {str(e)}")
-                    
-                    continue  # Tenta próximo modelo
+        config_resposta, esquema = RESPOSTA_ITENS_CONFIG, ItensExtraidos
+    
+    # ✅ ROTEADOR: escolhe chave/modelo saudáveis e lembra cotas esgotadas e 404s
+    
+    @rastreador.rastrear("gemini.tentativa")
+    async def tentar(api_key: str, modelo: str, largada: Optional[Largada] = None) -> Dict[str, Any]:
+        """Uma tentativa completa: chamada ao modelo + JSON válido (um span por par chave/modelo)"""
+        span = rastreador.atual()
+        span.definir_atributos({"gemini.chave": rotulo_chave(api_key), "gemini.modelo": modelo})
+        inicio_chamada = None
+        try:
+            # Reaproveita o cliente (e as conexões abertas) desta chave
+            current_client = clientes_gemini.obter(api_key)
             
-            # Se já conseguiu resposta com algum modelo, sai do loop de chaves
-            if 'response' in locals() and response is not None:
-                break
-        
-        # ✅ VERIFICA SE RESPONSE FOI ATRIBUÍDO
-        if response is None:
-            raise HTTPException(status_code=500, detail="Nenhuma chave Gemini funcionou. response não foi atribuído.")
-        
-        # Extrai JSON da resposta
-        json_text = response.text.strip()
+            # ✅ CHAMADA ASSÍNCRONA (não bloqueia o event loop) limitada pelo semáforo
+            async with limitador_extracao.vaga():
+                if largada is not None:
+                    largada.marcar()
+                inicio_chamada = time.perf_counter()
+                response = await current_client.aio.models.generate_content(
+                    model=modelo,
+                    contents=[prompt, imagem_envio],
+                    config=config_resposta
+                )
+                duracao = time.perf_counter() - inicio_chamada
+                clientes_gemini.registrar_chamada(api_key, duracao)
+            
+            tempo_gemini.observar(duracao, chave=rotulo_chave(api_key), modelo=modelo, resultado="sucesso")
+            span.definir("gemini.duracao_ms", round(duracao * 1000))
+            roteador_gemini.registrar_sucesso(api_key, modelo)
+            controle_hedge.registrar_latencia(duracao)
+            log.debug("Resposta do Gemini", extra={"chave": f"...{api_key[-4:]}", "modelo": modelo,
+                                                   "duracao_ms": round(duracao * 1000),
+                                                   "caracteres": len(response.text or '')})
+            
+        except asyncio.CancelledError:
+            roteador_gemini.liberar(api_key, modelo)
+            if inicio_chamada is not None:
+                tempo_gemini.observar(time.perf_counter() - inicio_chamada, chave=rotulo_chave(api_key),
+                                      modelo=modelo, resultado="cancelada")
+            raise
+        except Exception as e:
+            tipo_erro = roteador_gemini.registrar_falha(api_key, modelo, e)
+            falhas_gemini.inc(tipo=tipo_erro, modelo=modelo)
+            span.definir("gemini.erro", tipo_erro)
+            if inicio_chamada is not None:
+                tempo_gemini.observar(time.perf_counter() - inicio_chamada, chave=rotulo_chave(api_key),
+                                      modelo=modelo, resultado=tipo_erro)
+            log.warning("Falha no Gemini: %s (%s)", type(e).__name__, tipo_erro, extra={
+                "chave": f"...{api_key[-4:]}", "modelo": modelo, "erro": str(e)[:200]
+            })
+            raise
         
-        # Remove markdown se presente
-        if json_text.startswith('```json'):
-            json_text = json_text[7:]
-        if json_text.endswith('```'):
-            json_text = json_text[:-3]
-        json_text = json_text.strip()
+        # ✅ VALIDAÇÃO COM SCHEMA (+ reparo barato); resposta inaproveitável
+        # levanta RespostaInvalida e o executor passa para a próxima tentativa
+        inicio_parse = time.perf_counter()
+        try:
+            resultado = interpretar_resposta(response.text, getattr(response, "parsed", None), esquema)
+        except RespostaInvalida as e:
+            tempo_json_parse.observar(time.perf_counter() - inicio_parse, resultado="invalida")
+            span.definir("resposta.parse", "invalida")
+            log.warning("Resposta inválida do modelo: %s", e, extra={"modelo": modelo})
+            raise
+        tempo_json_parse.observar(time.perf_counter() - inicio_parse, resultado="ok")
+        span.definir("resposta.parse", "ok")
+        return resultado
+    
+    # ✅ EXECUÇÃO: sequencial por padrão, com hedge opcional contra tentativas lentas
+    try:
+        resultado = await controle_hedge.executar(tentar, roteador_gemini.candidatos(GEMINI_MAX_TENTATIVAS))
+    except Exception as e:
+        log.error("Nenhum par chave/modelo funcionou: %s - %s", type(e).__name__, e)
+        raise HTTPException(status_code=503, detail=f"Erro na análise: chaves/modelos Gemini indisponíveis. {e}")
+    
+    if cabecalho_completo(dados_nfce):
+        log.debug("NFC-e com data e total do QR code, itens do modelo", extra={"chave_nfce": dados_nfce['chave']})
+        return montar_nota(dados_nfce, resultado)
+    if dados_nfce:
+        return conferir_com_chave(resultado, dados_nfce)
+    return resultado
+
+@rastreador.rastrear()
+async def analisar_nota(origem: Union[bytes, str], imagem_sha256: Optional[str] = None,
+                        user_id: int = USUARIO_PADRAO_ID) -> Dict[str, Any]:
+    """
+    Analisa nota fiscal usando Gemini AI com google-genai.
+    `origem` é o caminho do upload em disco (ou os bytes da foto); o SHA-256
+    já calculado durante a gravação em streaming pode ser repassado.
+    O cache de análises é do usuário: a foto de outro usuário nunca é reaproveitada.
+    """
+    fonte = "desconhecida"
+    try:
+        # ✅ CACHE POR CONTEÚDO: a mesma foto (bytes idênticos) não chama o modelo de novo
+        if imagem_sha256 is None:
+            imagem_sha256 = await asyncio.to_thread(calcular_sha256, origem)
+        nota_data = await asyncio.to_thread(cache_notas.buscar, user_id, imagem_sha256)
+        do_cache = nota_data is not None
+        fonte = "cache"
         
-        print(f"📄 JSON extraído: {json_text[:100]}...")
+        if not do_cache:
+            # ✅ CAMINHO RÁPIDO NFC-e: QR code lido localmente antes do modelo
+            with rastreador.span("ler_nfce"):
+                dados_nfce = await asyncio.to_thread(ler_nfce, origem)
+            if NFCE_SEM_ITENS and cabecalho_completo(dados_nfce):
+                log.info("NFC-e lida pelo QR code, sem chamada ao modelo", extra={"chave_nfce": dados_nfce['chave']})
+                fonte = "qrcode"
+                nota_data = montar_nota(dados_nfce)
+            else:
+                fonte = "modelo"
+                nota_data = await extrair_dados_gemini(origem, dados_nfce)
+            await asyncio.to_thread(cache_notas.salvar, user_id, imagem_sha256, nota_data)
         
-        # Converte para dicionário
-        nota_data = json.loads(json_text)
+        # Hash exato desta imagem (usado para não duplicar a nota no banco)
+        nota_data['imagem_hash'] = imagem_sha256
+        nota_data['cache'] = do_cache
         
         # ✅ PROCESSAR DADOS PARA O BANCO
         # Gerar ID único
@@ -547,16 +610,17 @@ REGRAS OBRIGATÓRIAS:
         # Definir categoria principal (renomear 'categoria' para 'categoria_principal')
         nota_data['categoria_principal'] = nota_data.get('categoria', 'Outros')
         
-        print(f"🎯 Análise concluída: {nota_data.get('mercado', 'N/A')} - R${nota_data.get('total', 0)}")
+        log.info("Análise concluída", extra={"mercado": nota_data.get('mercado'), "total": nota_data.get('total'),
+                                             "itens": len(nota_data.get('itens') or []), "cache": do_cache})
+        analises_notas.inc(origem=fonte, resultado="sucesso")
+        rastreador.atual().definir_atributos({"nota.origem": fonte, "nota.itens": len(nota_data.get('itens') or [])})
         
         return nota_data
         
     except Exception as e:
-        print(f"❌ ERRO DETALHADO NA ANÁLISE: {type(e).__name__}")
-        print(f"❌ Mensagem: {str(e)}")
-        print(f"❌ Args: {e.args}")
-        import traceback
-        print(f"❌ Traceback: {traceback.format_exc()}")
+        analises_notas.inc(origem=fonte, resultado="erro")
+        rastreador.atual().definir("nota.origem", fonte)
+        log.exception("Erro na análise da nota fiscal")
         raise HTTPException(status_code=500, detail=f"Erro na análise da nota fiscal: {str(e)}")
 
 def salvar_historico(nota_data: Dict[str, Any]):
@@ -573,13 +637,13 @@ def salvar_historico(nota_data: Dict[str, Any]):
                     historico = json.load(f)
                     # Se não for dicionário (ex: lista antiga), força reset
                     if not isinstance(historico, dict):
-                        print("Arquivo JSON não é dicionário, resetando estrutura")
+                        log.warning("Histórico não é um dicionário, resetando estrutura")
                         historico = DEFAULT_DASHBOARD_DATA.copy()
                         historico['feed'] = []  # Garante lista limpa
                     
                     # Se faltar chaves essenciais, cria elas
                     if 'feed' not in historico:
-                        print("Chave 'feed' não encontrada, criando lista vazia")
+                        log.warning("Histórico sem a chave 'feed', criando lista vazia")
                         historico['feed'] = []
                     if 'totalGasto' not in historico:
                         historico['totalGasto'] = 0.0
@@ -587,8 +651,7 @@ def salvar_historico(nota_data: Dict[str, Any]):
                         historico['comprasMes'] = 0
                         
                 except Exception as json_error:
-                    print(f"JSON corrompido ou inválido: {json_error}")
-                    print("Criando nova estrutura limpa")
+                    log.warning("Histórico corrompido, criando nova estrutura: %s", json_error)
                     # Se o JSON estiver corrompido, inicia um novo
                     historico = DEFAULT_DASHBOARD_DATA.copy()
                     historico['feed'] = []
@@ -660,17 +723,15 @@ def salvar_historico(nota_data: Dict[str, Any]):
             {"name": "Outros", "value": categorias_valores['outros'], "color": "#6b7280"}
         ]
         
-        print(f"Gráfico atualizado: Alimentos R${categorias_valores['alimentos']:.2f}, Bebidas R${categorias_valores['bebidas']:.2f}, Limpeza R${categorias_valores['limpeza']:.2f}, Farmácia R${categorias_valores['farmácia']:.2f}, Combustível R${categorias_valores['combustível']:.2f}, Restaurante R${categorias_valores['restaurante']:.2f}, Lazer R${categorias_valores['lazer']:.2f}, Serviços R${categorias_valores['serviços']:.2f}, Outros R${categorias_valores['outros']:.2f}")
-        
         # Salva arquivo atualizado
         os.makedirs(os.path.dirname(data_path), exist_ok=True)
         with open(data_path, 'w', encoding='utf-8') as f:
             json.dump(historico, f, ensure_ascii=False, indent=2)
         
-        print(f"Histórico atualizado: {len(historico['feed'])} compras")
+        log.debug("Histórico atualizado", extra={"compras": len(historico['feed']), "categorias": categorias_valores})
         
     except Exception as e:
-        print(f"Erro ao salvar histórico: {e}")
+        log.exception("Erro ao salvar histórico")
         raise HTTPException(status_code=500, detail=f"Erro ao salvar histórico: {str(e)}")
 
 @app.get("/")
@@ -679,123 +740,241 @@ async def root():
     return {"message": "SmartSpend-BR API está rodando!", "status": "active"}
 
 @app.get("/dashboard")
-async def get_dashboard(db: Session = Depends(get_db)):
+async def get_dashboard(
+    request: Request,
+    limite: Optional[int] = Query(None, ge=1, le=LIMITE_MAXIMO,
+                                  description="Retorna só as N compras mais recentes (+ proximoCursor)"),
+    completo: bool = Query(False, description="Legado: repete as compras em 'feed'"),
+    data_inicio: Optional[date] = Query(None, alias="from", description="Data inicial (YYYY-MM-DD, inclusiva)"),
+    data_fim: Optional[date] = Query(None, alias="to", description="Data final (YYYY-MM-DD, inclusiva)"),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
-    Retorna dados do dashboard calculados em tempo real do banco
+    Retorna dados do dashboard calculados do banco. A resposta fica em cache
+    até o próximo upload/exclusão do usuário (ETag + If-None-Match -> 304).
+    Sem `limite` traz o histórico inteiro (o frontend atual depende disso);
+    com `limite`, só as compras mais recentes + proximoCursor para o
+    GET /compras. ?completo=true repete a lista em "feed" (formato antigo).
     """
+    validar_periodo(data_inicio, data_fim)
+    
+    # ✅ CACHE: a versão é lida antes das consultas, então uma nota gravada
+    # durante o cálculo já invalida a resposta que está sendo montada
+    versao = await cache_dashboard.versao(db, USUARIO_PADRAO_ID)
+    if versao is not None:
+        # O mês corrente entra na chave por causa de "comprasMes"
+        chave_cache = cache_dashboard.chave(USUARIO_PADRAO_ID, versao, date.today().strftime('%Y-%m'),
+                                            limite, completo, data_inicio, data_fim)
+        nao_modificado = cache_dashboard.nao_modificado(request, chave_cache)
+        if nao_modificado is not None:
+            respostas_dashboard.inc(origem="304")
+            return nao_modificado
+        entrada = await cache_dashboard.buscar(chave_cache)
+        if entrada is not None:
+            respostas_dashboard.inc(origem="HIT")
+            return cache_dashboard.responder(request, entrada, "HIT")
+    
+    inicio_calculo = time.perf_counter()
     try:
         # Obter usuário padrão
-        user = get_or_create_default_user(db)
+        user = await get_or_create_default_user(db)
         
-        # Buscar notas do usuário
-        notas = db.query(Nota).filter(Nota.user_id == user.id).all()
+        # Buscar notas do usuário (mais recentes primeiro): tudo, ou só a primeira página com `limite`
+        proximo_cursor = None
+        if not limite:
+            notas = list(await db.scalars(filtrar_periodo(
+                select(Nota).where(Nota.user_id == user.id), data_inicio, data_fim
+            ).order_by(Nota.data_compra.desc(), Nota.id.desc())))
+        else:
+            notas, proximo_cursor = await buscar_pagina(db, user.id, limite, inicio=data_inicio, fim=data_fim)
         
-        # ✅ LOG: Mostrar IDs do banco vs dashboard
-        print(f"📊 Dashboard: {len(notas)} notas do banco")
-        print(f"📋 IDs no banco: {[nota.id for nota in notas]}")
+        # Totais: agregados mensais para o histórico todo, somas no banco para um período
+        if data_inicio or data_fim:
+            resumo = await resumo_periodo(db, user.id, data_inicio, data_fim)
+        else:
+            resumo = await resumo_dashboard(db, user.id)
+        resumo["compras_mes"] = await contar_compras_mes(db, user.id)
         
         # Calcular dados do dashboard
-        dashboard_data = calcular_dashboard_data(notas)
-        
-        # ✅ LOG: Mostrar IDs no dashboard resultante
-        compras_ids = [c.get('id') for c in dashboard_data.get('compras', [])]
-        feed_ids = [f.get('id') for f in dashboard_data.get('feed', [])]
-        print(f"📋 IDs no compras: {compras_ids}")
-        print(f"📋 IDs no feed: {feed_ids}")
+        dashboard_data = calcular_dashboard_data(
+            notas, resumo, await carregar_itens(db, [nota.id for nota in notas]), proximo_cursor, legado=completo
+        )
+        log.debug("Dashboard recalculado", extra={"notas": len(notas)})
         
-        return JSONResponse(content=dashboard_data)
+        if versao is None:
+            resposta = RespostaJSON(content=dashboard_data)
+            respostas_dashboard.inc(origem="SEM_CACHE")
+        else:
+            entrada = await cache_dashboard.guardar(chave_cache, dumps(dashboard_data))
+            resposta = cache_dashboard.responder(request, entrada, "MISS")
+            respostas_dashboard.inc(origem="MISS")
+        tempo_dashboard.observar(time.perf_counter() - inicio_calculo)
+        return resposta
         
-    except Exception as e:
-        print(f"Erro ao buscar dashboard: {e}")
+    except Exception:
+        log.exception("Erro ao buscar dashboard")
         raise HTTPException(status_code=500, detail="Erro ao carregar dados do dashboard")
 
-async def salvar_nota_no_banco(db: Session, nota_analisada: Dict[str, Any]):
+async def adicionar_nota(db: AsyncSession, user: User, nota_analisada: Dict[str, Any],
+                         hashes_lote: Optional[Dict[str, str]] = None) -> Optional[Nota]:
     """
-    Salva nota analisada no banco de dados SQLite
+    Adiciona nota + itens + agregados à transação corrente, sem commit.
+    Retorna None se a mesma foto (ou a mesma NFC-e, pela chave de acesso)
+    já virou nota (no banco ou no próprio lote).
+    """
+    # ✅ DEDUPLICAÇÃO: a mesma foto/NFC-e já virou nota para este usuário
+    imagem_hash = nota_analisada.get('imagem_hash')
+    chave_acesso = (nota_analisada.get('nfce') or {}).get('chave')
+    identificadores = [i for i in (imagem_hash, chave_acesso) if i]
+    if identificadores:
+        existente_id = next((hashes_lote[i] for i in identificadores if i in (hashes_lote or {})), None)
+        if not existente_id:
+            filtros = []
+            if imagem_hash:
+                filtros.append(Nota.imagem_hash == imagem_hash)
+            if chave_acesso:
+                filtros.append(Nota.chave_acesso == chave_acesso)
+            existente_id = await db.scalar(select(Nota.id).where(
+                Nota.user_id == user.id, or_(*filtros)
+            ).limit(1))
+        if existente_id:
+            nota_analisada['id'] = existente_id
+            nota_analisada['duplicada'] = True
+            log.info("Nota duplicada ignorada", extra={"nota_id": existente_id})
+            return None
+    
+    # Criar nova nota
+    data_texto = nota_analisada.get('data_formatada', datetime.now().strftime('%d/%m/%Y'))
+    nova_nota = Nota(
+        id=nota_analisada.get('id', str(uuid.uuid4())),
+        user_id=user.id,
+        mercado=nota_analisada.get('mercado', 'Mercado não informado'),
+        data=data_texto,
+        data_compra=converter_data(data_texto) or date.today(),
+        total=nota_analisada.get('total', 0.0),
+        categoria=nota_analisada.get('categoria_principal', 'Outros'),
+        imagem_hash=imagem_hash,
+        imagem_chave=nota_analisada.get('imagem_chave'),
+        chave_acesso=chave_acesso
+    )
+    
+    # Nota + itens + agregados do dashboard na mesma transação
+    db.add(nova_nota)
+    criar_itens(db, nova_nota.id, nota_analisada.get('itens', []))
+    await aplicar_nota(db, user.id, nova_nota.data_compra, nova_nota.categoria, nova_nota.total,
+                       nota_analisada.get('itens', []))
+    if hashes_lote is not None:
+        for identificador in identificadores:
+            hashes_lote[identificador] = nova_nota.id
+    return nova_nota
+
+@rastreador.rastrear()
+async def salvar_nota_no_banco(db: AsyncSession, nota_analisada: Dict[str, Any]):
+    """
+    Salva nota analisada no banco de dados
     """
     try:
         # Obter usuário padrão
-        user = get_or_create_default_user(db)
-        
-        # ✅ CORREÇÃO: Serializa itens para JSON
-        itens_json = json.dumps(nota_analisada.get('itens', []), ensure_ascii=False)
-        
-        # Criar nova nota
-        nova_nota = Nota(
-            id=nota_analisada.get('id', str(uuid.uuid4())),
-            user_id=user.id,
-            mercado=nota_analisada.get('mercado', 'Mercado não informado'),
-            data=nota_analisada.get('data_formatada', datetime.now().strftime('%d/%m/%Y')),
-            total=nota_analisada.get('total', 0.0),
-            categoria=nota_analisada.get('categoria_principal', 'Outros'),
-            itens=itens_json  # ✅ SALVA COMO STRING JSON
-        )
+        user = await get_or_create_default_user(db)
         
-        # Salvar no banco
-        db.add(nova_nota)
-        db.commit()
-        db.refresh(nova_nota)
+        nova_nota = await adicionar_nota(db, user, nota_analisada)
+        if nova_nota is None:
+            return
+        await cache_dashboard.invalidar(db, user.id)
+        with tempo_db_commit.medir(operacao="nota"), rastreador.span("db.commit"):
+            await db.commit()
         
-        print(f"✅ Nota salva no banco: ID={nova_nota.id}, Mercado={nova_nota.mercado}, Total={nova_nota.total}")
+        log.info("Nota salva no banco", extra={"nota_id": nova_nota.id, "mercado": nova_nota.mercado,
+                                               "total": nova_nota.total})
         
-    except Exception as e:
-        print(f"❌ Erro ao salvar nota no banco: {e}")
-        db.rollback()
+    except Exception:
+        log.exception("Erro ao salvar nota no banco")
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Erro ao salvar nota no banco")
 
+async def processar_job(job_id: str, arquivo: str) -> Dict[str, Any]:
+    """
+    Pipeline executado pelos workers da fila: análise + persistência
+    """
+    await atualizar_job(job_id, etapa="analisando")
+    if os.path.isabs(arquivo):
+        # Job criado antes do armazenamento: caminho direto em uploads/
+        nota_analisada = await analisar_nota(arquivo)
+    else:
+        # No processo que recebeu o upload, o arquivo ainda está em disco (sem download do S3)
+        async with armazenamento.arquivo_local(arquivo) as caminho:
+            nota_analisada = await analisar_nota(caminho)
+        nota_analisada['imagem_chave'] = arquivo
+    
+    # O ID da nota é o ID do job: se o processo cair depois do commit,
+    # o reprocessamento não duplica a nota
+    nota_analisada['id'] = job_id
+    
+    await atualizar_job(job_id, etapa="salvando")
+    async with AsyncSessionLocal() as db:
+        if not await db.get(Nota, job_id):
+            await salvar_nota_no_banco(db, nota_analisada)
+    
+    return nota_analisada
+
 @app.post("/upload")
-async def upload_nota_fiscal(file: UploadFile = File(...), db: Session = Depends(get_db)):
+async def upload_nota_fiscal(
+    file: UploadFile = File(...),
+    modo: str = Query("sync", description="'sync' analisa na hora; 'job' enfileira e retorna o ID do job"),
+    db: AsyncSession = Depends(get_async_db)
+):
     """
     Recebe upload de imagem de nota fiscal, analisa com Gemini e salva no banco
     """
     try:
-        print("📥 RECEBENDO REQUISIÇÃO DE UPLOAD...")
-        print(f"📁 Arquivo: {file.filename}")
-        print(f"📄 Tipo: {file.content_type}")
-        print(f"📏 Tamanho: {file.size if hasattr(file, 'size') else 'desconhecido'} bytes")
+        log.debug("Upload recebido", extra={"arquivo": file.filename, "tipo": file.content_type, "modo": modo})
         
         # Verifica se o arquivo é uma imagem
-        if not file.content_type.startswith('image/'):
+        if not (file.content_type or "").startswith('image/'):
             raise HTTPException(status_code=400, detail="Apenas arquivos de imagem são permitidos")
         
-        # Lê o conteúdo do arquivo
-        image_bytes = await file.read()
-        
-        if len(image_bytes) == 0:
-            raise HTTPException(status_code=400, detail="Arquivo vazio")
-        
-        # Gera nome único para o arquivo
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"nota_{timestamp}_{file.filename}"
+        # ✅ STREAMING: grava em uploads/ em blocos, com limite de tamanho e
+        # conferência dos magic bytes; a foto não fica inteira na memória
+        with rastreador.span("gravar_upload"):
+            gravado = await gravar_upload(file)
+        filename = gravado.nome_arquivo
         
-        # Diretório de uploads
-        uploads_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads')
-        os.makedirs(uploads_dir, exist_ok=True)
+        # ✅ ARMAZENAMENTO: endereço pelo conteúdo + miniatura (local ou S3)
+        with rastreador.span("armazenamento.guardar"):
+            chave = await asyncio.to_thread(armazenamento.guardar, gravado.caminho, gravado.sha256, gravado.mime,
+                                            manter_local=True)
         
-        # Caminho completo do arquivo
-        file_path = os.path.join(uploads_dir, filename)
+        log.info("Arquivo salvo", extra={"imagem_chave": chave, "bytes": gravado.tamanho, "mime": gravado.mime})
         
-        # Salva o arquivo localmente
-        with open(file_path, "wb") as buffer:
-            buffer.write(image_bytes)
-        
-        print(f"Arquivo salvo: {file_path}")
-        print(f"Tamanho: {len(image_bytes)} bytes")
+        # ✅ MODO JOB: responde imediatamente e processa em background
+        if modo == "job":
+            job_id = await criar_job(chave, gravado.mime)
+            # O job continua o trace desta requisição no worker
+            fila_jobs.enfileirar(job_id, rastreador.atual().traceparent)
+            log.info("Job enfileirado", extra={"job_id": job_id, "fila": fila_jobs.tamanho()})
+            return JSONResponse(status_code=202, content={
+                "message": "Nota fiscal recebida, análise em andamento",
+                "job_id": job_id,
+                "status": "pendente",
+                "status_url": f"/jobs/{job_id}",
+                "stream_url": f"/jobs/{job_id}/stream",
+                "filename": filename
+            })
         
         # Analisa a nota com Gemini
-        print("Iniciando análise com Gemini...")
-        nota_analisada = await analisar_nota(image_bytes)
+        async with armazenamento.arquivo_local(chave) as caminho:
+            nota_analisada = await analisar_nota(caminho, gravado.sha256)
+        nota_analisada['imagem_chave'] = chave
         
         # Salva no banco de dados
-        print("Salvando no banco de dados...")
         await salvar_nota_no_banco(db, nota_analisada)
         
         # Retorna resposta completa com dados analisados
         return {
             "message": "Nota fiscal analisada e salva com sucesso!",
             "filename": filename,
-            "size": len(image_bytes),
-            "content_type": file.content_type,
+            "size": gravado.tamanho,
+            "content_type": gravado.mime,
             "upload_time": datetime.now().isoformat(),
             "analise": nota_analisada
         }
@@ -803,27 +982,232 @@ async def upload_nota_fiscal(file: UploadFile = File(...), db: Session = Depends
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Erro no upload: {e}")
+        log.exception("Erro no upload")
         raise HTTPException(status_code=500, detail=f"Erro ao processar upload: {str(e)}")
 
+@app.post("/upload/batch")
+async def upload_lote(
+    files: List[UploadFile] = File(..., description="Fotos de notas e/ou arquivos ZIP com as fotos"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Importa várias notas de uma vez: análises em paralelo (limitadas por
+    UPLOAD_LOTE_PARALELISMO e pelo limitador global do Gemini) e gravação
+    de todas as notas em uma única transação. Retorna o resultado por arquivo.
+    """
+    inicio = time.perf_counter()
+    
+    # Grava cada foto (e cada imagem dos ZIPs) em uploads/ em streaming:
+    # (nome, arquivo gravado, erro)
+    # Os limites do lote são checados antes de gravar cada arquivo (nos ZIPs,
+    # pelo índice, antes de descompactar)
+    entradas = []
+    try:
+        for indice, file in enumerate(files):
+            prefixo = f"nota_lote{indice:03d}"
+            recebido = sum(gravado.tamanho for _, gravado, _ in entradas if gravado is not None)
+            if eh_zip(file.filename, file.content_type):
+                entradas.extend(await asyncio.to_thread(expandir_zip, file.file, prefixo, len(entradas), recebido))
+            elif not (file.content_type or "").startswith('image/'):
+                entradas.append((file.filename, None, "Apenas arquivos de imagem são permitidos"))
+            else:
+                verificar_limites_lote(len(entradas) + 1, recebido + (file.size or 0))
+                try:
+                    entradas.append((file.filename, await gravar_upload(file, prefixo), None))
+                except HTTPException as e:
+                    entradas.append((file.filename, None, e.detail))
+        
+        if not entradas:
+            raise HTTPException(status_code=400, detail="Nenhuma imagem encontrada no lote")
+    except BaseException:
+        remover_gravados(entradas)
+        raise
+    
+    log.info("Lote recebido", extra={"imagens": len(entradas), "paralelismo": UPLOAD_LOTE_PARALELISMO})
+    semaforo = asyncio.Semaphore(UPLOAD_LOTE_PARALELISMO)
+    
+    @rastreador.rastrear()
+    async def analisar_entrada(nome: str, gravado: Optional[UploadGravado], erro: Optional[str]):
+        rastreador.atual().definir("arquivo", nome)
+        resultado = {"arquivo": nome}
+        if gravado is None:
+            return {**resultado, "status": "erro", "erro": erro}, None
+        async with semaforo:
+            try:
+                chave = await asyncio.to_thread(armazenamento.guardar, gravado.caminho, gravado.sha256, gravado.mime,
+                                                manter_local=True)
+                async with armazenamento.arquivo_local(chave) as caminho:
+                    nota = await analisar_nota(caminho, gravado.sha256)
+                nota['imagem_chave'] = chave
+                return resultado, nota
+            except HTTPException as e:
+                return {**resultado, "status": "erro", "erro": e.detail}, None
+            except Exception as e:
+                return {**resultado, "status": "erro", "erro": str(e)}, None
+    
+    analises = await asyncio.gather(*[
+        analisar_entrada(nome, gravado, erro)
+        for nome, gravado, erro in entradas
+    ])
+    
+    # ✅ GRAVAÇÃO EM UMA ÚNICA TRANSAÇÃO
+    resultados = [resultado for resultado, _ in analises]
+    analisadas = [(resultado, nota) for resultado, nota in analises if nota is not None]
+    if analisadas:
+        try:
+            user = await get_or_create_default_user(db)
+            hashes_lote = {}
+            for resultado, nota in analisadas:
+                nova_nota = await adicionar_nota(db, user, nota, hashes_lote)
+                resultado.update(status="duplicada" if nova_nota is None else "salva",
+                                 id=nota['id'], analise=nota)
+            await cache_dashboard.invalidar(db, user.id)
+            with tempo_db_commit.medir(operacao="lote"), rastreador.span("db.commit"):
+                await db.commit()
+        except Exception:
+            log.exception("Erro ao gravar lote")
+            await db.rollback()
+            for resultado, _ in analisadas:
+                resultado.update(status="erro", erro="Erro ao salvar nota no banco")
+                resultado.pop("analise", None)
+                resultado.pop("id", None)
+    
+    contagem = {status: sum(1 for r in resultados if r["status"] == status)
+                for status in ("salva", "duplicada", "erro")}
+    duracao_ms = round((time.perf_counter() - inicio) * 1000)
+    log.info("Lote concluído", extra={"duracao_ms": duracao_ms, **contagem})
+    
+    return {
+        "total": len(resultados),
+        "salvas": contagem["salva"],
+        "duplicadas": contagem["duplicada"],
+        "erros": contagem["erro"],
+        "tempo_ms": duracao_ms,
+        "resultados": resultados
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """
+    Consulta o status de um job de análise
+    """
+    job = await buscar_job(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    return job
+
+@app.get("/jobs/{job_id}/stream")
+async def stream_job(job_id: str):
+    """
+    Acompanha o progresso do job via Server-Sent Events
+    """
+    if not await buscar_job(job_id):
+        raise HTTPException(status_code=404, detail="Job não encontrado")
+    
+    async def eventos():
+        ultimo_estado = None
+        while True:
+            job = await buscar_job(job_id)
+            estado = (job["status"], job["etapa"])
+            if estado != ultimo_estado:
+                ultimo_estado = estado
+                yield f"event: progresso\ndata: {dumps_texto(job)}\n\n"
+            if job["status"] in STATUS_FINAIS:
+                break
+            await asyncio.sleep(0.5)
+    
+    return StreamingResponse(eventos(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/compras")
+async def listar_compras(
+    cursor: Optional[str] = None,
+    limit: int = Query(LIMITE_PADRAO, ge=1, le=LIMITE_MAXIMO),
+    include_items: bool = True,
+    data_inicio: Optional[date] = Query(None, alias="from", description="Data inicial (YYYY-MM-DD, inclusiva)"),
+    data_fim: Optional[date] = Query(None, alias="to", description="Data final (YYYY-MM-DD, inclusiva)"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Feed de compras paginado por cursor (da mais recente para a mais antiga)
+    """
+    validar_periodo(data_inicio, data_fim)
+    user = await get_or_create_default_user(db)
+    notas, proximo_cursor = await buscar_pagina(db, user.id, limit, cursor, data_inicio, data_fim)
+    itens_por_nota = await carregar_itens(db, [nota.id for nota in notas]) if include_items else {}
+    return {
+        "compras": [
+            nota_para_compra(nota, itens_por_nota.get(nota.id, []) if include_items else None)
+            for nota in notas
+        ],
+        "proximo_cursor": proximo_cursor,
+        "limit": limit
+    }
+
 @app.delete("/compras/{compra_id}")
-async def delete_compra(compra_id: str, db: Session = Depends(get_db)):
+async def delete_compra(compra_id: str, db: AsyncSession = Depends(get_async_db)):
     """
-    Exclui uma compra do banco de dados SQLite pelo ID
+    Exclui uma compra do banco de dados pelo ID
     """
-    # Buscar nota no banco SQLite
-    nota = db.query(Nota).filter(Nota.id == compra_id).first()
+    # Buscar nota no banco
+    nota = await db.get(Nota, compra_id)
 
     if not nota:
         raise HTTPException(status_code=404, detail="Nota não encontrada")
 
-    db.delete(nota)
-    db.commit()
+    # Remove a nota e seus itens e desconta dos agregados na mesma transação
+    itens_removidos = await excluir_itens(db, nota.id)
+    await aplicar_nota(db, nota.user_id, nota.data_compra, nota.categoria, nota.total,
+                       itens_removidos, sinal=-1)
+    await cache_dashboard.invalidar(db, nota.user_id)
+    await db.delete(nota)
+    with tempo_db_commit.medir(operacao="exclusao"), rastreador.span("db.commit"):
+        await db.commit()
 
-    print(f"✅ Nota {compra_id} deletada com sucesso!")
+    log.info("Nota excluída", extra={"nota_id": compra_id})
 
     return {"success": True}
 
+@app.get("/compras/{compra_id}/imagem")
+async def imagem_compra(
+    compra_id: str,
+    request: Request,
+    tamanho: str = Query("miniatura", pattern="^(miniatura|original)$"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Foto da nota (miniatura por padrão). O endereço é pelo conteúdo, então a
+    resposta é cacheável pelo navegador/CDN (ETag = SHA-256 da foto).
+    """
+    nota = await db.get(Nota, compra_id)
+    if not nota or not nota.imagem_chave:
+        raise HTTPException(status_code=404, detail="Imagem não encontrada")
+    
+    # A miniatura nunca muda; o original pode ser trocado pela versão compactada (retenção)
+    etag = f'"{sha_da_chave(nota.imagem_chave)}-{tamanho}"'
+    cache = "public, max-age=31536000, immutable" if tamanho == "miniatura" else "public, max-age=86400"
+    cabecalhos = {"ETag": etag, "Cache-Control": cache}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=cabecalhos)
+    
+    imagem = await asyncio.to_thread(armazenamento.ler_imagem, nota.imagem_chave, tamanho == "miniatura")
+    if imagem is None:
+        raise HTTPException(status_code=404, detail="Imagem não encontrada")
+    dados, mime = imagem
+    return Response(content=dados, media_type=mime, headers=cabecalhos)
+
+@app.get("/gemini/status")
+async def gemini_status():
+    """
+    Estado do roteador: circuitos das chaves e dos modelos
+    """
+    return {**roteador_gemini.estado(), "hedging": controle_hedge.estatisticas()}
+
+@app.get("/metrics")
+async def metrics():
+    """Métricas no formato texto do Prometheus (raspadas por um Prometheus local)"""
+    return Response(content=metricas.exportar(), media_type=TIPO_CONTEUDO)
+
 @app.get("/health")
 async def health_check():
     """Endpoint detalhado de saúde da API"""
@@ -831,9 +1215,25 @@ async def health_check():
         "status": "healthy",
         "timestamp": datetime.now().isoformat(),
         "version": "1.0.0",
+        "extracao": {**limitador_extracao.estatisticas(), "respostas": estatisticas_respostas,
+                     "categorizador": categorizador.estatisticas()},
+        "fila_jobs": fila_jobs.tamanho(),
+        "cache": cache_notas.estatisticas(),
+        "clientes_gemini": clientes_gemini.estatisticas(),
+        "banco": {**estatisticas_engine(engine), "pool_async": async_engine.pool.status()},
+        "armazenamento": armazenamento.estatisticas(),
+        "cache_dashboard": cache_dashboard.estatisticas(),
+        "serializacao": estatisticas_serializacao(),
+        "rastreamento": rastreador.estatisticas(),
         "endpoints": {
             "dashboard": "/dashboard",
+            "compras": "/compras",
             "upload": "/upload",
+            "upload_lote": "/upload/batch",
+            "imagem": "/compras/{compra_id}/imagem",
+            "jobs": "/jobs/{job_id}",
+            "gemini": "/gemini/status",
+            "metrics": "/metrics",
             "health": "/health"
         }
     }
@@ -6,6 +6,8 @@ from google import genai
 from google.genai import types
 import PIL.Image
 
+from categorizador import categorizar_produto
+
 # Configuração da API
 load_dotenv()
 CHAVE_API = os.getenv("GEMINI_API_KEY")
@@ -17,28 +19,6 @@ if not CHAVE_API:
 # Inicializa o cliente Gemini
 client = genai.Client(api_key=CHAVE_API)
 
-# Categorias para classificação automática
-CATEGORIAS = {
-    "limpeza": ["sabao", "detergente", "amaciante", "desinfetante", "limpa", "cera", "esponja", "pano", "alvejante"],
-    "bebidas": ["suco", "refrigerante", "agua", "cerveja", "vinho", "cafe", "cha", "leite", "achocolatado"],
-    "alimentos": ["arroz", "feijao", "macarrao", "oleo", "sal", "acucar", "farinha", "pao", "bolo"],
-    "higiene": ["sabonete", "shampoo", "condicionador", "creme", "pasta", "escova", "papel", "absorvente", "fralda"],
-    "hortifruti": ["alface", "tomate", "batata", "cebola", "alho", "cenoura", "banana", "maca", "laranja"],
-    "carnes": ["carne", "frango", "peixe", "linguica", "salsicha", "bacon", "presunto", "mortadela"],
-    "frios": ["queijo", "requeijao", "iogurte", "manteiga", "margarina", "cream cheese"],
-}
-
-def categorizar_produto(nome_produto):
-    """Classifica o produto em uma categoria baseado no nome"""
-    nome_lower = nome_produto.lower()
-    
-    for categoria, palavras_chave in CATEGORIAS.items():
-        for palavra in palavras_chave:
-            if palavra in nome_lower:
-                return categoria
-    
-    return "outros"
-
 def analisar_nota(caminho_imagem="uploads/nota.jpg"):
     """Analisa uma nota fiscal e extrai os dados estruturados"""
     
@@ -193,7 +173,7 @@ def exibir_resumo_categorias(dados_nota):
     categorias_total = {}
     
     for item in dados_nota.get("itens", []):
-        categoria = item.get("categoria", "outros")
+        categoria = item.get("categoria", "Outros")
         preco = item.get("preco_total", 0)
         
         if categoria not in categorias_total:
@@ -0,0 +1,372 @@
+"""
+Armazenamento das imagens das notas.
+Cada foto é guardada pelo SHA-256 do conteúdo (a mesma foto nunca ocupa
+espaço duas vezes e a URL dela nunca muda), junto com uma miniatura para
+a interface. Originais antigos podem ser compactados ou removidos após
+ARMAZENAMENTO_RETENCAO_DIAS. Backends: pasta local (padrão) ou bucket
+S3-compatível (AWS, MinIO, R2...) com boto3.
+
+    originais/ab/abcdef...jpg   foto enviada
+    miniaturas/ab/abcdef...webp miniatura
+    compactas/ab/abcdef...jpg   original após a compactação
+"""
+import asyncio
+import io
+import os
+import shutil
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+try:
+    import boto3
+except ImportError:  # backend S3 é opcional
+    boto3 = None
+
+from metricas import tempo_gravacao_imagem
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+# ✅ CONFIGURAÇÃO DO ARMAZENAMENTO
+ARMAZENAMENTO_BACKEND = os.getenv("ARMAZENAMENTO_BACKEND", "local").lower()  # local | s3
+ARMAZENAMENTO_PASTA = os.getenv(
+    "ARMAZENAMENTO_PASTA",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
+)
+ARMAZENAMENTO_S3_BUCKET = os.getenv("ARMAZENAMENTO_S3_BUCKET", "")
+ARMAZENAMENTO_S3_PREFIXO = os.getenv("ARMAZENAMENTO_S3_PREFIXO", "notas/")
+ARMAZENAMENTO_S3_ENDPOINT = os.getenv("ARMAZENAMENTO_S3_ENDPOINT") or None  # ex: http://minio:9000
+
+MINIATURA_LADO = int(os.getenv("MINIATURA_LADO", "320"))
+MINIATURA_QUALIDADE = int(os.getenv("MINIATURA_QUALIDADE", "70"))
+
+# Retenção dos originais: 0 desliga; modo "compactar" (reduz e recodifica) ou "remover"
+ARMAZENAMENTO_RETENCAO_DIAS = int(os.getenv("ARMAZENAMENTO_RETENCAO_DIAS", "0"))
+ARMAZENAMENTO_RETENCAO_MODO = os.getenv("ARMAZENAMENTO_RETENCAO_MODO", "compactar").lower()
+COMPACTA_LADO = int(os.getenv("COMPACTA_LADO", "1600"))
+COMPACTA_QUALIDADE = int(os.getenv("COMPACTA_QUALIDADE", "70"))
+ARMAZENAMENTO_MANUTENCAO_HORAS = float(os.getenv("ARMAZENAMENTO_MANUTENCAO_HORAS", "24"))
+
+EXTENSOES_MIME = {
+    "image/jpeg": ".jpg", "image/png": ".png", "image/webp": ".webp",
+    "image/gif": ".gif", "image/bmp": ".bmp", "image/tiff": ".tif",
+}
+MIME_EXTENSOES = {extensao: mime for mime, extensao in EXTENSOES_MIME.items()}
+
+
+def chave_original(sha256: str, mime: str) -> str:
+    return f"originais/{sha256[:2]}/{sha256}{EXTENSOES_MIME.get(mime, '.jpg')}"
+
+
+def chave_miniatura(sha256: str) -> str:
+    return f"miniaturas/{sha256[:2]}/{sha256}.webp"
+
+
+def chave_compacta(sha256: str) -> str:
+    return f"compactas/{sha256[:2]}/{sha256}.jpg"
+
+
+def sha_da_chave(chave: str) -> str:
+    return os.path.splitext(os.path.basename(chave))[0]
+
+
+def mime_da_chave(chave: str) -> str:
+    return MIME_EXTENSOES.get(os.path.splitext(chave)[1], "image/jpeg")
+
+
+class ArmazenamentoLocal:
+    """Objetos como arquivos sob uma pasta (uploads/ por padrão)"""
+
+    nome = "local"
+
+    def __init__(self, pasta: str = ARMAZENAMENTO_PASTA):
+        self.pasta = pasta
+
+    def caminho(self, chave: str) -> str:
+        return os.path.join(self.pasta, *chave.split("/"))
+
+    def gravar_arquivo(self, chave: str, origem: str, mover: bool = False):
+        destino = self.caminho(chave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        if mover:
+            os.replace(origem, destino)
+        else:
+            shutil.copyfile(origem, destino)
+
+    def gravar_bytes(self, chave: str, dados: bytes):
+        destino = self.caminho(chave)
+        os.makedirs(os.path.dirname(destino), exist_ok=True)
+        temporario = f"{destino}.{os.getpid()}.tmp"
+        with open(temporario, "wb") as f:
+            f.write(dados)
+        os.replace(temporario, destino)
+
+    def existe(self, chave: str) -> bool:
+        return os.path.exists(self.caminho(chave))
+
+    def ler(self, chave: str) -> Optional[bytes]:
+        try:
+            with open(self.caminho(chave), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def baixar(self, chave: str) -> Tuple[Optional[str], bool]:
+        """(caminho local, é temporário?) — aqui o próprio arquivo"""
+        caminho = self.caminho(chave)
+        return (caminho if os.path.exists(caminho) else None), False
+
+    def remover(self, chave: str):
+        try:
+            os.remove(self.caminho(chave))
+        except FileNotFoundError:
+            pass
+
+    def listar(self, prefixo: str) -> Iterator[Tuple[str, datetime]]:
+        """(chave, data de modificação) dos objetos sob o prefixo"""
+        raiz = self.caminho(prefixo)
+        for pasta, _, arquivos in os.walk(raiz):
+            for arquivo in arquivos:
+                if arquivo.endswith(".tmp"):
+                    continue
+                caminho = os.path.join(pasta, arquivo)
+                chave = os.path.relpath(caminho, self.pasta).replace(os.sep, "/")
+                yield chave, datetime.fromtimestamp(os.path.getmtime(caminho))
+
+
+class ArmazenamentoS3:
+    """Objetos num bucket S3-compatível (endpoint configurável para MinIO/R2)"""
+
+    nome = "s3"
+
+    def __init__(self, bucket: str = ARMAZENAMENTO_S3_BUCKET, prefixo: str = ARMAZENAMENTO_S3_PREFIXO,
+                 endpoint_url: Optional[str] = ARMAZENAMENTO_S3_ENDPOINT):
+        if boto3 is None:
+            raise RuntimeError("❌ ARMAZENAMENTO_BACKEND=s3 requer o pacote boto3 (pip install boto3)")
+        if not bucket:
+            raise RuntimeError("❌ ARMAZENAMENTO_BACKEND=s3 requer ARMAZENAMENTO_S3_BUCKET")
+        self.bucket = bucket
+        self.prefixo = prefixo
+        # Credenciais e região pelas variáveis padrão da AWS (AWS_ACCESS_KEY_ID...)
+        self.cliente = boto3.client("s3", endpoint_url=endpoint_url)
+
+    def _chave(self, chave: str) -> str:
+        return f"{self.prefixo}{chave}"
+
+    def gravar_arquivo(self, chave: str, origem: str, mover: bool = False):
+        self.cliente.upload_file(origem, self.bucket, self._chave(chave),
+                                 ExtraArgs={"ContentType": mime_da_chave(chave)})
+        if mover:
+            os.remove(origem)
+
+    def gravar_bytes(self, chave: str, dados: bytes):
+        self.cliente.put_object(Bucket=self.bucket, Key=self._chave(chave), Body=dados,
+                                ContentType=mime_da_chave(chave))
+
+    def existe(self, chave: str) -> bool:
+        try:
+            self.cliente.head_object(Bucket=self.bucket, Key=self._chave(chave))
+            return True
+        except self.cliente.exceptions.ClientError:
+            return False
+
+    def ler(self, chave: str) -> Optional[bytes]:
+        try:
+            return self.cliente.get_object(Bucket=self.bucket, Key=self._chave(chave))["Body"].read()
+        except self.cliente.exceptions.NoSuchKey:
+            return None
+
+    def baixar(self, chave: str) -> Tuple[Optional[str], bool]:
+        """(caminho local, é temporário?) — cópia temporária do objeto"""
+        descritor, caminho = tempfile.mkstemp(suffix=os.path.splitext(chave)[1])
+        os.close(descritor)
+        try:
+            self.cliente.download_file(self.bucket, self._chave(chave), caminho)
+        except self.cliente.exceptions.ClientError:
+            os.remove(caminho)
+            return None, False
+        return caminho, True
+
+    def remover(self, chave: str):
+        self.cliente.delete_object(Bucket=self.bucket, Key=self._chave(chave))
+
+    def listar(self, prefixo: str) -> Iterator[Tuple[str, datetime]]:
+        paginas = self.cliente.get_paginator("list_objects_v2").paginate(
+            Bucket=self.bucket, Prefix=self._chave(prefixo))
+        for pagina in paginas:
+            for objeto in pagina.get("Contents", []):
+                yield objeto["Key"][len(self.prefixo):], objeto["LastModified"].astimezone().replace(tzinfo=None)
+
+
+def criar_armazenamento(backend: str = ARMAZENAMENTO_BACKEND):
+    if backend == "s3":
+        return ArmazenamentoS3()
+    return ArmazenamentoLocal()
+
+
+def _reduzir(origem: str, lado: int, formato: str, qualidade: int) -> bytes:
+    """Reduz a imagem para o maior lado e recodifica (miniatura/compactação)"""
+    with Image.open(origem) as img:
+        img.draft("RGB", (lado, lado))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((lado, lado), Image.Resampling.LANCZOS)
+        saida = io.BytesIO()
+        img.save(saida, formato, quality=qualidade)
+    return saida.getvalue()
+
+
+class ArmazenamentoImagens:
+    """Operações do app sobre o backend: guardar upload, miniatura, retenção"""
+
+    def __init__(self, backend=None):
+        self.backend = backend or criar_armazenamento()
+        # Uploads que continuam em disco depois de guardados num backend remoto,
+        # à espera da análise: chave -> caminhos (cada um é consumido por um leitor)
+        self._copias_locais: Dict[str, List[str]] = {}
+
+    def guardar(self, caminho: str, sha256: str, mime: str, manter_local: bool = False) -> str:
+        """
+        Move o upload recebido (em streaming) para o endereço pelo conteúdo e
+        gera a miniatura. Retorna a chave do original.
+        Com `manter_local`, num backend remoto o arquivo recebido fica em disco
+        e o próximo arquivo_local(chave) usa ele em vez de baixar o objeto.
+        """
+        chave = chave_original(sha256, mime)
+        manter = manter_local and self.backend.nome != "local"
+        with tempo_gravacao_imagem.medir(etapa="armazenamento"):
+            if not self.backend.existe(chave):
+                try:
+                    self.backend.gravar_bytes(chave_miniatura(sha256),
+                                              _reduzir(caminho, MINIATURA_LADO, "WEBP", MINIATURA_QUALIDADE))
+                except Exception as e:
+                    log.warning("Miniatura não gerada para %s: %s", sha256[:12], e)
+                self.backend.gravar_arquivo(chave, caminho, mover=not manter)
+            elif not manter:
+                os.remove(caminho)  # mesma foto já guardada
+        if manter:
+            self._copias_locais.setdefault(chave, []).append(caminho)
+        return chave
+
+    def _retirar_copia_local(self, chave: str) -> Optional[str]:
+        copias = self._copias_locais.get(chave)
+        if not copias:
+            return None
+        caminho = copias.pop()
+        if not copias:
+            del self._copias_locais[chave]
+        return caminho
+
+    def ler_imagem(self, chave: str, miniatura: bool = False) -> Optional[Tuple[bytes, str]]:
+        """(bytes, mime) da imagem; originais compactados caem na versão compacta"""
+        sha256 = sha_da_chave(chave)
+        if miniatura:
+            dados = self.backend.ler(chave_miniatura(sha256))
+            if dados is None:
+                dados = self._gerar_miniatura(chave)
+            return (dados, "image/webp") if dados is not None else None
+
+        dados = self.backend.ler(chave)
+        if dados is not None:
+            return dados, mime_da_chave(chave)
+        dados = self.backend.ler(chave_compacta(sha256))
+        return (dados, "image/jpeg") if dados is not None else None
+
+    def _gerar_miniatura(self, chave: str) -> Optional[bytes]:
+        """Miniatura sob demanda (imagens guardadas antes das miniaturas existirem)"""
+        sha256 = sha_da_chave(chave)
+        for candidata in (chave, chave_compacta(sha256)):
+            caminho, temporario = self.backend.baixar(candidata)
+            if caminho is None:
+                continue
+            try:
+                dados = _reduzir(caminho, MINIATURA_LADO, "WEBP", MINIATURA_QUALIDADE)
+            finally:
+                if temporario:
+                    os.remove(caminho)
+            self.backend.gravar_bytes(chave_miniatura(sha256), dados)
+            return dados
+        return None
+
+    def aplicar_retencao(self, dias: int = ARMAZENAMENTO_RETENCAO_DIAS,
+                         modo: str = ARMAZENAMENTO_RETENCAO_MODO) -> dict:
+        """
+        Originais mais antigos que `dias` são compactados (maior lado
+        COMPACTA_LADO, JPEG) ou removidos. Miniaturas são mantidas.
+        """
+        if dias <= 0:
+            return {"processados": 0}
+        limite = datetime.now() - timedelta(days=dias)
+        inicio = time.perf_counter()
+        processados, liberados = 0, 0
+        for chave, modificado_em in list(self.backend.listar("originais/")):
+            if modificado_em >= limite:
+                continue
+            if modo == "compactar":
+                caminho, temporario = self.backend.baixar(chave)
+                if caminho is None:
+                    continue
+                try:
+                    liberados += os.path.getsize(caminho)
+                    dados = _reduzir(caminho, COMPACTA_LADO, "JPEG", COMPACTA_QUALIDADE)
+                except Exception as e:
+                    log.warning("Não foi possível compactar %s: %s", chave, e)
+                    continue
+                finally:
+                    if temporario:
+                        os.remove(caminho)
+                self.backend.gravar_bytes(chave_compacta(sha_da_chave(chave)), dados)
+                liberados -= len(dados)
+            self.backend.remover(chave)
+            processados += 1
+
+        if processados:
+            log.info("Retenção de imagens aplicada", extra={
+                "modo": modo, "dias": dias, "processados": processados, "bytes_liberados": liberados,
+                "duracao_ms": round((time.perf_counter() - inicio) * 1000)
+            })
+        return {"processados": processados, "bytes_liberados": liberados}
+
+    async def manutencao_periodica(self):
+        """Aplica a retenção na subida e a cada ARMAZENAMENTO_MANUTENCAO_HORAS"""
+        while True:
+            try:
+                await asyncio.to_thread(self.aplicar_retencao)
+            except Exception:
+                log.exception("Erro na retenção de imagens")
+            await asyncio.sleep(ARMAZENAMENTO_MANUTENCAO_HORAS * 3600)
+
+    @asynccontextmanager
+    async def arquivo_local(self, chave: str):
+        """
+        Caminho local da imagem durante o bloco. No S3 é o upload mantido em
+        disco pelo guardar(manter_local=True), se ainda existir, ou uma cópia
+        temporária baixada do bucket; os dois são apagados no fim do bloco.
+        """
+        caminho = self._retirar_copia_local(chave)
+        if caminho is not None and os.path.exists(caminho):
+            temporario = True
+        else:
+            caminho, temporario = await asyncio.to_thread(self.backend.baixar, chave)
+        if caminho is None:
+            raise FileNotFoundError(chave)
+        try:
+            yield caminho
+        finally:
+            if temporario:
+                os.remove(caminho)
+
+    def estatisticas(self) -> dict:
+        return {
+            "backend": self.backend.nome,
+            "retencao_dias": ARMAZENAMENTO_RETENCAO_DIAS,
+            "retencao_modo": ARMAZENAMENTO_RETENCAO_MODO,
+        }
+
+
+# Instância global usada pela API
+armazenamento = ArmazenamentoImagens()
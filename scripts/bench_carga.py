@@ -0,0 +1,98 @@
+"""
+Teste de carga da API com tráfego misto (uploads + dashboard + feed).
+
+Uso (com a API rodando):
+    python bench_carga.py --url http://localhost:8080 [--segundos 20] [--concorrencia 32] [--uploads 0.2]
+
+Cada cliente virtual repete: com probabilidade --uploads envia uma foto
+gerada (POST /upload?modo=job), senão lê GET /dashboard?limite=20 ou
+GET /compras. Ao final mostra requisições/s e latências por rota; rode
+antes e depois de uma mudança para comparar.
+"""
+import argparse
+import asyncio
+import io
+import random
+import statistics
+import time
+from collections import defaultdict
+
+import httpx
+from PIL import Image
+
+
+def gerar_fotos(quantidade: int):
+    """JPEGs de ruído distintos (não caem no cache de análises entre si)"""
+    fotos = []
+    for i in range(quantidade):
+        saida = io.BytesIO()
+        Image.effect_noise((600, 900), 40 + i * 7).convert("RGB").save(saida, "JPEG", quality=85)
+        fotos.append(saida.getvalue())
+    return fotos
+
+
+async def cliente_virtual(cliente: httpx.AsyncClient, fim: float, prob_upload: float,
+                          fotos: list, latencias: dict, erros: dict, rng: random.Random):
+    while time.perf_counter() < fim:
+        sorteio = rng.random()
+        if sorteio < prob_upload:
+            rota = "upload"
+            requisicao = cliente.post("/upload", params={"modo": "job"},
+                                      files={"file": ("nota.jpg", rng.choice(fotos), "image/jpeg")})
+        elif sorteio < prob_upload + (1 - prob_upload) / 2:
+            rota = "dashboard"
+            requisicao = cliente.get("/dashboard", params={"limite": 20})
+        else:
+            rota = "compras"
+            requisicao = cliente.get("/compras", params={"limit": 20})
+
+        inicio = time.perf_counter()
+        try:
+            resposta = await requisicao
+            if resposta.status_code >= 400:
+                erros[rota] += 1
+                continue
+        except httpx.HTTPError:
+            erros[rota] += 1
+            continue
+        latencias[rota].append((time.perf_counter() - inicio) * 1000)
+
+
+async def rodar(url: str, segundos: float, concorrencia: int, prob_upload: float):
+    fotos = gerar_fotos(16)
+    latencias, erros = defaultdict(list), defaultdict(int)
+    limites = httpx.Limits(max_connections=concorrencia, max_keepalive_connections=concorrencia)
+    async with httpx.AsyncClient(base_url=url, timeout=60, limits=limites) as cliente:
+        inicio = time.perf_counter()
+        fim = inicio + segundos
+        await asyncio.gather(*[
+            cliente_virtual(cliente, fim, prob_upload, fotos, latencias, erros, random.Random(i))
+            for i in range(concorrencia)
+        ])
+        duracao = time.perf_counter() - inicio
+
+    total = sum(len(v) for v in latencias.values())
+    print(f"\n🚀 {total} requisições em {duracao:.1f}s = {total / duracao:.1f} req/s "
+          f"({concorrencia} clientes, {prob_upload:.0%} uploads)")
+    print(f"{'rota':10} {'ok':>7} {'erros':>6} {'req/s':>8} {'p50':>9} {'p95':>9} {'max':>9}")
+    for rota in ("upload", "dashboard", "compras"):
+        valores = sorted(latencias[rota])
+        if not valores:
+            continue
+        print(f"{rota:10} {len(valores):>7} {erros[rota]:>6} {len(valores) / duracao:>8.1f} "
+              f"{statistics.median(valores):>7.1f}ms {valores[int(len(valores) * 0.95)]:>7.1f}ms "
+              f"{valores[-1]:>7.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://localhost:8080")
+    parser.add_argument("--segundos", type=float, default=20)
+    parser.add_argument("--concorrencia", type=int, default=32)
+    parser.add_argument("--uploads", type=float, default=0.2, help="fração das requisições que são uploads")
+    args = parser.parse_args()
+    asyncio.run(rodar(args.url, args.segundos, args.concorrencia, args.uploads))
+
+
+if __name__ == "__main__":
+    main()
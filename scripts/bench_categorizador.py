@@ -0,0 +1,89 @@
+"""
+Micro-benchmark do categorizador de produtos.
+
+Uso:
+    python bench_categorizador.py [--itens 100000] [--distintos 5000]
+
+Gera nomes de itens no estilo dos cupons (abreviações, acentos, marcas e
+gramaturas) e compara a varredura linear antiga (`palavra in nome` para
+cada palavra-chave, como em app.py) com a regex compilada do categorizador,
+sem e com a memorização de nomes recentes. `--distintos` controla quantos
+nomes diferentes existem entre os `--itens` (notas repetem muito produto).
+"""
+import argparse
+import random
+import time
+
+from categorizador import Categorizador, categorizador, normalizar_texto
+
+MARCAS = ["OMO", "YPE", "NESTLE", "SADIA", "PERDIGAO", "COCA", "AMBEV", "QUALY", "TIO JOAO", "CAMIL",
+          "PILAO", "ITALAC", "PIRACANJUBA", "SEARA", "DOVE", "COLGATE", "VEJA", "BOMBRIL", "HEINZ", ""]
+MEDIDAS = ["1KG", "5KG", "500G", "200G", "1L", "2L", "350ML", "600ML", "UN", "PCT", "CX 12UN", ""]
+DESCONHECIDOS = ["PROD DIVERSOS", "ITEM AVULSO", "MERC GERAL", "ART CASA", "KIT PRESENTE", "EMBALAGEM"]
+ACENTOS = str.maketrans("aeiouc", "áéíóúç")
+
+
+def gerar_nomes(rng: random.Random, distintos: int) -> list:
+    palavras = list(categorizador.categoria_da_palavra)
+    nomes = []
+    for _ in range(distintos):
+        base = rng.choice(palavras) if rng.random() < 0.85 else rng.choice(DESCONHECIDOS).lower()
+        if rng.random() < 0.3:
+            base = base.translate(ACENTOS)
+        if rng.random() < 0.2:
+            base = base[:max(4, len(base) - 3)]  # abreviação do cupom
+        nome = f"{base.upper()} {rng.choice(MARCAS)} {rng.choice(MEDIDAS)}".strip()
+        nomes.append(" ".join(nome.split()))
+    return nomes
+
+
+def linear(regras: dict, nome: str) -> str:
+    """Varredura antiga: todas as palavras de todas as categorias, em ordem"""
+    nome = normalizar_texto(nome)
+    for categoria, palavras in regras.items():
+        for palavra in palavras:
+            if palavra in nome:
+                return categoria
+    return "Outros"
+
+
+def medir(titulo: str, funcao, nomes: list) -> float:
+    inicio = time.perf_counter()
+    for nome in nomes:
+        funcao(nome)
+    segundos = time.perf_counter() - inicio
+    print(f"   {titulo:32} {segundos * 1000:8.0f}ms  {len(nomes) / segundos:>10,.0f} itens/s")
+    return segundos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--itens", type=int, default=100_000)
+    parser.add_argument("--distintos", type=int, default=5_000)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    distintos = gerar_nomes(rng, args.distintos)
+    nomes = [rng.choice(distintos) for _ in range(args.itens)]
+
+    regras = {}
+    for palavra, categoria in categorizador.categoria_da_palavra.items():
+        regras.setdefault(categoria, []).append(palavra)
+    sem_cache = Categorizador(regras, tamanho_cache=0)
+    com_cache = Categorizador(regras)
+
+    print(f"📊 {args.itens:,} itens ({len(set(nomes)):,} nomes distintos), "
+          f"{len(categorizador.categoria_da_palavra)} palavras-chave")
+    base = medir("varredura linear (antiga)", lambda nome: linear(regras, nome), nomes)
+    regex = medir("regex compilada", sem_cache.categorizar, nomes)
+    cache = medir("regex compilada + lru_cache", com_cache.categorizar, nomes)
+    print(f"   ganho: {base / regex:.1f}x sem cache, {base / cache:.1f}x com cache "
+          f"({com_cache.estatisticas()['cache_hits']:,} acertos de cache)")
+
+    divergentes = sum(linear(regras, nome) != (sem_cache.categorizar(nome) or "Outros") for nome in distintos)
+    print(f"   nomes com categoria diferente da varredura antiga: {divergentes}/{len(distintos)} "
+          f"(palavra mais à esquerda/mais longa em vez da primeira da lista)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark do caminho rápido NFC-e (leitura local do QR code).
+
+Uso:
+    python bench_nfce.py [--pasta ../uploads] [--sinteticas 60] [--latencia-modelo 6.0]
+
+Mede, para cada foto da pasta e para cupons sintéticos (QR da NFC-e
+versão 2 online, versão 2 em contingência e versão 1, com rotação, ruído
+e JPEG), quanto custa a leitura local e quantas notas têm o cabeçalho
+(data + total) resolvido sem o modelo. `--latencia-modelo` é a duração
+média de uma chamada ao Gemini (segundos), usada só na estimativa final.
+Requer zxing-cpp.
+"""
+import argparse
+import io
+import os
+import random
+import statistics
+import time
+
+from PIL import Image, ImageDraw, ImageFilter
+
+import nfce
+
+
+def gerar_qr(texto: str, escala: int) -> Image.Image:
+    zxingcpp = nfce.zxingcpp
+    if hasattr(zxingcpp, "create_barcode"):
+        imagem = zxingcpp.create_barcode(texto, zxingcpp.BarcodeFormat.QRCode).to_image(scale=escala)
+    else:
+        imagem = zxingcpp.write_barcode(zxingcpp.BarcodeFormat.QRCode, texto)
+    matriz = memoryview(imagem)
+    qr = Image.frombytes("L", (matriz.shape[1], matriz.shape[0]), matriz.tobytes())
+    return qr if hasattr(zxingcpp, "create_barcode") else qr.resize((qr.width * escala, qr.height * escala))
+
+
+def gerar_chave(rng: random.Random) -> str:
+    base = (f"{rng.choice(list(nfce.UFS))}26{rng.randint(1, 12):02d}{rng.randint(10**13, 10**14 - 1)}"
+            f"65{rng.randint(1, 999):03d}{rng.randint(1, 10**9 - 1):09d}1{rng.randint(0, 10**8 - 1):08d}")
+    return base + str(nfce.digito_verificador(base))
+
+
+def gerar_cupom(rng: random.Random, versao: str) -> tuple:
+    """(JPEG do cupom fotografado, QR esperado completo?)"""
+    chave = gerar_chave(rng)
+    total = round(rng.uniform(5, 500), 2)
+    dia = rng.randint(1, 28)
+    if versao == "v2_online":
+        conteudo = f"https://www.nfce.fazenda.sp.gov.br/qrcode?p={chave}|2|1|1|{'%040X' % rng.getrandbits(160)}"
+    elif versao == "v2_offline":
+        conteudo = (f"https://www.nfce.fazenda.sp.gov.br/qrcode?p={chave}|2|1|{dia:02d}|{total:.2f}"
+                    f"|{'%056x' % rng.getrandbits(224)}|1|{'%040X' % rng.getrandbits(160)}")
+    else:
+        emissao = f"20{chave[2:4]}-{chave[4:6]}-{dia:02d}T17:15:00-03:00".encode().hex()
+        conteudo = (f"http://nfce.sefaz.mg.gov.br/consulta?chNFe={chave}&nVersao=100&tpAmb=1&dhEmi={emissao}"
+                    f"&vNF={total:.2f}&vICMS=0.00&digVal={'%056x' % rng.getrandbits(224)}&cIdToken=000001"
+                    f"&cHashQRCode={'%040X' % rng.getrandbits(160)}")
+
+    papel = Image.new("L", (520, 900), 245)
+    desenho = ImageDraw.Draw(papel)
+    for linha in range(24):
+        desenho.text((20, 20 + linha * 24), f"{linha + 1:03d} PRODUTO {rng.randint(1000, 9999)}  "
+                                            f"{rng.uniform(1, 50):.2f}", fill=30)
+    qr = gerar_qr(conteudo, 3)
+    papel.paste(qr, ((papel.width - qr.width) // 2, 880 - qr.height))
+
+    foto = Image.new("L", (1024, 1100), rng.randint(90, 140))
+    papel = papel.rotate(rng.uniform(-6, 6), expand=True, fillcolor=0)
+    mascara = papel.point(lambda v: 255 if v else 0)
+    foto.paste(papel, (rng.randint(50, 400), rng.randint(10, 150)), mascara)
+    foto = Image.blend(foto, Image.effect_noise(foto.size, 25), 0.12).filter(ImageFilter.GaussianBlur(0.6))
+    saida = io.BytesIO()
+    foto.convert("RGB").save(saida, "JPEG", quality=80)
+    return saida.getvalue(), versao != "v2_online"
+
+
+def medir(origem):
+    inicio = time.perf_counter()
+    dados = nfce.ler_nfce(origem)
+    return dados, (time.perf_counter() - inicio) * 1000
+
+
+def resumo(titulo: str, tempos: list, lidas: int, completas: int, total: int, latencia_modelo: float):
+    if not total:
+        return
+    tempos = sorted(tempos)
+    print(f"\n📊 {titulo}: {total} fotos")
+    print(f"   leitura local: p50 {statistics.median(tempos):.0f}ms, p95 {tempos[int(len(tempos) * 0.95)]:.0f}ms")
+    print(f"   chave lida: {lidas}/{total} ({lidas / total:.0%}), data+total pelo QR: {completas}/{total} ({completas / total:.0%})")
+    custo = sum(tempos) / 1000
+    print(f"   NFCE_SEM_ITENS=1: {completas} chamadas ao modelo evitadas "
+          f"(~{completas * latencia_modelo:.0f}s de modelo contra {custo:.1f}s de leitura local)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pasta", default=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploads"))
+    parser.add_argument("--sinteticas", type=int, default=60)
+    parser.add_argument("--latencia-modelo", type=float, default=6.0)
+    args = parser.parse_args()
+
+    if nfce.zxingcpp is None:
+        raise SystemExit("❌ zxing-cpp não instalado (pip install zxing-cpp)")
+
+    # Fotos reais da pasta
+    tempos, lidas, completas, total = [], 0, 0, 0
+    for nome in sorted(os.listdir(args.pasta)):
+        caminho = os.path.join(args.pasta, nome)
+        if not os.path.isfile(caminho) or os.path.splitext(nome)[1].lower() not in (".jpg", ".jpeg", ".png", ".webp"):
+            continue
+        dados, ms = medir(caminho)
+        tempos.append(ms)
+        total += 1
+        lidas += dados is not None
+        completas += nfce.cabecalho_completo(dados)
+        print(f"   {nome[:50]:50} {ms:6.0f}ms  {dados['chave'] if dados else '-'}")
+    resumo(f"Fotos em {args.pasta}", tempos, lidas, completas, total, args.latencia_modelo)
+
+    # Cupons sintéticos
+    rng = random.Random(42)
+    tempos, lidas, completas, acertos = [], 0, 0, 0
+    versoes = ("v2_online", "v2_offline", "v1")
+    for i in range(args.sinteticas):
+        foto, esperado = gerar_cupom(rng, versoes[i % len(versoes)])
+        dados, ms = medir(foto)
+        tempos.append(ms)
+        lidas += dados is not None
+        completas += nfce.cabecalho_completo(dados)
+        acertos += dados is not None and nfce.cabecalho_completo(dados) == esperado
+    resumo("Cupons sintéticos (1/3 de cada versão de QR)", tempos, lidas, completas, args.sinteticas,
+           args.latencia_modelo)
+    if args.sinteticas:
+        print(f"   interpretação correta do QR: {acertos}/{args.sinteticas}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""
+Benchmark do pré-processamento de imagens sobre as notas em uploads/.
+
+Uso:
+    python bench_preprocessamento.py            # bytes e tempo de preparo
+    python bench_preprocessamento.py --modelo   # também compara a extração do Gemini
+
+Com --modelo cada imagem única é enviada duas vezes (original e otimizada)
+para medir latência e comparar total/quantidade de itens extraídos.
+"""
+import glob
+import hashlib
+import io
+import json
+import os
+import sys
+import time
+
+from dotenv import load_dotenv
+from PIL import Image
+
+from preprocessamento import preprocessar_imagem
+
+PASTA_UPLOADS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'uploads')
+
+PROMPT = """
+Analise esta nota fiscal e retorne APENAS um JSON com:
+{"mercado": "nome", "total": 0.0, "itens": [{"nome": "produto", "valor": 0.0}]}
+"""
+
+
+def imagens_unicas():
+    """Arquivos de uploads/ sem repetir conteúdo idêntico"""
+    vistos = set()
+    for caminho in sorted(glob.glob(os.path.join(PASTA_UPLOADS, '*'))):
+        with open(caminho, 'rb') as f:
+            dados = f.read()
+        digest = hashlib.sha256(dados).hexdigest()
+        if digest in vistos:
+            continue
+        vistos.add(digest)
+        yield caminho, dados
+
+
+def extrair(cliente, modelo, dados, mime):
+    from google.genai import types
+    inicio = time.perf_counter()
+    resposta = cliente.models.generate_content(
+        model=modelo,
+        contents=[PROMPT, types.Part.from_bytes(data=dados, mime_type=mime)]
+    )
+    duracao = time.perf_counter() - inicio
+    texto = resposta.text.strip().removeprefix('```json').removesuffix('```').strip()
+    try:
+        nota = json.loads(texto)
+        return duracao, nota.get('total'), len(nota.get('itens', []))
+    except json.JSONDecodeError:
+        return duracao, None, 0
+
+
+def main():
+    usar_modelo = "--modelo" in sys.argv
+    cliente = None
+    modelo = os.getenv("BENCH_MODELO", "gemini-flash-latest")
+    if usar_modelo:
+        load_dotenv(os.path.join(os.path.dirname(PASTA_UPLOADS), '.env'))
+        from google import genai
+        cliente = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+
+    print(f"{'arquivo':40} {'original':>10} {'enviado':>10} {'redução':>8} {'preparo':>9}")
+    total_original = total_enviado = 0
+    for caminho, dados in imagens_unicas():
+        otimizado, mime, stats = preprocessar_imagem(dados)
+        total_original += len(dados)
+        total_enviado += len(otimizado)
+        reducao = 100 * (1 - len(otimizado) / len(dados))
+        print(f"{os.path.basename(caminho)[:40]:40} {len(dados):>10} {len(otimizado):>10} "
+              f"{reducao:>7.1f}% {stats.get('tempo_ms', 0):>7.1f}ms")
+
+        if cliente:
+            mime_original = Image.MIME.get(Image.open(io.BytesIO(dados)).format, "image/jpeg")
+            t_orig, total_orig, itens_orig = extrair(cliente, modelo, dados, mime_original)
+            t_otim, total_otim, itens_otim = extrair(cliente, modelo, otimizado, mime)
+            print(f"   original: {t_orig:.2f}s total={total_orig} itens={itens_orig} | "
+                  f"otimizada: {t_otim:.2f}s total={total_otim} itens={itens_otim}")
+
+    if total_original:
+        print(f"\n📦 Total: {total_original} -> {total_enviado} bytes "
+              f"({100 * (1 - total_enviado / total_original):.1f}% menos)")
+
+
+if __name__ == "__main__":
+    main()
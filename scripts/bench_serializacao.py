@@ -0,0 +1,94 @@
+"""
+Benchmark da serialização JSON do dashboard.
+
+Uso:
+    python bench_serializacao.py [--compras 5000] [--itens 6] [--repeticoes 5]
+
+Monta um payload de /dashboard com `--compras` compras (cada uma com
+`--itens` itens, repetidas em "compras", "feed" e "ultimaNota" como na
+API) e mede o render do JSONResponse padrão do FastAPI (antes) contra o
+RespostaJSON de serializacao.py com cada backend instalado (depois).
+Mede também a leitura de listas de itens no formato legado (Nota.itens).
+"""
+import argparse
+import importlib
+import json
+import os
+import random
+import time
+
+from fastapi.responses import JSONResponse
+
+import serializacao
+
+MERCADOS = ["Supermercado São João", "Atacadão", "Padaria Pão de Açúcar", "Posto Ipiranga", "Drogaria Araújo"]
+PRODUTOS = ["ARROZ TIO JOÃO 5KG", "FEIJÃO CARIOCA 1KG", "ÁGUA MINERAL 1,5L", "SABÃO EM PÓ OMO",
+            "CAFÉ PILÃO 500G", "LEITE INTEGRAL 1L", "PÃO FRANCÊS KG", "DETERGENTE YPÊ"]
+CATEGORIAS = ["Alimentos", "Bebidas", "Limpeza", "Farmácia", "Outros"]
+
+
+def gerar_payload(rng: random.Random, compras: int, itens: int) -> dict:
+    lista = []
+    for i in range(compras):
+        lista.append({
+            "id": f"{rng.getrandbits(128):032x}",
+            "mercado": rng.choice(MERCADOS),
+            "data": f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/2026",
+            "total": round(rng.uniform(5, 800), 2),
+            "categoria": rng.choice(CATEGORIAS),
+            "imagem": f"/compras/{i}/imagem" if rng.random() < 0.7 else None,
+            "itens": [{"nome": rng.choice(PRODUTOS), "valor": round(rng.uniform(1, 90), 2),
+                       "quantidade": rng.choice([1, 2, 1.5]), "categoria": rng.choice(CATEGORIAS)}
+                      for _ in range(itens)],
+        })
+    grafico = [{"name": c, "value": round(rng.uniform(100, 5000), 2), "color": "#6b7280"} for c in CATEGORIAS]
+    return {"totalGasto": 12345.67, "economiaEstimada": 1234.57, "comprasMes": 42, "categorias": grafico,
+            "grafico": grafico, "compras": lista, "feed": lista, "ultimaNota": lista[0] if lista else None}
+
+
+def medir(funcao, repeticoes: int) -> float:
+    """Melhor tempo (ms) entre as repetições"""
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return melhor * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--compras", type=int, default=5000)
+    parser.add_argument("--itens", type=int, default=6)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    payload = gerar_payload(rng, args.compras, args.itens)
+    itens_legados = [json.dumps(compra["itens"], ensure_ascii=False) for compra in payload["compras"]]
+
+    antes = medir(lambda: JSONResponse(content=payload), args.repeticoes)
+    tamanho = len(JSONResponse(content=payload).body)
+    leitura_antes = medir(lambda: [json.loads(texto) for texto in itens_legados], args.repeticoes)
+    print(f"📊 Dashboard com {args.compras:,} compras x {args.itens} itens ({tamanho / 1024 / 1024:.1f} MB de JSON)")
+    print(f"   {'JSONResponse (json padrão)':32} {antes:8.1f}ms")
+
+    for nome in ("json", "orjson", "msgspec"):
+        os.environ["JSON_BACKEND"] = nome
+        modulo = importlib.reload(serializacao)
+        if modulo.backend != nome:
+            print(f"   {'RespostaJSON (' + nome + ')':32}   não instalado")
+            continue
+        depois = medir(lambda: modulo.RespostaJSON(content=payload), args.repeticoes)
+        assert json.loads(modulo.RespostaJSON(content=payload).body) == json.loads(JSONResponse(content=payload).body)
+        print(f"   {'RespostaJSON (' + nome + ')':32} {depois:8.1f}ms  {antes / depois:5.1f}x")
+
+    os.environ["JSON_BACKEND"] = "auto"
+    modulo = importlib.reload(serializacao)
+    leitura = medir(lambda: [modulo.decodificar_itens(texto) for texto in itens_legados], args.repeticoes)
+    print(f"\n📦 Leitura de {len(itens_legados):,} listas de itens legadas: json {leitura_antes:.1f}ms, "
+          f"decodificar_itens ({modulo.backend}) {leitura:.1f}ms  {leitura_antes / leitura:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
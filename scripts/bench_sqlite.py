@@ -0,0 +1,143 @@
+"""
+Benchmark de leitura/escrita concorrente no SQLite: engine padrão
+(rollback journal) vs. perfil otimizado (WAL + pragmas, ver perfil_sqlite.py).
+
+Uso:
+    python bench_sqlite.py [--segundos 10] [--leitores 4] [--notas 2000] [--uploads-s 50]
+
+Uma thread simula uploads (nota + itens por transação, em ritmo fixo para
+os dois perfis lerem o mesmo volume) enquanto as outras repetem a consulta
+do dashboard. Mede latência das leituras, leituras que
+falharam com "database is locked" e commits por segundo.
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from perfil_sqlite import criar_engine_sqlite
+
+CATEGORIAS = ["Alimentos", "Bebidas", "Limpeza", "Higiene", "Hortifruti", "Carnes", "Padaria", "Frios", "Outros"]
+ITENS_POR_NOTA = 30
+
+ESQUEMA = [
+    "CREATE TABLE notas (id INTEGER PRIMARY KEY, user_id INTEGER, data_compra DATE, total FLOAT, categoria VARCHAR)",
+    "CREATE INDEX ix_notas_user_data ON notas (user_id, data_compra)",
+    "CREATE TABLE itens (id INTEGER PRIMARY KEY, nota_id INTEGER, nome VARCHAR, valor FLOAT, categoria VARCHAR)",
+    "CREATE INDEX ix_itens_nota_id ON itens (nota_id)",
+]
+
+CONSULTA_DASHBOARD = text("""
+    SELECT i.categoria, SUM(i.valor)
+    FROM itens i JOIN notas n ON n.id = i.nota_id
+    WHERE n.user_id = 1
+    GROUP BY i.categoria
+""")
+CONSULTA_FEED = text("SELECT * FROM notas WHERE user_id = 1 ORDER BY data_compra DESC, id DESC LIMIT 20")
+
+
+def inserir_nota(conn, rng):
+    resultado = conn.execute(
+        text("INSERT INTO notas (user_id, data_compra, total, categoria) VALUES (1, :data, :total, :cat)"),
+        {"data": f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+         "total": rng.uniform(5, 500), "cat": rng.choice(CATEGORIAS)}
+    )
+    nota_id = resultado.lastrowid
+    conn.execute(
+        text("INSERT INTO itens (nota_id, nome, valor, categoria) VALUES (:nota, :nome, :valor, :cat)"),
+        [{"nota": nota_id, "nome": f"produto {rng.randint(1, 5000)}",
+          "valor": rng.uniform(1, 50), "cat": rng.choice(CATEGORIAS)} for _ in range(ITENS_POR_NOTA)]
+    )
+
+
+def preparar(engine, notas: int):
+    rng = random.Random(42)
+    with engine.begin() as conn:
+        for comando in ESQUEMA:
+            conn.execute(text(comando))
+        for _ in range(notas):
+            inserir_nota(conn, rng)
+
+
+def escritor(engine, parar: threading.Event, resultado: dict, uploads_s: float):
+    rng = random.Random(7)
+    commits = erros = 0
+    intervalo = 1 / uploads_s
+    proximo = time.perf_counter()
+    while not parar.is_set():
+        try:
+            with engine.begin() as conn:
+                inserir_nota(conn, rng)
+            commits += 1
+        except OperationalError:
+            erros += 1
+        proximo += intervalo
+        time.sleep(max(0.0, proximo - time.perf_counter()))
+    resultado.update(commits=commits, erros_escrita=erros)
+
+
+def leitor(engine, parar: threading.Event, latencias: list, erros: list):
+    while not parar.is_set():
+        inicio = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                conn.execute(CONSULTA_DASHBOARD).all()
+                conn.execute(CONSULTA_FEED).all()
+            latencias.append((time.perf_counter() - inicio) * 1000)
+        except OperationalError:
+            erros.append(1)
+
+
+def rodar(perfil: str, segundos: float, leitores: int, notas: int, uploads_s: float) -> dict:
+    pasta = tempfile.mkdtemp(prefix="bench_sqlite_")
+    engine = criar_engine_sqlite(f"sqlite:///{os.path.join(pasta, 'bench.db')}", perfil)
+    preparar(engine, notas)
+
+    parar = threading.Event()
+    resultado, latencias, erros = {}, [], []
+    threads = [threading.Thread(target=escritor, args=(engine, parar, resultado, uploads_s))]
+    threads += [threading.Thread(target=leitor, args=(engine, parar, latencias, erros)) for _ in range(leitores)]
+    for t in threads:
+        t.start()
+    time.sleep(segundos)
+    parar.set()
+    for t in threads:
+        t.join()
+    engine.dispose()
+
+    latencias.sort()
+    return {
+        "perfil": perfil,
+        "leituras": len(latencias),
+        "erros_leitura": len(erros),
+        "p50_ms": statistics.median(latencias) if latencias else 0.0,
+        "p95_ms": latencias[int(len(latencias) * 0.95)] if latencias else 0.0,
+        "max_ms": latencias[-1] if latencias else 0.0,
+        "commits_s": resultado.get("commits", 0) / segundos,
+        "erros_escrita": resultado.get("erros_escrita", 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--segundos", type=float, default=10)
+    parser.add_argument("--leitores", type=int, default=4)
+    parser.add_argument("--notas", type=int, default=2000)
+    parser.add_argument("--uploads-s", type=float, default=50, help="commits por segundo do escritor")
+    args = parser.parse_args()
+
+    print(f"{'perfil':10} {'leituras':>9} {'bloqueios':>9} {'p50':>9} {'p95':>9} {'max':>9} {'commits/s':>10}")
+    for perfil in ("padrao", "otimizado"):
+        r = rodar(perfil, args.segundos, args.leitores, args.notas, args.uploads_s)
+        print(f"{r['perfil']:10} {r['leituras']:>9} {r['erros_leitura']:>9} {r['p50_ms']:>7.1f}ms "
+              f"{r['p95_ms']:>7.1f}ms {r['max_ms']:>7.1f}ms {r['commits_s']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
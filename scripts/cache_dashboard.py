@@ -0,0 +1,233 @@
+"""
+Cache da resposta do /dashboard por usuário.
+Cada usuário tem um contador de versão dos dados no banco (tabela
+`versoes_dashboard`), incrementado na mesma transação de cada
+upload/exclusão, então todos os workers e réplicas leem a mesma versão.
+A versão entra na chave do cache e no ETag: enquanto nada muda, o
+dashboard sai pronto (JSON já serializado e comprimido) de um LRU em
+memória, e o navegador que manda If-None-Match recebe 304 sem corpo.
+Com DASHBOARD_CACHE_BACKEND=redis as respostas ficam também no Redis,
+compartilhadas entre processos/réplicas (o LRU local continua na frente:
+a chave já tem a versão, então nunca fica velho).
+"""
+import gzip
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+try:
+    import brotli
+except ImportError:  # compressão brotli é opcional (gzip sempre disponível)
+    brotli = None
+
+try:
+    import redis.asyncio as redis_async
+except ImportError:  # backend compartilhado é opcional
+    redis_async = None
+
+from models import VersaoDashboard
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+# ✅ CONFIGURAÇÃO DO CACHE DO DASHBOARD
+DASHBOARD_CACHE_ATIVO = os.getenv("DASHBOARD_CACHE_ATIVO", "1") == "1"
+DASHBOARD_CACHE_BACKEND = os.getenv("DASHBOARD_CACHE_BACKEND", "memoria").lower()  # memoria | redis
+DASHBOARD_CACHE_REDIS_URL = os.getenv("DASHBOARD_CACHE_REDIS_URL", "redis://localhost:6379/0")
+DASHBOARD_CACHE_MAX = int(os.getenv("DASHBOARD_CACHE_MAX", "256"))  # respostas no LRU local
+DASHBOARD_CACHE_TTL = int(os.getenv("DASHBOARD_CACHE_TTL", "86400"))  # segundos no Redis
+DASHBOARD_COMPRESSAO_MIN = int(os.getenv("DASHBOARD_COMPRESSAO_MIN", "1024"))  # bytes
+DASHBOARD_GZIP_NIVEL = int(os.getenv("DASHBOARD_GZIP_NIVEL", "6"))
+DASHBOARD_BROTLI_QUALIDADE = int(os.getenv("DASHBOARD_BROTLI_QUALIDADE", "5"))
+
+PREFIXO_REDIS = "smartspend:dashboard"
+
+
+def escolher_codificacao(accept_encoding: Optional[str]) -> str:
+    """br, gzip ou identity conforme o Accept-Encoding (q=0 recusa)"""
+    aceitas = set()
+    for parte in (accept_encoding or "").lower().split(","):
+        nome, _, parametros = parte.strip().partition(";")
+        q = parametros.strip()
+        if q.startswith("q=") and q[2:].strip() in ("0", "0.0", "0.00", "0.000"):
+            continue
+        aceitas.add(nome.strip())
+    if brotli is not None and ("br" in aceitas or "*" in aceitas):
+        return "br"
+    if "gzip" in aceitas or "*" in aceitas:
+        return "gzip"
+    return "identity"
+
+
+def etag_confere(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparação fraca do If-None-Match (lista de ETags ou *)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    alvo = etag.removeprefix("W/")
+    return any(candidato.strip().removeprefix("W/") == alvo for candidato in if_none_match.split(","))
+
+
+class RespostaCacheada:
+    """Corpo JSON serializado + variantes comprimidas (geradas na primeira vez que alguém pede)"""
+
+    def __init__(self, etag: str, corpo: bytes):
+        self.etag = etag
+        self.corpos: Dict[str, bytes] = {"identity": corpo}
+
+    def corpo(self, codificacao: str) -> bytes:
+        if len(self.corpos["identity"]) < DASHBOARD_COMPRESSAO_MIN:
+            return self.corpos["identity"]
+        if codificacao not in self.corpos:
+            original = self.corpos["identity"]
+            if codificacao == "br":
+                self.corpos["br"] = brotli.compress(original, quality=DASHBOARD_BROTLI_QUALIDADE)
+            else:
+                self.corpos["gzip"] = gzip.compress(original, compresslevel=DASHBOARD_GZIP_NIVEL, mtime=0)
+        return self.corpos[codificacao]
+
+
+def _upsert_versao(dialeto: str, user_id: int):
+    """INSERT ... ON CONFLICT DO UPDATE versao = versao + 1 (atômico no banco)"""
+    if dialeto == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    stmt = insert(VersaoDashboard).values(user_id=user_id, versao=time.time_ns() // 1_000_000)
+    return stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={"versao": VersaoDashboard.versao + 1}
+    )
+
+
+class CacheDashboard:
+    """
+    Versões por usuário (no banco) + LRU de respostas prontas. A versão
+    começa no instante (ms) em que a linha foi criada, para um banco
+    recriado nunca reaproveitar um ETag já entregue com outros dados.
+    """
+
+    def __init__(self, ativo: bool = DASHBOARD_CACHE_ATIVO, max_entradas: int = DASHBOARD_CACHE_MAX,
+                 backend: str = DASHBOARD_CACHE_BACKEND):
+        self.ativo = ativo
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._entradas: "OrderedDict[str, RespostaCacheada]" = OrderedDict()
+        self._redis = None
+        self.stats = {"acertos": 0, "acertos_redis": 0, "faltas": 0, "nao_modificados": 0, "invalidacoes": 0}
+
+        if ativo and backend == "redis":
+            if redis_async is None:
+                log.warning("DASHBOARD_CACHE_BACKEND=redis sem o pacote redis instalado; usando cache em memória")
+            else:
+                self._redis = redis_async.from_url(DASHBOARD_CACHE_REDIS_URL)
+        self.backend = "redis" if self._redis is not None else "memoria"
+
+    def _contar(self, evento: str):
+        with self._lock:
+            self.stats[evento] += 1
+
+    async def versao(self, db: AsyncSession, user_id: int) -> Optional[int]:
+        """Versão atual dos dados do usuário (None: cache desligado, não usar)"""
+        if not self.ativo:
+            return None
+        versao = await db.scalar(select(VersaoDashboard.versao).where(VersaoDashboard.user_id == user_id))
+        return versao or 0
+
+    async def invalidar(self, db: AsyncSession, user_id: int):
+        """
+        Dados do usuário mudaram (upload/exclusão): nova versão, novo ETag.
+        Não faz commit: deve rodar na mesma transação que grava/exclui a nota,
+        assim a versão nunca avança sem os dados (nem o contrário).
+        """
+        await db.execute(_upsert_versao(db.bind.dialect.name, user_id))
+        self._contar("invalidacoes")
+
+    @staticmethod
+    def chave(user_id: int, versao: int, *parametros) -> str:
+        return ":".join(str(p) for p in (user_id, versao, *parametros))
+
+    @staticmethod
+    def etag(chave: str) -> str:
+        return f'W/"{hashlib.sha1(chave.encode()).hexdigest()[:24]}"'
+
+    def _guardar_local(self, chave: str, entrada: RespostaCacheada):
+        with self._lock:
+            self._entradas[chave] = entrada
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    async def buscar(self, chave: str) -> Optional[RespostaCacheada]:
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is not None:
+                self._entradas.move_to_end(chave)
+                self.stats["acertos"] += 1
+                return entrada
+        if self._redis is not None:
+            try:
+                corpo = await self._redis.get(f"{PREFIXO_REDIS}:resposta:{chave}")
+            except Exception as e:
+                log.warning("Falha ao ler o dashboard do Redis: %s", e)
+                corpo = None
+            if corpo is not None:
+                entrada = RespostaCacheada(self.etag(chave), corpo)
+                self._guardar_local(chave, entrada)
+                self._contar("acertos_redis")
+                return entrada
+        self._contar("faltas")
+        return None
+
+    async def guardar(self, chave: str, corpo: bytes) -> RespostaCacheada:
+        entrada = RespostaCacheada(self.etag(chave), corpo)
+        self._guardar_local(chave, entrada)
+        if self._redis is not None:
+            try:
+                await self._redis.set(f"{PREFIXO_REDIS}:resposta:{chave}", corpo, ex=DASHBOARD_CACHE_TTL)
+            except Exception as e:
+                log.warning("Falha ao gravar o dashboard no Redis: %s", e)
+        return entrada
+
+    @staticmethod
+    def _cabecalhos(etag: str, origem: str) -> Dict[str, str]:
+        return {
+            "ETag": etag,
+            "Cache-Control": "private, no-cache",  # o navegador guarda, mas sempre revalida
+            "Vary": "Accept-Encoding",
+            "X-Cache": origem,
+        }
+
+    def nao_modificado(self, request: Request, chave: str) -> Optional[Response]:
+        """304 se o cliente já tem esta versão (nem precisa da resposta em cache)"""
+        etag = self.etag(chave)
+        if not etag_confere(request.headers.get("if-none-match"), etag):
+            return None
+        self._contar("nao_modificados")
+        return Response(status_code=304, headers=self._cabecalhos(etag, "HIT"))
+
+    def responder(self, request: Request, entrada: RespostaCacheada, origem: str) -> Response:
+        """Corpo da entrada na melhor codificação aceita pelo cliente"""
+        cabecalhos = self._cabecalhos(entrada.etag, origem)
+        codificacao = escolher_codificacao(request.headers.get("accept-encoding"))
+        corpo = entrada.corpo(codificacao)
+        if corpo is not entrada.corpos["identity"]:
+            cabecalhos["Content-Encoding"] = codificacao
+        return Response(content=corpo, media_type="application/json", headers=cabecalhos)
+
+    def estatisticas(self) -> Dict[str, object]:
+        with self._lock:
+            return {"ativo": self.ativo, "backend": self.backend, "entradas": len(self._entradas), **self.stats}
+
+
+# Instância global usada pela API
+cache_dashboard = CacheDashboard()
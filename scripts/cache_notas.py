@@ -0,0 +1,136 @@
+"""
+Cache de análises de notas fiscais endereçado pelo conteúdo da imagem.
+Uma foto reenviada (mesmos bytes) pelo mesmo usuário devolve o resultado
+já extraído sem nova chamada ao Gemini. A chave é só o SHA-256 exato:
+notas diferentes impressas no mesmo layout têm hashes perceptuais quase
+iguais, então semelhança visual nunca conta como "mesma nota".
+"""
+import hashlib
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Union
+
+from database import SessionLocal
+from models import CacheAnalise
+from serializacao import dumps_texto, loads
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+# ✅ CONFIGURAÇÃO DO CACHE
+CACHE_NOTAS_TTL_DIAS = int(os.getenv("CACHE_NOTAS_TTL_DIAS", "30"))
+CACHE_NOTAS_MAX_ENTRADAS = int(os.getenv("CACHE_NOTAS_MAX_ENTRADAS", "5000"))
+
+
+def calcular_sha256(origem: Union[bytes, str]) -> str:
+    """Hash exato do conteúdo enviado (bytes ou caminho, lido em blocos)"""
+    if isinstance(origem, (bytes, bytearray)):
+        return hashlib.sha256(origem).hexdigest()
+    digest = hashlib.sha256()
+    with open(origem, "rb") as f:
+        while bloco := f.read(1024 * 1024):
+            digest.update(bloco)
+    return digest.hexdigest()
+
+
+class CacheNotas:
+    """
+    Cache persistido na tabela `cache_analises_usuario` (uma entrada por
+    usuário + SHA-256), com expiração por TTL e despejo LRU (pelo último
+    acesso) acima de CACHE_NOTAS_MAX_ENTRADAS.
+    """
+
+    def __init__(self, ttl_dias: int = CACHE_NOTAS_TTL_DIAS,
+                 max_entradas: int = CACHE_NOTAS_MAX_ENTRADAS):
+        self.ttl = timedelta(days=ttl_dias)
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.despejos = 0
+
+    @staticmethod
+    def _entrada(db, user_id: int, sha256: str) -> Optional[CacheAnalise]:
+        return db.query(CacheAnalise).filter(
+            CacheAnalise.user_id == user_id, CacheAnalise.sha256 == sha256
+        ).first()
+
+    def buscar(self, user_id: int, sha256: str) -> Optional[Dict[str, Any]]:
+        """Resultado de uma análise anterior desta mesma foto deste usuário (ou None)"""
+        with self._lock:
+            db = SessionLocal()
+            try:
+                entrada = self._entrada(db, user_id, sha256)
+                if entrada is not None and entrada.criado_em < datetime.now() - self.ttl:
+                    self._remover(db, entrada)
+                    db.commit()
+                    entrada = None
+
+                if entrada is None:
+                    self.misses += 1
+                    return None
+
+                entrada.hits = (entrada.hits or 0) + 1
+                entrada.ultimo_acesso = datetime.now()
+                db.commit()
+
+                self.hits += 1
+                log.info("Análise reaproveitada do cache", extra={"sha256": sha256[:12]})
+                return loads(entrada.resultado)
+            finally:
+                db.close()
+
+    def salvar(self, user_id: int, sha256: str, resultado: Dict[str, Any]):
+        """Guarda o resultado do modelo e aplica as políticas de despejo"""
+        with self._lock:
+            db = SessionLocal()
+            try:
+                agora = datetime.now()
+                entrada = self._entrada(db, user_id, sha256)
+                if entrada is None:
+                    entrada = CacheAnalise(user_id=user_id, sha256=sha256)
+                    db.add(entrada)
+                entrada.resultado = dumps_texto(resultado)
+                entrada.hits = 0
+                entrada.criado_em = agora
+                entrada.ultimo_acesso = agora
+                db.flush()
+                self._despejar(db)
+                db.commit()
+            except Exception as e:
+                log.warning("Erro ao gravar cache de análise: %s", e)
+                db.rollback()
+            finally:
+                db.close()
+
+    def _remover(self, db, entrada: CacheAnalise):
+        db.delete(entrada)
+        self.despejos += 1
+
+    def _despejar(self, db):
+        # TTL: entradas criadas antes do limite
+        for entrada in db.query(CacheAnalise).filter(CacheAnalise.criado_em < datetime.now() - self.ttl):
+            self._remover(db, entrada)
+
+        # LRU: mantém apenas as N acessadas mais recentemente
+        excedente = db.query(CacheAnalise).count() - self.max_entradas
+        if excedente > 0:
+            antigas = db.query(CacheAnalise).order_by(CacheAnalise.ultimo_acesso).limit(excedente).all()
+            for entrada in antigas:
+                self._remover(db, entrada)
+
+    def estatisticas(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "despejos": self.despejos,
+            "taxa_acerto": round(self.hits / total, 3) if total else 0.0,
+            "ttl_dias": self.ttl.days,
+            "max_entradas": self.max_entradas
+        }
+
+
+# Cache global usado pela API
+cache_notas = CacheNotas()
@@ -0,0 +1,92 @@
+"""
+Categorizador de produtos por palavras-chave (substitui as varreduras
+lineares de api.py e app.py).
+As palavras de data/categorias.json, mapeadas para as 9 categorias
+canônicas, viram uma única regex compilada sobre o nome sem acentos: a
+busca percorre o nome uma vez só, e vence a palavra mais à esquerda (a
+mais longa em caso de empate, ex: "agua sanitaria" antes de "agua").
+Nomes recentes ficam memorizados (lru_cache), já que as notas repetem
+muito os mesmos produtos.
+"""
+import json
+import os
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Dict, Iterable, Optional
+
+CATEGORIAS = ('Alimentos', 'Bebidas', 'Limpeza', 'Farmácia', 'Combustível',
+              'Restaurante', 'Lazer', 'Serviços', 'Outros')
+
+# ✅ CONFIGURAÇÃO DO CATEGORIZADOR
+CATEGORIAS_ARQUIVO = os.getenv(
+    "CATEGORIAS_ARQUIVO",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'categorias.json')
+)
+CATEGORIZADOR_CACHE = int(os.getenv("CATEGORIZADOR_CACHE", "4096"))  # nomes memorizados
+
+# Palavras curtas (sal, gin, cha...) só casam inteiras; as demais também como prefixo
+TAMANHO_MINIMO_PREFIXO = 4
+
+
+def normalizar_texto(texto: str) -> str:
+    """minúsculas, sem acentos e com espaços simples"""
+    sem_acentos = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", sem_acentos.lower()).split())
+
+
+_CANONICAS = {normalizar_texto(c): c for c in CATEGORIAS}
+
+
+def categoria_canonica(valor) -> Optional[str]:
+    """Nome canônico da categoria (aceita sem acento/maiúsculas) ou None se não existir"""
+    return _CANONICAS.get(normalizar_texto(str(valor or "")))
+
+
+class Categorizador:
+    """Regex compilada a partir de {categoria: [palavras-chave]}"""
+
+    def __init__(self, regras: Dict[str, Iterable[str]], tamanho_cache: int = CATEGORIZADOR_CACHE):
+        self.categoria_da_palavra: Dict[str, str] = {}
+        for categoria, palavras in regras.items():
+            canonica = categoria_canonica(categoria)
+            if canonica is None:
+                raise ValueError(f"Categoria desconhecida em {CATEGORIAS_ARQUIVO}: {categoria}")
+            for palavra in palavras:
+                self.categoria_da_palavra.setdefault(normalizar_texto(palavra), canonica)
+
+        # Mais longas primeiro: na mesma posição a alternativa mais específica vence
+        alternativas = []
+        for palavra in sorted(self.categoria_da_palavra, key=len, reverse=True):
+            padrao = re.escape(palavra).replace(r"\ ", " ")
+            alternativas.append(padrao if len(palavra) >= TAMANHO_MINIMO_PREFIXO else padrao + r"\b")
+        self.regex = re.compile(r"\b(?:" + "|".join(alternativas) + ")") if alternativas else None
+        self.categorizar = lru_cache(maxsize=tamanho_cache)(self._categorizar)
+
+    @classmethod
+    def do_arquivo(cls, caminho: str = CATEGORIAS_ARQUIVO) -> "Categorizador":
+        with open(caminho, encoding="utf-8") as f:
+            regras = {c: p for c, p in json.load(f).items() if not c.startswith("_")}
+        return cls(regras)
+
+    def _categorizar(self, nome: str) -> Optional[str]:
+        """Categoria pelo nome do produto, ou None se nenhuma palavra-chave casar"""
+        if self.regex is None:
+            return None
+        encontrada = self.regex.search(normalizar_texto(nome))
+        return self.categoria_da_palavra[encontrada.group(0)] if encontrada else None
+
+    def estatisticas(self) -> Dict[str, int]:
+        info = self.categorizar.cache_info()
+        return {"palavras": len(self.categoria_da_palavra), "cache_hits": info.hits,
+                "cache_misses": info.misses, "cache_tamanho": info.currsize}
+
+
+# Instância global (carregada uma vez de data/categorias.json)
+categorizador = Categorizador.do_arquivo()
+
+
+def categorizar_produto(nome_produto: str, padrao: str = "Outros") -> str:
+    """Categoria canônica do produto pelo nome (`padrao` se nada casar)"""
+    return categorizador.categorizar(nome_produto or "") or padrao
+
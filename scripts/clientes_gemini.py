@@ -0,0 +1,107 @@
+"""
+Registro de clientes Gemini reutilizáveis (um por chave de API).
+Cada cliente mantém seu pool HTTP com keep-alive, então conexões e
+handshakes TLS são reaproveitados entre uploads em vez de recriados
+a cada tentativa.
+"""
+import os
+import threading
+import time
+from typing import Dict, Any, List
+
+import httpx
+from google import genai
+from google.genai import types
+
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+# ✅ CONFIGURAÇÃO DO POOL HTTP
+GEMINI_TIMEOUT_MS = int(os.getenv("GEMINI_TIMEOUT_MS", "60000"))
+GEMINI_POOL_CONEXOES = int(os.getenv("GEMINI_POOL_CONEXOES", "10"))
+GEMINI_KEEPALIVE_SEGUNDOS = float(os.getenv("GEMINI_KEEPALIVE_SEGUNDOS", "120"))
+
+
+def _opcoes_http() -> types.HttpOptions:
+    limites = httpx.Limits(
+        max_connections=GEMINI_POOL_CONEXOES,
+        max_keepalive_connections=GEMINI_POOL_CONEXOES,
+        keepalive_expiry=GEMINI_KEEPALIVE_SEGUNDOS
+    )
+    return types.HttpOptions(
+        timeout=GEMINI_TIMEOUT_MS,
+        client_args={"limits": limites},
+        async_client_args={"limits": limites}
+    )
+
+
+class RegistroClientes:
+    """
+    Cria um genai.Client por chave uma única vez e o compartilha entre
+    requisições. Os clientes do SDK são seguros para chamadas concorrentes;
+    o lock protege apenas a criação preguiçosa.
+    """
+
+    def __init__(self):
+        self._clientes: Dict[str, genai.Client] = {}
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def inicializar(self, api_keys: List[str]):
+        """Cria os clientes de todas as chaves (chamado no startup)"""
+        for api_key in api_keys:
+            self.obter(api_key)
+        log.info("%d clientes Gemini prontos para reuso", len(self._clientes))
+
+    def obter(self, api_key: str) -> genai.Client:
+        """Retorna o cliente da chave, criando-o na primeira vez"""
+        cliente = self._clientes.get(api_key)
+        if cliente is not None:
+            return cliente
+
+        with self._lock:
+            cliente = self._clientes.get(api_key)
+            if cliente is None:
+                inicio = time.perf_counter()
+                cliente = genai.Client(api_key=api_key, http_options=_opcoes_http())
+                self._clientes[api_key] = cliente
+                self._stats[api_key] = {
+                    "criacao_ms": round((time.perf_counter() - inicio) * 1000, 2),
+                    "chamadas": 0,
+                    "primeira_chamada_ms": None,
+                    "soma_reuso_ms": 0.0
+                }
+        return cliente
+
+    def registrar_chamada(self, api_key: str, duracao: float):
+        """
+        Registra a duração de uma chamada. A primeira paga conexão + TLS;
+        as seguintes mostram o ganho do keep-alive.
+        """
+        stats = self._stats.get(api_key)
+        if stats is None:
+            return
+        stats["chamadas"] += 1
+        if stats["primeira_chamada_ms"] is None:
+            stats["primeira_chamada_ms"] = round(duracao * 1000, 2)
+        else:
+            stats["soma_reuso_ms"] += duracao * 1000
+
+    def estatisticas(self) -> List[Dict[str, Any]]:
+        resultado = []
+        for api_key, stats in self._stats.items():
+            reusos = max(0, stats["chamadas"] - 1)
+            resultado.append({
+                "chave": f"...{api_key[-4:]}",
+                "criacao_ms": stats["criacao_ms"],
+                "chamadas": stats["chamadas"],
+                "reusos": reusos,
+                "primeira_chamada_ms": stats["primeira_chamada_ms"],
+                "media_reuso_ms": round(stats["soma_reuso_ms"] / reusos, 2) if reusos else None
+            })
+        return resultado
+
+
+# Registro global usado pela API
+clientes_gemini = RegistroClientes()
@@ -0,0 +1,100 @@
+"""
+Engine do banco construída a partir de DATABASE_URL.
+SQLite usa o perfil de perfil_sqlite.py; PostgreSQL usa pool com pre-ping e
+reciclagem de conexões, o que permite várias réplicas da API no mesmo banco.
+Cada URL gera também uma engine assíncrona (aiosqlite/asyncpg) para os
+endpoints, que não podem bloquear o event loop.
+"""
+import os
+from typing import Dict, Any
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+from perfil_sqlite import criar_engine_sqlite, criar_engine_sqlite_assincrona, SQLITE_PERFIL
+
+# Driver assíncrono usado para cada backend
+DRIVERS_ASSINCRONOS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+# ✅ CONFIGURAÇÃO DO POOL (bancos cliente/servidor, ex: PostgreSQL)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))  # segundos; evita conexões mortas pelo proxy
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+
+
+def normalizar_url(url: str) -> str:
+    """
+    Railway/Heroku entregam `postgres://...`, esquema que o SQLAlchemy 2
+    não aceita mais. Sem driver explícito, fixa o psycopg2 do requirements
+    (o padrão do SQLAlchemy 2.1 passou a ser o psycopg 3).
+    """
+    for esquema in ("postgres://", "postgresql://"):
+        if url.startswith(esquema):
+            return "postgresql+psycopg2://" + url[len(esquema):]
+    return url
+
+
+def url_banco(padrao: str) -> str:
+    """DATABASE_URL do ambiente ou o SQLite local padrão"""
+    return normalizar_url(os.getenv("DATABASE_URL", "").strip() or padrao)
+
+
+def criar_engine(url: str) -> Engine:
+    """Engine com pool adequado ao backend da URL"""
+    url = normalizar_url(url)
+    if make_url(url).get_backend_name() == "sqlite":
+        return criar_engine_sqlite(url)
+
+    return create_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING
+    )
+
+
+def url_assincrona(url: str) -> str:
+    """Mesma URL com o driver assíncrono do backend (ex: sqlite+aiosqlite)"""
+    url = make_url(normalizar_url(url))
+    driver = DRIVERS_ASSINCRONOS.get(url.get_backend_name())
+    if driver:
+        url = url.set(drivername=driver)
+    return url.render_as_string(hide_password=False)
+
+
+def criar_engine_assincrona(url: str) -> AsyncEngine:
+    """Engine assíncrona com o mesmo pool/perfil da engine síncrona"""
+    url = url_assincrona(url)
+    if make_url(url).get_backend_name() == "sqlite":
+        return criar_engine_sqlite_assincrona(url)
+
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=DB_POOL_PRE_PING
+    )
+
+
+def estatisticas_engine(engine: Engine) -> Dict[str, Any]:
+    """Backend, ocupação do pool e, no SQLite, os pragmas efetivos (para o /health)"""
+    estatisticas = {
+        "backend": engine.dialect.name,
+        "url": engine.url.render_as_string(hide_password=True),
+        "pool": engine.pool.status()
+    }
+    if engine.dialect.name == "sqlite":
+        with engine.connect() as conn:
+            estatisticas["perfil"] = SQLITE_PERFIL
+            estatisticas["pragmas"] = {
+                nome: conn.exec_driver_sql(f"PRAGMA {nome}").scalar()
+                for nome in ("journal_mode", "synchronous", "cache_size", "mmap_size", "busy_timeout")
+            }
+    return estatisticas
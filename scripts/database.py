@@ -1,26 +1,36 @@
 """
-Configuração do Banco de Dados SQLite para SmartSpend-BR
+Configuração do Banco de Dados para SmartSpend-BR
+(SQLite local por padrão; PostgreSQL via DATABASE_URL)
 """
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from conexao import criar_engine, criar_engine_assincrona, url_banco
+from registro import obter_logger
+
+log = obter_logger(__name__)
 
 # ✅ CRIAR BASE ANTES DE TUDO
 Base = declarative_base()
 
-# Caminho do banco de dados
-DATABASE_URL = "sqlite:///./smartspend.db"
+# URL do banco (DATABASE_URL do ambiente ou o arquivo SQLite local)
+DATABASE_URL = url_banco("sqlite:///./smartspend.db")
+
+# Criar engine do SQLAlchemy (pool e ajustes por backend: ver conexao.py)
+engine = criar_engine(DATABASE_URL)
 
-# Criar engine do SQLAlchemy
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False}  # Necessário para SQLite
-)
+# Engine assíncrona (aiosqlite/asyncpg) usada pelos endpoints
+async_engine = criar_engine_assincrona(DATABASE_URL)
 
-# Sessão do banco
+# Sessão do banco (síncrona: init_db, migrações e scripts)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Sessão assíncrona: não bloqueia o event loop durante as consultas
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
 def get_db():
     """
     Dependency para obter sessão do banco de dados
@@ -31,16 +41,47 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_db():
+    """
+    Dependency para obter sessão assíncrona do banco de dados
+    """
+    async with AsyncSessionLocal() as db:
+        yield db
+
+def migrar_colunas():
+    """
+    Adiciona colunas e índices novos em tabelas que já existiam
+    (create_all só cria tabelas inexistentes)
+    """
+    inspector = inspect(engine)
+    tabelas_existentes = inspector.get_table_names()
+    
+    with engine.begin() as conn:
+        for tabela in Base.metadata.sorted_tables:
+            if tabela.name not in tabelas_existentes:
+                continue
+            
+            colunas_existentes = {c["name"] for c in inspector.get_columns(tabela.name)}
+            for coluna in tabela.columns:
+                if coluna.name not in colunas_existentes:
+                    tipo = coluna.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f'ALTER TABLE {tabela.name} ADD COLUMN {coluna.name} {tipo}'))
+                    log.info("Coluna adicionada: %s.%s", tabela.name, coluna.name)
+            
+            for indice in tabela.indexes:
+                indice.create(bind=conn, checkfirst=True)
+
 def init_db():
     """
     Inicializa o banco de dados criando todas as tabelas
     """
     # Importar modelos aqui para evitar import circular
-    from models import User, Nota
+    from models import User, Nota, Job, CacheAnalise, AgregadoMensal, VersaoDashboard
     
     # Criar tabelas primeiro
     Base.metadata.create_all(bind=engine)
-    print("📋 Tabelas criadas com sucesso")
+    migrar_colunas()
+    log.info("Tabelas criadas")
     
     # Criar usuário padrão se não existir
     db = SessionLocal()
@@ -55,11 +96,15 @@ def init_db():
             )
             db.add(default_user)
             db.commit()
-            print("✅ Usuário padrão criado")
+            if engine.dialect.name == "postgresql":
+                # id explícito não avança a sequência do SERIAL no PostgreSQL
+                db.execute(text("SELECT setval(pg_get_serial_sequence('users', 'id'), (SELECT MAX(id) FROM users))"))
+                db.commit()
+            log.info("Usuário padrão criado")
         else:
-            print("👤 Usuário padrão já existe")
-    except Exception as e:
-        print(f"❌ Erro ao criar usuário padrão: {e}")
+            log.debug("Usuário padrão já existe")
+    except Exception:
+        log.exception("Erro ao criar usuário padrão")
         db.rollback()
     finally:
         db.close()
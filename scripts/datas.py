@@ -0,0 +1,83 @@
+"""
+Datas das compras.
+Nota.data continua guardando o texto exibido (DD/MM/YYYY); Nota.data_compra
+é a data real (tipo Date) usada na ordenação, nos filtros por período e no
+índice composto (user_id, data_compra).
+"""
+from datetime import date, datetime, timedelta
+from typing import Optional, Tuple
+
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Nota
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+FORMATOS_DATA = ('%d/%m/%Y', '%Y-%m-%d')
+
+
+def converter_data(texto) -> Optional[date]:
+    """Converte DD/MM/YYYY (ou YYYY-MM-DD dos registros antigos) em date"""
+    for formato in FORMATOS_DATA:
+        try:
+            return datetime.strptime(texto, formato).date()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def intervalo_mes(referencia: Optional[date] = None) -> Tuple[date, date]:
+    """(primeiro dia do mês, primeiro dia do mês seguinte)"""
+    referencia = referencia or date.today()
+    inicio = referencia.replace(day=1)
+    proximo = (inicio + timedelta(days=32)).replace(day=1)
+    return inicio, proximo
+
+
+def validar_periodo(inicio: Optional[date], fim: Optional[date]):
+    if inicio and fim and inicio > fim:
+        raise HTTPException(status_code=400, detail="Período inválido: 'from' é posterior a 'to'")
+
+
+def filtrar_periodo(query, inicio: Optional[date] = None, fim: Optional[date] = None):
+    """Aplica `from`/`to` (inclusivos) sobre Nota.data_compra (Query ou select)"""
+    if inicio:
+        query = query.filter(Nota.data_compra >= inicio)
+    if fim:
+        query = query.filter(Nota.data_compra <= fim)
+    return query
+
+
+async def contar_compras_mes(db: AsyncSession, user_id: int, referencia: Optional[date] = None) -> int:
+    """Compras do mês corrente: range query no índice (user_id, data_compra)"""
+    inicio, proximo = intervalo_mes(referencia)
+    return await db.scalar(select(func.count(Nota.id)).where(
+        Nota.user_id == user_id,
+        Nota.data_compra >= inicio,
+        Nota.data_compra < proximo
+    )) or 0
+
+
+def migrar_datas(db: Session):
+    """
+    Backfill único: preenche Nota.data_compra a partir do texto em Nota.data.
+    Datas ilegíveis ficam com o dia da migração (mesmo fallback do upload).
+    """
+    pendentes = db.query(Nota).filter(Nota.data_compra.is_(None)).all()
+    if not pendentes:
+        return
+
+    invalidas = 0
+    for nota in pendentes:
+        data_compra = converter_data(nota.data)
+        if data_compra is None:
+            data_compra = date.today()
+            invalidas += 1
+        nota.data_compra = data_compra
+
+    db.commit()
+    log.info("Datas convertidas para data_compra", extra={"notas": len(pendentes), "sem_data_valida": invalidas})
@@ -0,0 +1,221 @@
+"""
+Saída estruturada da extração de notas.
+O Gemini é chamado em modo JSON com um schema (RESPOSTA_GEMINI_CONFIG), e a
+resposta passa por uma validação rápida com Pydantic. Se vier quase válida
+(cercas de markdown, vírgula sobrando, JSON cortado no fim...) um reparo
+barato é tentado antes de descartar a chamada; só então o roteador parte
+para outra tentativa.
+"""
+import json
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Literal, Optional, Type
+
+from google.genai import types
+from pydantic import BaseModel, Field, ValidationError, ValidationInfo, field_validator, model_validator
+
+from categorizador import CATEGORIAS, categoria_canonica, categorizar_produto
+from metricas import respostas_modelo
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+Categoria = Literal['Alimentos', 'Bebidas', 'Limpeza', 'Farmácia', 'Combustível',
+                    'Restaurante', 'Lazer', 'Serviços', 'Outros']
+
+
+class RespostaInvalida(ValueError):
+    """Resposta do modelo que nem o reparo conseguiu aproveitar"""
+
+
+def _categoria(valor: Any) -> str:
+    """Categoria canônica; qualquer coisa fora da lista vira 'Outros'"""
+    return categoria_canonica(valor) or "Outros"
+
+
+def _numero(valor: Any) -> Any:
+    """Aceita '12,34', 'R$ 1.234,56' e afins; o resto fica para o Pydantic recusar"""
+    if not isinstance(valor, str):
+        return valor
+    texto = re.sub(r"[^\d,.\-]", "", valor)
+    if "," in texto:
+        texto = texto.replace(".", "").replace(",", ".")
+    return texto or valor
+
+
+class ItemExtraido(BaseModel):
+    nome: str = Field(description="nome do produto como aparece na nota")
+    valor: float = Field(description="valor total do item em reais")
+    quantidade: float = Field(1.0, description="quantidade (padrão 1)")
+    categoria: Categoria = "Outros"
+
+    @field_validator("valor", mode="before")
+    @classmethod
+    def normalizar_valor(cls, valor: Any) -> Any:
+        return 0.0 if valor is None else _numero(valor)
+
+    @field_validator("quantidade", mode="before")
+    @classmethod
+    def normalizar_quantidade(cls, valor: Any) -> Any:
+        return 1 if valor in (None, "", 0) else _numero(valor)
+
+    @model_validator(mode="before")
+    @classmethod
+    def categoria_ausente(cls, dados: Any) -> Any:
+        # Sem a chave o default nem passa pelo validador abaixo
+        if isinstance(dados, dict) and "categoria" not in dados:
+            dados = {**dados, "categoria": None}
+        return dados
+
+    @field_validator("categoria", mode="before")
+    @classmethod
+    def normalizar_categoria(cls, valor: Any, info: ValidationInfo) -> str:
+        """Categoria vazia ou fora da lista sai do categorizador pelo nome do item"""
+        return categoria_canonica(valor) or categorizar_produto(info.data.get("nome", ""))
+
+
+class NotaExtraida(BaseModel):
+    mercado: str = Field(description="nome do estabelecimento")
+    data: str = Field(description="data da compra no formato YYYY-MM-DD")
+    total: float = Field(description="valor total da nota em reais")
+    categoria: Categoria
+    itens: List[ItemExtraido]
+
+    @field_validator("total", mode="before")
+    @classmethod
+    def normalizar_total(cls, valor: Any) -> Any:
+        return 0.0 if valor is None else _numero(valor)
+
+    @field_validator("categoria", mode="before")
+    @classmethod
+    def normalizar_categoria(cls, valor: Any) -> str:
+        return _categoria(valor)
+
+    @field_validator("data", mode="before")
+    @classmethod
+    def normalizar_data(cls, valor: Any) -> Any:
+        """DD/MM/YYYY vira YYYY-MM-DD (o resto do pipeline trata data inválida)"""
+        if isinstance(valor, str):
+            try:
+                return datetime.strptime(valor.strip(), "%d/%m/%Y").strftime("%Y-%m-%d")
+            except ValueError:
+                return valor.strip()
+        return valor
+
+
+class ItensExtraidos(BaseModel):
+    """Só o que o QR da NFC-e não traz (caminho rápido em nfce.py)"""
+    mercado: str = Field(description="nome do estabelecimento")
+    itens: List[ItemExtraido]
+
+
+# ✅ MODO JSON DO SDK: o modelo responde direto no formato do schema
+RESPOSTA_GEMINI_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=NotaExtraida,
+)
+RESPOSTA_ITENS_CONFIG = types.GenerateContentConfig(
+    response_mime_type="application/json",
+    response_schema=ItensExtraidos,
+)
+
+
+# Contadores de como as respostas foram aproveitadas (/health)
+_lock = threading.Lock()
+estatisticas_respostas = {"validas": 0, "reparadas": 0, "invalidas": 0}
+
+
+def _contar(resultado: str):
+    with _lock:
+        estatisticas_respostas[resultado] += 1
+    respostas_modelo.inc(resultado=resultado)
+
+
+def _fechar_estruturas(texto: str) -> str:
+    """
+    Fecha arrays e objetos abertos de um JSON cortado no fim, voltando até o
+    último objeto/array completo (um item pela metade é descartado)
+    """
+    pilha: List[str] = []
+    ultimo_completo = None  # (posição, pilha) logo após o último } ou ] fechado
+    em_string = escapado = False
+    for posicao, caractere in enumerate(texto):
+        if em_string:
+            if escapado:
+                escapado = False
+            elif caractere == "\\":
+                escapado = True
+            elif caractere == '"':
+                em_string = False
+        elif caractere == '"':
+            em_string = True
+        elif caractere in "{[":
+            pilha.append("}" if caractere == "{" else "]")
+        elif caractere in "}]" and pilha:
+            pilha.pop()
+            ultimo_completo = (posicao + 1, list(pilha))
+    if not pilha:
+        return texto
+    if ultimo_completo:
+        posicao, pilha = ultimo_completo
+        texto = texto[:posicao]
+    elif em_string:
+        texto += '"'
+    return re.sub(r",\s*$", "", texto.rstrip()) + "".join(reversed(pilha))
+
+
+def reparar_json(texto: str) -> str:
+    """
+    Conserta os defeitos mais comuns de um JSON quase válido: texto/markdown
+    em volta, aspas tipográficas, literais do Python, vírgulas sobrando e
+    estrutura cortada no fim da resposta.
+    """
+    texto = texto.strip()
+    inicio = texto.find("{")
+    if inicio == -1:
+        raise RespostaInvalida("resposta sem objeto JSON")
+    fim = texto.rfind("}")
+    texto = texto[inicio:fim + 1] if fim > inicio and texto.count("{") <= texto.count("}") else texto[inicio:]
+    texto = texto.replace("“", '"').replace("”", '"')
+    texto = re.sub(r"\bNone\b", "null", texto)
+    texto = re.sub(r"\bTrue\b", "true", re.sub(r"\bFalse\b", "false", texto))
+    if '"' not in texto:
+        texto = texto.replace("'", '"')
+    texto = _fechar_estruturas(texto)
+    return re.sub(r",\s*([}\]])", r"\1", texto)
+
+
+def interpretar_resposta(texto: Optional[str], parsed: Any = None,
+                         esquema: Type[BaseModel] = NotaExtraida) -> Dict[str, Any]:
+    """
+    Resposta do modelo -> dict da nota no formato usado pelo resto da API.
+    Caminho rápido: objeto já validado pelo SDK ou validação direta do texto;
+    depois, uma passada de reparo; por fim RespostaInvalida (nova tentativa).
+    """
+    if isinstance(parsed, esquema):
+        _contar("validas")
+        return parsed.model_dump()
+
+    if not texto:
+        _contar("invalidas")
+        raise RespostaInvalida("resposta vazia")
+
+    try:
+        nota = esquema.model_validate_json(texto)
+        _contar("validas")
+        return nota.model_dump()
+    except ValidationError:
+        pass
+
+    try:
+        nota = esquema.model_validate(json.loads(reparar_json(texto)))
+    except RespostaInvalida:
+        _contar("invalidas")
+        raise
+    except (ValueError, ValidationError) as e:
+        _contar("invalidas")
+        raise RespostaInvalida(f"resposta fora do schema: {str(e)[:200]}")
+    _contar("reparadas")
+    log.info("Resposta do modelo reparada antes da validação")
+    return nota.model_dump()
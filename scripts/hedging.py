@@ -0,0 +1,186 @@
+"""
+Requisições "hedged" ao Gemini para cortar a latência de cauda.
+Se a tentativa principal demorar mais que o p95 recente, dispara a mesma
+análise em outro par chave/modelo e fica com o primeiro JSON válido,
+cancelando a outra. Um orçamento por minuto evita drenar as cotas.
+
+O relógio do hedge só começa quando a tentativa consegue vaga no
+limitador de concorrência: esperar na fila não é lentidão do modelo, e um
+hedge lançado com fila só entraria no fim dela. Pelo mesmo motivo não há
+hedge enquanto o limitador estiver sem vaga livre.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Dict, Any, Callable, Awaitable, Tuple, Optional
+
+from limitador import LimitadorConcorrencia
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+# ✅ CONFIGURAÇÃO DO HEDGING (desligado por padrão)
+GEMINI_HEDGING = os.getenv("GEMINI_HEDGING", "0") == "1"
+# Atraso usado enquanto não há amostras suficientes para o p95
+GEMINI_HEDGE_ATRASO_MS = float(os.getenv("GEMINI_HEDGE_ATRASO_MS", "8000"))
+GEMINI_HEDGE_ATRASO_MIN_MS = float(os.getenv("GEMINI_HEDGE_ATRASO_MIN_MS", "1500"))
+GEMINI_HEDGE_PERCENTIL = float(os.getenv("GEMINI_HEDGE_PERCENTIL", "95"))
+GEMINI_HEDGES_POR_MINUTO = int(os.getenv("GEMINI_HEDGES_POR_MINUTO", "10"))
+
+# Amostras mínimas para confiar no percentil
+AMOSTRAS_MINIMAS = 20
+
+PAPEL_PRINCIPAL = "principal"
+PAPEL_HEDGE = "hedge"
+
+
+class Largada:
+    """Marcada pela tentativa quando ela sai da fila do limitador e chama o modelo"""
+
+    def __init__(self):
+        self.evento = asyncio.Event()
+        self.instante: Optional[float] = None
+
+    def marcar(self):
+        self.instante = time.monotonic()
+        self.evento.set()
+
+
+class ControleHedge:
+    """
+    Executa as tentativas (chave, modelo) em sequência e, com o hedging
+    ativo, lança uma tentativa extra quando a atual passa do atraso.
+    """
+
+    def __init__(self, ativo: bool = GEMINI_HEDGING,
+                 hedges_por_minuto: int = GEMINI_HEDGES_POR_MINUTO,
+                 limitador: Optional[LimitadorConcorrencia] = None):
+        self.ativo = ativo
+        self.limitador = limitador
+        self.hedges_por_minuto = hedges_por_minuto
+        self._latencias = deque(maxlen=200)
+        self._hedges_recentes = deque()
+        self.vitorias = {PAPEL_PRINCIPAL: 0, PAPEL_HEDGE: 0}
+        self.hedges_lancados = 0
+        self.hedges_negados = 0
+        self.hedges_sem_vaga = 0
+
+    def registrar_latencia(self, duracao: float):
+        """Guarda a duração de uma chamada bem-sucedida"""
+        self._latencias.append(duracao)
+
+    def atraso(self) -> float:
+        """Atraso (segundos) antes de disparar o hedge: p95 das latências recentes"""
+        if len(self._latencias) < AMOSTRAS_MINIMAS:
+            return GEMINI_HEDGE_ATRASO_MS / 1000
+        ordenadas = sorted(self._latencias)
+        indice = min(len(ordenadas) - 1, int(len(ordenadas) * GEMINI_HEDGE_PERCENTIL / 100))
+        return max(GEMINI_HEDGE_ATRASO_MIN_MS / 1000, ordenadas[indice])
+
+    def _consumir_orcamento(self) -> bool:
+        agora = time.monotonic()
+        while self._hedges_recentes and agora - self._hedges_recentes[0] > 60:
+            self._hedges_recentes.popleft()
+        if len(self._hedges_recentes) >= self.hedges_por_minuto:
+            self.hedges_negados += 1
+            return False
+        self._hedges_recentes.append(agora)
+        self.hedges_lancados += 1
+        return True
+
+    async def executar(self, tentar: Callable[[str, str, Largada], Awaitable[Dict[str, Any]]],
+                       candidatos) -> Dict[str, Any]:
+        """
+        Roda `tentar(chave, modelo, largada)` sobre os candidatos
+        (SequenciaCandidatos do roteador) até obter um resultado; a tentativa
+        chama largada.marcar() ao conseguir vaga no limitador.
+        Falhas passam para o próximo candidato; com hedging, uma tentativa lenta
+        ganha uma concorrente e a perdedora é cancelada.
+        """
+        pendentes: Dict[asyncio.Task, Tuple[str, Tuple[str, str], Largada]] = {}
+        ultimo_erro: Optional[Exception] = None
+        hedge_usado = False
+
+        def lancar(papel: str) -> bool:
+            # O hedge prefere outra chave: cota e rota independentes da tentativa lenta
+            em_uso = [p[0] for _, p, _ in pendentes.values()]
+            par = candidatos.proximo(evitar_chaves=em_uso)
+            if par is None:
+                return False
+            largada = Largada()
+            tarefa = asyncio.create_task(tentar(*par, largada))
+            pendentes[tarefa] = (papel, par, largada)
+            return True
+
+        if not lancar(PAPEL_PRINCIPAL):
+            raise RuntimeError("Nenhum par chave/modelo disponível")
+
+        try:
+            while pendentes:
+                timeout = None
+                espera_largada = None
+                if self.ativo and not hedge_usado:
+                    # Antes do hedge só há a tentativa principal em andamento
+                    largada = next(iter(pendentes.values()))[2]
+                    if largada.instante is None:
+                        espera_largada = asyncio.create_task(largada.evento.wait())
+                    else:
+                        timeout = max(0.0, largada.instante + self.atraso() - time.monotonic())
+                aguardadas = set(pendentes) | ({espera_largada} if espera_largada else set())
+                try:
+                    concluidas, _ = await asyncio.wait(
+                        aguardadas, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                    )
+                finally:
+                    if espera_largada:
+                        espera_largada.cancel()
+                concluidas.discard(espera_largada)
+
+                if not concluidas:
+                    if timeout is None:
+                        continue  # a principal conseguiu vaga: o relógio do hedge começa agora
+                    # A tentativa atual está lenta: dispara o hedge se houver vaga e orçamento
+                    hedge_usado = True
+                    if self.limitador is not None and not self.limitador.tem_vaga():
+                        self.hedges_sem_vaga += 1
+                        log.debug("Tentativa lenta, mas o limitador está sem vaga; hedge não disparado")
+                    elif self._consumir_orcamento() and lancar(PAPEL_HEDGE):
+                        log.info("Tentativa lenta (> %.1fs), disparando hedge", self.atraso())
+                    continue
+
+                for tarefa in concluidas:
+                    papel, par, _ = pendentes.pop(tarefa)
+                    try:
+                        resultado = tarefa.result()
+                    except Exception as e:
+                        ultimo_erro = e
+                        continue
+
+                    self.vitorias[papel] += 1
+                    if hedge_usado:
+                        log.info("Venceu a tentativa %s", papel, extra={"chave": f"...{par[0][-4:]}", "modelo": par[1]})
+                    return resultado
+
+                # Todas as tentativas em andamento falharam: segue para o próximo par
+                if not pendentes and not lancar(PAPEL_PRINCIPAL):
+                    break
+        finally:
+            for tarefa in pendentes:
+                tarefa.cancel()
+            if pendentes:
+                await asyncio.gather(*pendentes, return_exceptions=True)
+
+        raise ultimo_erro or RuntimeError("Nenhum par chave/modelo disponível")
+
+    def estatisticas(self) -> Dict[str, Any]:
+        return {
+            "ativo": self.ativo,
+            "atraso_ms": round(self.atraso() * 1000, 1),
+            "amostras": len(self._latencias),
+            "hedges_lancados": self.hedges_lancados,
+            "hedges_negados_orcamento": self.hedges_negados,
+            "hedges_sem_vaga": self.hedges_sem_vaga,
+            "orcamento_por_minuto": self.hedges_por_minuto,
+            "vitorias": dict(self.vitorias)
+        }
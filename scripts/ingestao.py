@@ -0,0 +1,141 @@
+"""
+Ingestão de uploads em streaming.
+O arquivo é copiado para uploads/recebidos/ em blocos (E/S assíncrona), com limite
+rígido de tamanho e verificação do tipo real pelos primeiros bytes; o
+SHA-256 é calculado durante a cópia. A memória por upload fica limitada
+a um bloco, e o resto do pipeline trabalha a partir do caminho no disco.
+"""
+import contextlib
+import hashlib
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime
+from typing import BinaryIO, Optional, Tuple
+
+import anyio
+from fastapi import HTTPException, UploadFile
+
+from armazenamento import ARMAZENAMENTO_PASTA
+from metricas import tempo_gravacao_imagem
+
+# ✅ CONFIGURAÇÃO DA INGESTÃO
+UPLOAD_MAX_MB = int(os.getenv("UPLOAD_MAX_MB", "20"))  # tamanho máximo de cada foto
+UPLOAD_MAX_BYTES = UPLOAD_MAX_MB * 1024 * 1024
+UPLOAD_TAMANHO_BLOCO = int(os.getenv("UPLOAD_TAMANHO_BLOCO_KB", "1024")) * 1024
+UPLOAD_MARGEM_MULTIPART = 64 * 1024  # cabeçalhos multipart além da foto (checagem do Content-Length)
+
+# Uploads em recepção; depois de gravados vão para o armazenamento (armazenamento.py)
+PASTA_RECEBIDOS = os.path.join(ARMAZENAMENTO_PASTA, 'recebidos')
+
+# Assinaturas (magic bytes) dos formatos aceitos: (deslocamento, bytes, mime)
+ASSINATURAS = [
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (0, b"BM", "image/bmp"),
+    (0, b"II*\x00", "image/tiff"),
+    (0, b"MM\x00*", "image/tiff"),
+    (8, b"WEBP", "image/webp"),  # RIFF....WEBP
+]
+
+
+@dataclass
+class UploadGravado:
+    nome_arquivo: str
+    caminho: str
+    tamanho: int
+    sha256: str
+    mime: str
+
+
+def detectar_tipo_imagem(cabecalho: bytes) -> Optional[str]:
+    """Mime type real da imagem pelos primeiros bytes, ou None se não for imagem aceita"""
+    for deslocamento, assinatura, mime in ASSINATURAS:
+        if cabecalho[deslocamento:deslocamento + len(assinatura)] == assinatura:
+            if mime == "image/webp" and not cabecalho.startswith(b"RIFF"):
+                continue
+            return mime
+    return None
+
+
+def caminho_upload(nome_original: str, prefixo: str = "nota") -> Tuple[str, str]:
+    """
+    Nome único em uploads/recebidos/ para o arquivo enviado: (nome do arquivo, caminho completo).
+    O sufixo aleatório evita que dois uploads no mesmo segundo com o mesmo
+    nome se sobrescrevam (ou que a limpeza de um recusado apague o outro).
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    nome_arquivo = f"{prefixo}_{timestamp}_{uuid.uuid4().hex[:6]}_{os.path.basename(nome_original or 'imagem')}"
+    os.makedirs(PASTA_RECEBIDOS, exist_ok=True)
+    return nome_arquivo, os.path.join(PASTA_RECEBIDOS, nome_arquivo)
+
+
+def _validar_bloco(nome: str, cabecalho: bytes, tamanho: int) -> Optional[str]:
+    """Valida o primeiro bloco; retorna o mime detectado"""
+    if tamanho > UPLOAD_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"{nome} excede {UPLOAD_MAX_MB} MB")
+    if cabecalho is not None:
+        mime = detectar_tipo_imagem(cabecalho)
+        if not mime:
+            raise HTTPException(status_code=415, detail=f"{nome} não é uma imagem suportada (JPEG, PNG, WEBP...)")
+        return mime
+    return None
+
+
+async def gravar_upload(file: UploadFile, prefixo: str = "nota") -> UploadGravado:
+    """
+    Copia o UploadFile para uploads/recebidos/ em blocos.
+    413 acima de UPLOAD_MAX_MB, 415 se os primeiros bytes não forem de
+    imagem, 400 se vazio. O arquivo parcial é removido em caso de erro.
+    """
+    inicio = time.perf_counter()
+    nome_arquivo, caminho = caminho_upload(file.filename, prefixo)
+    digest = hashlib.sha256()
+    tamanho = 0
+    mime = None
+    try:
+        async with await anyio.open_file(caminho, "wb") as destino:
+            while bloco := await file.read(UPLOAD_TAMANHO_BLOCO):
+                tamanho += len(bloco)
+                mime = _validar_bloco(file.filename, bloco if mime is None else None, tamanho) or mime
+                digest.update(bloco)
+                await destino.write(bloco)
+        if tamanho == 0:
+            raise HTTPException(status_code=400, detail="Arquivo vazio")
+    except BaseException:
+        # Se o arquivo nem chegou a ser criado, o erro original é que importa
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(caminho)
+        raise
+
+    tempo_gravacao_imagem.observar(time.perf_counter() - inicio, etapa="upload")
+    return UploadGravado(nome_arquivo, caminho, tamanho, digest.hexdigest(), mime)
+
+
+def gravar_stream(nome: str, origem: BinaryIO, prefixo: str = "nota") -> UploadGravado:
+    """Versão síncrona de gravar_upload para entradas de ZIP (roda em thread)"""
+    inicio = time.perf_counter()
+    nome_arquivo, caminho = caminho_upload(nome, prefixo)
+    digest = hashlib.sha256()
+    tamanho = 0
+    mime = None
+    try:
+        with open(caminho, "wb") as destino:
+            while bloco := origem.read(UPLOAD_TAMANHO_BLOCO):
+                tamanho += len(bloco)
+                mime = _validar_bloco(nome, bloco if mime is None else None, tamanho) or mime
+                digest.update(bloco)
+                destino.write(bloco)
+        if tamanho == 0:
+            raise HTTPException(status_code=400, detail="Arquivo vazio")
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(caminho)
+        raise
+
+    tempo_gravacao_imagem.observar(time.perf_counter() - inicio, etapa="upload")
+    return UploadGravado(nome_arquivo, caminho, tamanho, digest.hexdigest(), mime)
+
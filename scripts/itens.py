@@ -0,0 +1,98 @@
+"""
+Itens das notas fiscais como linhas da tabela `itens`.
+Substitui o JSON em Nota.itens: gravação em lote, leitura em uma única
+consulta por página e agregações feitas pelo próprio banco.
+"""
+from collections import defaultdict
+from typing import Dict, Any, List, Iterable
+
+from sqlalchemy import delete, exists, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from models import Item, Nota
+from agregados import desserializar_itens
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+# Notas por consulta em carregar_itens (limita o tamanho do IN enviado ao banco)
+ITENS_IDS_POR_CONSULTA = 500
+
+
+def _numero(valor, padrao: float = 0.0) -> float:
+    try:
+        return float(valor) if valor is not None else padrao
+    except (TypeError, ValueError):
+        return padrao
+
+
+def criar_itens(db, nota_id: str, itens: List[Dict[str, Any]]):
+    """Adiciona os itens da nota à sessão (sem commit, mesma transação da nota)"""
+    db.add_all([
+        Item(
+            nota_id=nota_id,
+            nome=item.get('nome'),
+            valor=_numero(item.get('valor')),
+            quantidade=_numero(item.get('quantidade'), 1.0),
+            categoria=item.get('categoria') or 'Outros'
+        )
+        for item in itens
+        if isinstance(item, dict)
+    ])
+
+
+def item_para_dict(item: Item) -> Dict[str, Any]:
+    quantidade = item.quantidade
+    if quantidade is not None and float(quantidade).is_integer():
+        quantidade = int(quantidade)
+    return {
+        "nome": item.nome,
+        "valor": item.valor,
+        "quantidade": quantidade,
+        "categoria": item.categoria
+    }
+
+
+async def carregar_itens(db: AsyncSession, nota_ids: Iterable[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """
+    Itens de várias notas com uma consulta a cada ITENS_IDS_POR_CONSULTA notas
+    (usa o índice em nota_id; a lista do IN nunca cresce sem limite)
+    """
+    nota_ids = list(nota_ids)
+    por_nota = defaultdict(list)
+    for inicio in range(0, len(nota_ids), ITENS_IDS_POR_CONSULTA):
+        lote = nota_ids[inicio:inicio + ITENS_IDS_POR_CONSULTA]
+        linhas = await db.scalars(select(Item).where(Item.nota_id.in_(lote)).order_by(Item.nota_id, Item.id))
+        for item in linhas:
+            por_nota[item.nota_id].append(item_para_dict(item))
+    return por_nota
+
+
+async def excluir_itens(db: AsyncSession, nota_id: str) -> List[Dict[str, Any]]:
+    """Remove os itens da nota e retorna o que foi removido (para os agregados)"""
+    itens = [item_para_dict(item) for item in await db.scalars(select(Item).where(Item.nota_id == nota_id))]
+    await db.execute(delete(Item).where(Item.nota_id == nota_id))
+    return itens
+
+
+def migrar_itens_json(db: Session):
+    """
+    Migração única: copia o JSON legado de Nota.itens para a tabela `itens`
+    nas notas que ainda não têm linhas de item.
+    """
+    pendentes = db.query(Nota).filter(
+        Nota.itens.isnot(None),
+        ~exists().where(Item.nota_id == Nota.id)
+    ).all()
+
+    migradas = 0
+    for nota in pendentes:
+        itens = desserializar_itens(nota.itens)
+        if itens:
+            criar_itens(db, nota.id, itens)
+            migradas += 1
+
+    if migradas:
+        db.commit()
+        log.info("Itens de %d notas migrados do JSON para a tabela itens", migradas)
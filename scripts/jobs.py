@@ -0,0 +1,263 @@
+"""
+Fila de jobs de análise de notas fiscais persistida no banco.
+O /upload em modo job só grava a imagem e cria o registro; os workers
+em background fazem análise + persistência e atualizam o progresso.
+"""
+import asyncio
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+from sqlalchemy import select, update
+
+from database import AsyncSessionLocal
+from models import Job
+from serializacao import dumps_texto, loads
+from rastreamento import rastreador
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+# Estados possíveis de um job
+STATUS_PENDENTE = "pendente"
+STATUS_PROCESSANDO = "processando"
+STATUS_CONCLUIDO = "concluido"
+STATUS_ERRO = "erro"
+STATUS_FINAIS = (STATUS_CONCLUIDO, STATUS_ERRO)
+
+# Número de workers consumindo a fila por processo
+UPLOAD_JOB_WORKERS = int(os.getenv("UPLOAD_JOB_WORKERS", "2"))
+
+# ✅ CONFIGURAÇÃO DO LEASE
+# Um job em processamento pertence ao worker que o reivindicou enquanto o
+# batimento (atualizado_em) for mais novo que JOB_LEASE_SEGUNDOS. Só jobs
+# com lease vencido (réplica morta ou reiniciada) voltam para a fila.
+JOB_LEASE_SEGUNDOS = float(os.getenv("JOB_LEASE_SEGUNDOS", "120"))
+JOB_BATIMENTO_SEGUNDOS = float(os.getenv("JOB_BATIMENTO_SEGUNDOS", str(JOB_LEASE_SEGUNDOS / 4)))
+
+# Identifica este processo como dono dos jobs que reivindicar
+ID_PROCESSO = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+def job_para_dict(job: Job) -> Dict[str, Any]:
+    """Serializa um job para resposta da API"""
+    return {
+        "id": job.id,
+        "status": job.status,
+        "etapa": job.etapa,
+        "resultado": loads(job.resultado) if job.resultado else None,
+        "erro": job.erro,
+        "criado_em": job.criado_em.isoformat() if job.criado_em else None,
+        "atualizado_em": job.atualizado_em.isoformat() if job.atualizado_em else None
+    }
+
+
+async def criar_job(arquivo: str, content_type: str) -> str:
+    """Registra um novo job pendente e retorna seu ID"""
+    async with AsyncSessionLocal() as db:
+        job = Job(
+            id=str(uuid.uuid4()),
+            status=STATUS_PENDENTE,
+            etapa="na_fila",
+            arquivo=arquivo,
+            content_type=content_type
+        )
+        db.add(job)
+        await db.commit()
+        return job.id
+
+
+async def buscar_job(job_id: str) -> Optional[Dict[str, Any]]:
+    """Retorna o estado atual do job ou None se não existir"""
+    async with AsyncSessionLocal() as db:
+        job = await db.get(Job, job_id)
+        return job_para_dict(job) if job else None
+
+
+async def atualizar_job(job_id: str, **campos):
+    """Atualiza campos do job (status, etapa, resultado, erro)"""
+    async with AsyncSessionLocal() as db:
+        job = await db.get(Job, job_id)
+        if not job:
+            return
+        if "resultado" in campos and campos["resultado"] is not None:
+            campos["resultado"] = dumps_texto(campos["resultado"])
+        for campo, valor in campos.items():
+            setattr(job, campo, valor)
+        await db.commit()
+
+
+async def reivindicar_job(job_id: str, dono: str = ID_PROCESSO) -> Optional[str]:
+    """
+    Assume um job pendente para este worker com um UPDATE condicional
+    (pendente -> processando). Com vários workers ou réplicas no mesmo banco,
+    só um consegue. Retorna o arquivo, ou None se o job não existe, já
+    terminou ou foi assumido por outro worker.
+    """
+    async with AsyncSessionLocal() as db:
+        resultado = await db.execute(update(Job).where(
+            Job.id == job_id, Job.status == STATUS_PENDENTE
+        ).values(
+            status=STATUS_PROCESSANDO,
+            etapa="iniciando",
+            dono=dono,
+            atualizado_em=datetime.now()
+        ))
+        await db.commit()
+        if not resultado.rowcount:
+            return None
+        return await db.scalar(select(Job.arquivo).where(Job.id == job_id))
+
+
+async def renovar_lease(job_id: str, dono: str = ID_PROCESSO) -> bool:
+    """
+    Batimento do dono: renova atualizado_em de um job em processamento.
+    Retorna False se o job não é mais deste dono (lease vencido e
+    recuperado por outra réplica, ou já finalizado).
+    """
+    async with AsyncSessionLocal() as db:
+        resultado = await db.execute(update(Job).where(
+            Job.id == job_id, Job.status == STATUS_PROCESSANDO, Job.dono == dono
+        ).values(atualizado_em=datetime.now()))
+        await db.commit()
+        return bool(resultado.rowcount)
+
+
+async def recuperar_jobs_expirados(lease_segundos: float = JOB_LEASE_SEGUNDOS) -> List[str]:
+    """
+    Devolve para pendente os jobs em processamento cujo dono parou de
+    bater há mais de `lease_segundos` (réplica morta ou reiniciada).
+    Jobs com lease válido continuam com a réplica que os detém.
+    Retorna os IDs recuperados.
+    """
+    limite = datetime.now() - timedelta(seconds=lease_segundos)
+    async with AsyncSessionLocal() as db:
+        expirados = list(await db.scalars(select(Job.id).where(
+            Job.status == STATUS_PROCESSANDO, Job.atualizado_em < limite
+        )))
+        recuperados = []
+        for job_id in expirados:
+            # Condicional de novo: o dono pode ter batido entre o SELECT e o UPDATE
+            resultado = await db.execute(update(Job).where(
+                Job.id == job_id, Job.status == STATUS_PROCESSANDO, Job.atualizado_em < limite
+            ).values(status=STATUS_PENDENTE, etapa="na_fila", dono=None))
+            if resultado.rowcount:
+                recuperados.append(job_id)
+        await db.commit()
+        return recuperados
+
+
+class FilaJobs:
+    """
+    Fila em memória alimentada pela tabela `jobs`.
+    Na inicialização, jobs pendentes são recolocados na fila; jobs em
+    processamento só voltam quando o lease do dono vence (ver
+    recuperar_jobs_expirados), verificado também periodicamente, então
+    nenhuma nota enviada se perde e nenhuma réplica viva perde seus jobs.
+    """
+
+    def __init__(self, num_workers: int = UPLOAD_JOB_WORKERS):
+        self.num_workers = max(1, num_workers)
+        self._fila: Optional[asyncio.Queue] = None
+        self._workers = []
+        self._varredura: Optional[asyncio.Task] = None
+        self._processador: Optional[Callable[[str, str], Awaitable[Dict[str, Any]]]] = None
+
+    async def iniciar(self, processador: Callable[[str, str], Awaitable[Dict[str, Any]]]):
+        """Sobe os workers e reenfileira jobs não finalizados"""
+        self._processador = processador
+        self._fila = asyncio.Queue()
+
+        # Jobs interrompidos no meio (lease vencido) voltam a ser pendentes
+        await recuperar_jobs_expirados()
+        async with AsyncSessionLocal() as db:
+            pendentes = list(await db.scalars(
+                select(Job.id).where(Job.status == STATUS_PENDENTE).order_by(Job.criado_em)
+            ))
+            for job_id in pendentes:
+                self._fila.put_nowait((job_id, None))
+            if pendentes:
+                log.info("%d jobs recuperados da fila persistida", len(pendentes))
+
+        for i in range(self.num_workers):
+            self._workers.append(asyncio.create_task(self._worker(i + 1)))
+        self._varredura = asyncio.create_task(self._varrer_expirados())
+        log.info("%d workers de upload iniciados", self.num_workers)
+
+    async def parar(self):
+        """Cancela os workers (jobs em andamento voltam para a fila quando o lease vencer)"""
+        tarefas = self._workers + ([self._varredura] if self._varredura else [])
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        self._workers = []
+        self._varredura = None
+
+    def enfileirar(self, job_id: str, rastro: Optional[str] = None):
+        """`rastro`: traceparent da requisição de upload (o job vira filho dela no trace)"""
+        self._fila.put_nowait((job_id, rastro))
+
+    def tamanho(self) -> int:
+        return self._fila.qsize() if self._fila else 0
+
+    async def _varrer_expirados(self):
+        """Recupera periodicamente jobs de réplicas que morreram sem reiniciar"""
+        while True:
+            await asyncio.sleep(JOB_LEASE_SEGUNDOS)
+            try:
+                recuperados = await recuperar_jobs_expirados()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("Falha ao recuperar jobs expirados: %s", e)
+                continue
+            for job_id in recuperados:
+                self._fila.put_nowait((job_id, None))
+            if recuperados:
+                log.info("%d jobs com lease vencido recolocados na fila", len(recuperados))
+
+    async def _bater(self, job_id: str):
+        """Mantém o lease do job enquanto o processador trabalha"""
+        while True:
+            await asyncio.sleep(JOB_BATIMENTO_SEGUNDOS)
+            try:
+                if not await renovar_lease(job_id):
+                    log.warning("Lease do job perdido", extra={"job_id": job_id})
+                    return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.warning("Falha ao renovar lease: %s", e, extra={"job_id": job_id})
+
+    async def _worker(self, numero: int):
+        while True:
+            job_id, rastro = await self._fila.get()
+            try:
+                with rastreador.span("job", {"job.id": job_id, "job.worker": numero}, pai=rastro):
+                    arquivo = await reivindicar_job(job_id)
+                    if arquivo is None:
+                        continue
+
+                    log.debug("Worker %d processando job", numero, extra={"job_id": job_id})
+                    batimento = asyncio.create_task(self._bater(job_id))
+                    try:
+                        resultado = await self._processador(job_id, arquivo)
+                    finally:
+                        batimento.cancel()
+                    await atualizar_job(job_id, status=STATUS_CONCLUIDO, etapa="concluido", resultado=resultado)
+                log.info("Job concluído", extra={"job_id": job_id})
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                detalhe = getattr(e, "detail", None) or str(e)
+                log.error("Job falhou: %s", detalhe, extra={"job_id": job_id})
+                await atualizar_job(job_id, status=STATUS_ERRO, etapa="erro", erro=str(detalhe))
+            finally:
+                self._fila.task_done()
+
+
+# Fila global usada pela API
+fila_jobs = FilaJobs()
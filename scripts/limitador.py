@@ -0,0 +1,59 @@
+"""
+Limitador de concorrência para as chamadas ao Gemini
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any
+
+
+class LimitadorConcorrencia:
+    """
+    Semáforo assíncrono com métricas de fila.
+    Garante no máximo `limite` extrações simultâneas por processo;
+    as demais aguardam sem bloquear o event loop.
+    """
+
+    def __init__(self, limite: int):
+        self.limite = max(1, limite)
+        self._semaforo = asyncio.Semaphore(self.limite)
+        self.na_fila = 0
+        self.em_execucao = 0
+        self.pico_fila = 0
+        self.total_processadas = 0
+        self.espera_total = 0.0
+
+    @asynccontextmanager
+    async def vaga(self):
+        """Aguarda uma vaga livre e a libera ao sair do bloco"""
+        inicio = time.perf_counter()
+        self.na_fila += 1
+        self.pico_fila = max(self.pico_fila, self.na_fila)
+        try:
+            await self._semaforo.acquire()
+        finally:
+            self.na_fila -= 1
+        self.espera_total += time.perf_counter() - inicio
+        self.em_execucao += 1
+        try:
+            yield
+        finally:
+            self.em_execucao -= 1
+            self.total_processadas += 1
+            self._semaforo.release()
+
+    def tem_vaga(self) -> bool:
+        """Há vaga livre agora, sem ninguém esperando na frente"""
+        return self.na_fila == 0 and self.em_execucao < self.limite
+
+    def estatisticas(self) -> Dict[str, Any]:
+        """Retorna o estado atual da fila para o /health"""
+        espera_media = self.espera_total / self.total_processadas if self.total_processadas else 0.0
+        return {
+            "limite": self.limite,
+            "em_execucao": self.em_execucao,
+            "na_fila": self.na_fila,
+            "pico_fila": self.pico_fila,
+            "total_processadas": self.total_processadas,
+            "espera_media_ms": round(espera_media * 1000, 2)
+        }
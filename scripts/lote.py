@@ -0,0 +1,109 @@
+"""
+Upload em lote: vários arquivos (ou um ZIP) por requisição.
+As fotos são analisadas em paralelo e as notas resultantes gravadas em
+uma única transação; a resposta traz o resultado de cada arquivo.
+"""
+import os
+import zipfile
+import zlib
+from typing import BinaryIO, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from ingestao import UploadGravado, gravar_stream, UPLOAD_MAX_BYTES, UPLOAD_MAX_MB
+
+# ✅ CONFIGURAÇÃO DO LOTE
+UPLOAD_LOTE_PARALELISMO = int(os.getenv("UPLOAD_LOTE_PARALELISMO", "8"))  # análises simultâneas por lote
+UPLOAD_LOTE_MAX_ARQUIVOS = int(os.getenv("UPLOAD_LOTE_MAX_ARQUIVOS", "100"))
+UPLOAD_LOTE_MAX_MB = int(os.getenv("UPLOAD_LOTE_MAX_MB", "200"))  # soma das fotos do lote (já descompactadas)
+UPLOAD_LOTE_MAX_BYTES = UPLOAD_LOTE_MAX_MB * 1024 * 1024
+# Fotos já vêm comprimidas (JPEG/PNG/WEBP): uma entrada que encolhe mais que
+# isso no ZIP é quase certamente enchimento (zip bomb); 0 desliga
+UPLOAD_LOTE_RAZAO_MAX = int(os.getenv("UPLOAD_LOTE_RAZAO_MAX", "100"))
+
+EXTENSOES_IMAGEM = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+
+
+def eh_zip(nome: str, content_type: str) -> bool:
+    return (content_type or "") in ("application/zip", "application/x-zip-compressed") \
+        or (nome or "").lower().endswith(".zip")
+
+
+def verificar_limites_lote(arquivos: int, tamanho: int):
+    """413 se o lote passa de UPLOAD_LOTE_MAX_ARQUIVOS fotos ou de UPLOAD_LOTE_MAX_MB no total"""
+    if arquivos > UPLOAD_LOTE_MAX_ARQUIVOS:
+        raise HTTPException(status_code=413, detail=f"Lote com {arquivos} arquivos; máximo {UPLOAD_LOTE_MAX_ARQUIVOS}")
+    if tamanho > UPLOAD_LOTE_MAX_BYTES:
+        raise HTTPException(status_code=413, detail=f"Lote excede {UPLOAD_LOTE_MAX_MB} MB descompactado")
+
+
+def _recusar_entrada(info: zipfile.ZipInfo) -> Optional[str]:
+    """Motivo para recusar a entrada só pelo índice do ZIP, ou None"""
+    nome = os.path.basename(info.filename)
+    if info.file_size > UPLOAD_MAX_BYTES:
+        return f"{nome} excede {UPLOAD_MAX_MB} MB"
+    if UPLOAD_LOTE_RAZAO_MAX and info.file_size > max(info.compress_size, 1) * UPLOAD_LOTE_RAZAO_MAX:
+        return f"{nome} tem taxa de compressão suspeita"
+    return None
+
+
+def expandir_zip(origem: BinaryIO, prefixo: str, arquivos_lote: int = 0,
+                 tamanho_lote: int = 0) -> List[Tuple[str, Optional[UploadGravado], Optional[str]]]:
+    """
+    Extrai as imagens de um ZIP direto para uploads/recebidos/, entrada por entrada e
+    em blocos: (nome, arquivo gravado, erro). Ignora pastas, metadados do
+    macOS e arquivos que não são imagens.
+
+    Antes de descompactar qualquer coisa, lê o índice do ZIP e recusa o
+    lote inteiro (413) se a quantidade de imagens ou a soma dos tamanhos
+    descompactados, somadas ao que o lote já recebeu (`arquivos_lote`,
+    `tamanho_lote`), passam dos limites do lote (zip bomb). Uma entrada
+    acima do limite por foto ou com taxa de compressão suspeita, declarada
+    no índice ou descoberta na cópia (cabeçalho mentiroso, CRC errado),
+    vira erro só daquele arquivo. Caminhos das entradas (../) são
+    descartados: só o nome do arquivo é usado, dentro de uploads/recebidos/.
+    Roda em thread (E/S síncrona do zipfile).
+    """
+    try:
+        arquivo_zip = zipfile.ZipFile(origem)
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail="Arquivo ZIP inválido")
+
+    imagens = []
+    try:
+        with arquivo_zip:
+            entradas = [
+                info for info in arquivo_zip.infolist()
+                if not info.is_dir()
+                and not info.filename.startswith("__MACOSX/")
+                and not os.path.basename(info.filename).startswith(".")
+                and os.path.splitext(info.filename)[1].lower() in EXTENSOES_IMAGEM
+            ]
+            recusas = [_recusar_entrada(info) for info in entradas]
+            verificar_limites_lote(arquivos_lote + len(entradas), tamanho_lote + sum(
+                info.file_size for info, recusa in zip(entradas, recusas) if recusa is None
+            ))
+
+            for info, recusa in zip(entradas, recusas):
+                nome = os.path.basename(info.filename)
+                if recusa is not None:
+                    imagens.append((nome, None, recusa))
+                    continue
+                try:
+                    with arquivo_zip.open(info) as entrada:
+                        imagens.append((nome, gravar_stream(nome, entrada, f"{prefixo}_{len(imagens):03d}"), None))
+                except HTTPException as e:
+                    imagens.append((nome, None, e.detail))
+                except (zipfile.BadZipFile, zlib.error, EOFError):
+                    imagens.append((nome, None, f"{nome} está corrompido no ZIP"))
+    except BaseException:
+        remover_gravados(imagens)
+        raise
+    return imagens
+
+
+def remover_gravados(entradas: list):
+    """Apaga os arquivos já recebidos de um lote recusado"""
+    for _, gravado, _ in entradas:
+        if gravado is not None and os.path.exists(gravado.caminho):
+            os.remove(gravado.caminho)
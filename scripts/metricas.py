@@ -0,0 +1,236 @@
+"""
+Métricas da API no formato texto do Prometheus (exposition format 0.0.4).
+Tudo fica em memória no próprio processo: contadores e histogramas com
+rótulos, protegidos por lock (são atualizados tanto no event loop quanto
+nas threads do asyncio.to_thread). O GET /metrics devolve o texto pronto
+para um Prometheus local raspar; nenhum serviço externo é necessário.
+
+Os histogramas são cumulativos como os do Prometheus (_bucket{le=...},
+_sum e _count), então histogram_quantile() funciona direto no PromQL.
+"""
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# ✅ CONFIGURAÇÃO DAS MÉTRICAS
+METRICAS_ATIVO = os.getenv("METRICAS_ATIVO", "1") == "1"
+
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+# Limites (segundos) dos baldes: operações locais vão de ms a alguns segundos,
+# as chamadas ao modelo de centenas de ms a dezenas de segundos
+LIMITES_LOCAIS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+LIMITES_MODELO = (0.25, 0.5, 1.0, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 20.0, 30.0, 60.0)
+
+
+def _escapar(valor: str) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _formatar_numero(valor: float) -> str:
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    if float(valor).is_integer():
+        return str(int(valor))
+    return repr(float(valor))
+
+
+def _rotulos(nomes: Sequence[str], valores: Sequence[str], extra: str = "") -> str:
+    partes = [f'{nome}="{_escapar(valor)}"' for nome, valor in zip(nomes, valores)]
+    if extra:
+        partes.append(extra)
+    return "{" + ",".join(partes) + "}" if partes else ""
+
+
+class Metrica:
+    """Base: nome, ajuda, rótulos e o lock das séries"""
+    tipo = "untyped"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._lock = threading.Lock()
+
+    def _chave(self, rotulos: Dict[str, str]) -> Tuple[str, ...]:
+        if set(rotulos) != set(self.rotulos):
+            raise ValueError(f"{self.nome} espera os rótulos {self.rotulos}, recebeu {tuple(rotulos)}")
+        return tuple(str(rotulos[nome]) for nome in self.rotulos)
+
+    def _linhas(self) -> List[str]:
+        raise NotImplementedError
+
+    def exportar(self) -> str:
+        cabecalho = [f"# HELP {self.nome} {_escapar(self.ajuda)}", f"# TYPE {self.nome} {self.tipo}"]
+        return "\n".join(cabecalho + self._linhas())
+
+
+class Contador(Metrica):
+    """Contador monotônico (sufixo _total por convenção)"""
+    tipo = "counter"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        super().__init__(nome, ajuda, rotulos)
+        self._valores: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, valor: float = 1, **rotulos: str):
+        if not METRICAS_ATIVO:
+            return
+        chave = self._chave(rotulos)
+        with self._lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def valor(self, **rotulos: str) -> float:
+        with self._lock:
+            return self._valores.get(self._chave(rotulos), 0)
+
+    def _linhas(self) -> List[str]:
+        with self._lock:
+            series = sorted(self._valores.items())
+        return [f"{self.nome}{_rotulos(self.rotulos, chave)} {_formatar_numero(valor)}" for chave, valor in series]
+
+
+class Histograma(Metrica):
+    """Histograma de durações (segundos) com baldes cumulativos"""
+    tipo = "histogram"
+
+    def __init__(self, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                 limites: Sequence[float] = LIMITES_LOCAIS):
+        super().__init__(nome, ajuda, rotulos)
+        self.limites = tuple(sorted(limites))
+        # por série: [contagem de cada balde (não cumulativa) + acima do último, soma]
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], List[float]]] = {}
+
+    def observar(self, valor: float, **rotulos: str):
+        if not METRICAS_ATIVO:
+            return
+        chave = self._chave(rotulos)
+        indice = next((i for i, limite in enumerate(self.limites) if valor <= limite), len(self.limites))
+        with self._lock:
+            serie = self._series.get(chave)
+            if serie is None:
+                serie = self._series[chave] = ([0] * (len(self.limites) + 1), [0.0])
+            serie[0][indice] += 1
+            serie[1][0] += valor
+
+    @contextmanager
+    def medir(self, **rotulos: str) -> Iterator[None]:
+        """with histograma.medir(rotulo=...): observa a duração do bloco (mesmo se levantar)"""
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(time.perf_counter() - inicio, **rotulos)
+
+    def contagem(self, **rotulos: str) -> int:
+        with self._lock:
+            serie = self._series.get(self._chave(rotulos))
+            return sum(serie[0]) if serie else 0
+
+    def _linhas(self) -> List[str]:
+        with self._lock:
+            series = sorted((chave, (list(baldes), soma[0])) for chave, (baldes, soma) in self._series.items())
+        linhas = []
+        for chave, (baldes, soma) in series:
+            acumulado = 0
+            for limite, quantidade in zip(self.limites + (math.inf,), baldes):
+                acumulado += quantidade
+                le = f'le="{_formatar_numero(limite)}"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, chave, le)} {acumulado}")
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, chave)} {_formatar_numero(soma)}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, chave)} {acumulado}")
+        return linhas
+
+
+class Medidor(Metrica):
+    """Valor instantâneo lido na hora da exportação (tamanho de fila, vagas em uso...)"""
+    tipo = "gauge"
+
+    def __init__(self, nome: str, ajuda: str, funcao: Callable[[], float]):
+        super().__init__(nome, ajuda)
+        self.funcao = funcao
+
+    def _linhas(self) -> List[str]:
+        try:
+            return [f"{self.nome} {_formatar_numero(float(self.funcao()))}"]
+        except Exception:
+            return []  # fonte indisponível: a série some nesta raspagem
+
+
+class RegistroMetricas:
+    """Conjunto de métricas exportadas pelo /metrics"""
+
+    def __init__(self):
+        self._metricas: Dict[str, Metrica] = {}
+        self._lock = threading.Lock()
+
+    def registrar(self, metrica: Metrica) -> Metrica:
+        with self._lock:
+            if metrica.nome in self._metricas:
+                raise ValueError(f"Métrica duplicada: {metrica.nome}")
+            self._metricas[metrica.nome] = metrica
+        return metrica
+
+    def contador(self, nome: str, ajuda: str, rotulos: Sequence[str] = ()) -> Contador:
+        return self.registrar(Contador(nome, ajuda, rotulos))
+
+    def histograma(self, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                   limites: Sequence[float] = LIMITES_LOCAIS) -> Histograma:
+        return self.registrar(Histograma(nome, ajuda, rotulos, limites))
+
+    def medidor(self, nome: str, ajuda: str, funcao: Callable[[], float]) -> Medidor:
+        return self.registrar(Medidor(nome, ajuda, funcao))
+
+    def obter(self, nome: str) -> Optional[Metrica]:
+        return self._metricas.get(nome)
+
+    def exportar(self) -> str:
+        with self._lock:
+            metricas = list(self._metricas.values())
+        return "\n".join(metrica.exportar() for metrica in metricas) + "\n"
+
+
+def rotulo_chave(api_key: str) -> str:
+    """Chave do Gemini como rótulo: só o final, nunca a chave inteira"""
+    return f"...{api_key[-4:]}"
+
+
+# Instância global usada pela API
+metricas = RegistroMetricas()
+
+# ✅ EXTRAÇÃO
+tempo_gravacao_imagem = metricas.histograma(
+    "smartspend_imagem_gravacao_segundos",
+    "Gravação da imagem enviada (upload em disco e armazenamento definitivo)", ("etapa",))
+tempo_preprocessamento = metricas.histograma(
+    "smartspend_preprocessamento_segundos", "Pré-processamento da imagem antes do modelo")
+tempo_gemini = metricas.histograma(
+    "smartspend_gemini_latencia_segundos", "Chamada ao Gemini por chave e modelo",
+    ("chave", "modelo", "resultado"), LIMITES_MODELO)
+tempo_json_parse = metricas.histograma(
+    "smartspend_json_parse_segundos", "Validação/reparo do JSON devolvido pelo modelo", ("resultado",))
+falhas_gemini = metricas.contador(
+    "smartspend_gemini_falhas_total",
+    "Falhas do Gemini por tipo (cota = chave esgotada, modelo = 404 e troca de modelo)", ("tipo", "modelo"))
+respostas_modelo = metricas.contador(
+    "smartspend_respostas_modelo_total",
+    "Respostas do modelo por resultado do parse (validas, reparadas, invalidas)", ("resultado",))
+analises_notas = metricas.contador(
+    "smartspend_analises_total", "Notas analisadas por origem (cache, qrcode, modelo) e resultado",
+    ("origem", "resultado"))
+
+# ✅ BANCO E DASHBOARD
+tempo_db_commit = metricas.histograma(
+    "smartspend_db_commit_segundos", "Commit no banco por operação", ("operacao",))
+tempo_dashboard = metricas.histograma(
+    "smartspend_dashboard_calculo_segundos", "Montagem do /dashboard (consultas + serialização) sem cache")
+respostas_dashboard = metricas.contador(
+    "smartspend_dashboard_respostas_total", "Respostas do /dashboard por origem (HIT, MISS, 304)", ("origem",))
+
+# ✅ HTTP
+tempo_http = metricas.histograma(
+    "smartspend_http_requisicao_segundos", "Duração das requisições por rota e status",
+    ("metodo", "rota", "status"), LIMITES_LOCAIS + (10.0, 30.0, 60.0))
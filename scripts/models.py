@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Text
+from datetime import datetime
+from sqlalchemy import BigInteger, Column, Integer, String, Float, ForeignKey, Text, Date, DateTime, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from database import Base
 
@@ -21,14 +22,22 @@ class Nota(Base):
     Modelo de nota fiscal
     """
     __tablename__ = "notas"
+    __table_args__ = (
+        # Feed, filtros por período e "compras do mês" são range queries por usuário
+        Index("ix_notas_user_data_compra", "user_id", "data_compra"),
+    )
     
     id = Column(String, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     mercado = Column(String)
-    data = Column(String)  # Formato: DD/MM/YYYY
+    data = Column(String)  # Formato: DD/MM/YYYY (texto exibido no frontend)
+    data_compra = Column(Date)  # Data real da compra (ordenação e filtros)
     total = Column(Float)
     categoria = Column(String)
-    itens = Column(Text)  # JSON serializado dos itens
+    itens = Column(Text)  # JSON serializado dos itens (legado: itens novos vão para a tabela `itens`)
+    imagem_hash = Column(String, index=True)  # SHA-256 da imagem original (deduplicação)
+    imagem_chave = Column(String)  # chave da foto no armazenamento (originais/ab/<sha256>.jpg)
+    chave_acesso = Column(String, index=True)  # chave de 44 dígitos da NFC-e, quando lida do QR code
     
     # Relacionamento com usuário
     user = relationship("User", back_populates="notas")
@@ -36,16 +45,85 @@ class Nota(Base):
 class Item(Base):
     """
     Modelo de item individual de uma nota fiscal
-    (Opcional - pode ser usado se quiser separar itens em tabela própria)
+    (uma linha por produto; substitui o JSON em Nota.itens)
     """
     __tablename__ = "itens"
     
     id = Column(Integer, primary_key=True, index=True)
-    nota_id = Column(String, ForeignKey("notas.id"))
-    nome = Column(String)
+    nota_id = Column(String, ForeignKey("notas.id"), index=True)
+    nome = Column(String, index=True)
     valor = Column(Float)
-    quantidade = Column(Integer)
-    categoria = Column(String)
+    quantidade = Column(Float)  # pode ser fracionária (ex: 1.5 kg)
+    categoria = Column(String, index=True)
     
     # Relacionamento com nota
-    nota = relationship("Nota")
\ No newline at end of file
+    nota = relationship("Nota")
+
+class Job(Base):
+    """
+    Job de análise assíncrona de nota fiscal (fila persistida no SQLite)
+    """
+    __tablename__ = "jobs"
+    
+    id = Column(String, primary_key=True, index=True)
+    status = Column(String, index=True)  # pendente, processando, concluido, erro
+    etapa = Column(String)  # etapa atual do pipeline (ex: analisando, salvando)
+    arquivo = Column(String)  # chave da imagem no armazenamento (caminho em uploads/ nos jobs antigos)
+    content_type = Column(String)
+    resultado = Column(Text)  # JSON da nota analisada
+    erro = Column(Text)
+    dono = Column(String)  # worker (réplica/processo) que detém o job em processamento
+    criado_em = Column(DateTime, default=datetime.now)
+    atualizado_em = Column(DateTime, default=datetime.now, onupdate=datetime.now)  # batimento do dono
+
+
+class CacheAnalise(Base):
+    """
+    Cache de análises do Gemini por usuário, endereçado pelo SHA-256 exato
+    da imagem (a tabela antiga `cache_analises`, global e com busca
+    perceptual, deixou de ser usada)
+    """
+    __tablename__ = "cache_analises_usuario"
+    __table_args__ = (
+        UniqueConstraint("user_id", "sha256", name="uq_cache_analise_user_sha256"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    sha256 = Column(String)  # hash exato dos bytes enviados
+    resultado = Column(Text)  # JSON retornado pelo modelo
+    hits = Column(Integer, default=0)
+    criado_em = Column(DateTime, default=datetime.now)
+    ultimo_acesso = Column(DateTime, default=datetime.now, index=True)
+
+
+class AgregadoMensal(Base):
+    """
+    Totais pré-calculados do dashboard por usuário, mês e categoria.
+    Atualizado na mesma transação em que notas são salvas ou excluídas.
+    """
+    __tablename__ = "agregados_mensais"
+    __table_args__ = (
+        UniqueConstraint("user_id", "mes", "categoria", name="uq_agregado_user_mes_categoria"),
+    )
+    
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    mes = Column(String)  # Formato: YYYY-MM
+    categoria = Column(String)
+    valor_itens = Column(Float, default=0.0)  # soma dos itens desta categoria
+    quantidade_itens = Column(Integer, default=0)
+    valor_notas = Column(Float, default=0.0)  # soma das notas cuja categoria principal é esta
+    quantidade_notas = Column(Integer, default=0)
+
+
+class VersaoDashboard(Base):
+    """
+    Versão dos dados do dashboard por usuário (chave do cache e ETag).
+    Incrementada na mesma transação em que notas são salvas ou excluídas,
+    então todos os processos e réplicas enxergam a mesma versão.
+    """
+    __tablename__ = "versoes_dashboard"
+    
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    versao = Column(BigInteger, nullable=False)  # começa no instante (ms) da criação
@@ -0,0 +1,208 @@
+"""
+Caminho rápido para NFC-e/NF-e: leitura local do QR code (ou do código de
+barras da chave de acesso) antes de chamar o modelo.
+
+A chave de acesso (44 dígitos, dígito verificador módulo 11) traz UF,
+ano/mês de emissão, CNPJ do emitente, modelo, série e número. O QR da
+NFC-e versão 1 e o de emissão em contingência (offline) trazem também a
+data e o valor total; nesses casos o cabeçalho da nota sai direto do QR e
+o Gemini só precisa ler os itens (ou nem é chamado, com NFCE_SEM_ITENS=1).
+O QR online da versão 2/3 só tem a chave: o modelo extrai tudo, e a chave
+serve para conferir o mês e deduplicar a nota.
+
+Decodificação com zxing-cpp (opcional: pip install zxing-cpp); sem ele o
+caminho rápido fica desligado e tudo segue pelo modelo.
+"""
+import io
+import os
+import re
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+from urllib.parse import parse_qs, urlparse
+
+from PIL import Image, ImageOps
+
+try:
+    import zxingcpp
+except ImportError:  # leitura de QR é opcional
+    zxingcpp = None
+
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+# ✅ CONFIGURAÇÃO DO CAMINHO RÁPIDO NFC-e
+NFCE_QR_ATIVO = os.getenv("NFCE_QR_ATIVO", "1") == "1"
+NFCE_SEM_ITENS = os.getenv("NFCE_SEM_ITENS", "0") == "1"  # QR completo dispensa o modelo (nota sem itens)
+NFCE_MAX_LADO = int(os.getenv("NFCE_MAX_LADO", "2000"))  # fotos maiores são reduzidas antes da leitura
+
+UFS = {
+    "11": "RO", "12": "AC", "13": "AM", "14": "RR", "15": "PA", "16": "AP", "17": "TO",
+    "21": "MA", "22": "PI", "23": "CE", "24": "RN", "25": "PB", "26": "PE", "27": "AL",
+    "28": "SE", "29": "BA", "31": "MG", "32": "ES", "33": "RJ", "35": "SP", "41": "PR",
+    "42": "SC", "43": "RS", "50": "MS", "51": "MT", "52": "GO", "53": "DF",
+}
+MODELOS = {"55": "NF-e", "65": "NFC-e"}
+
+
+def digito_verificador(chave43: str) -> int:
+    """Dígito módulo 11 da chave de acesso (pesos 2..9 da direita para a esquerda)"""
+    soma = sum(int(digito) * (2 + i % 8) for i, digito in enumerate(reversed(chave43)))
+    resto = soma % 11
+    return 0 if resto < 2 else 11 - resto
+
+
+def chave_valida(chave: str) -> bool:
+    return (len(chave) == 44 and chave.isdigit() and chave[:2] in UFS
+            and 1 <= int(chave[4:6]) <= 12 and digito_verificador(chave[:43]) == int(chave[43]))
+
+
+def formatar_cnpj(cnpj: str) -> str:
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+
+def interpretar_chave(chave: str) -> Dict[str, Any]:
+    """Campos da chave: cUF AAMM CNPJ mod série nNF tpEmis cNF cDV"""
+    return {
+        "chave": chave,
+        "uf": UFS[chave[:2]],
+        "ano_mes": f"20{chave[2:4]}-{chave[4:6]}",
+        "cnpj": formatar_cnpj(chave[6:20]),
+        "modelo": MODELOS.get(chave[20:22], chave[20:22]),
+        "serie": int(chave[22:25]),
+        "numero": int(chave[25:34]),
+        "contingencia": chave[34] != "1",
+    }
+
+
+def _valor(texto: Optional[str]) -> Optional[float]:
+    try:
+        return round(float(texto), 2)
+    except (TypeError, ValueError):
+        return None
+
+
+def interpretar_qrcode(conteudo: str) -> Optional[Dict[str, Any]]:
+    """
+    Conteúdo do QR da NFC-e (ou a própria chave em código de barras) ->
+    dados da chave + `data` (YYYY-MM-DD) e `total` quando o QR os traz.
+    """
+    conteudo = conteudo.strip()
+    digitos = re.sub(r"\D", "", conteudo)
+    if len(digitos) == 44 and len(conteudo) <= 60:
+        # Código de barras / texto só com a chave
+        return interpretar_chave(digitos) if chave_valida(digitos) else None
+
+    parametros = parse_qs(urlparse(conteudo).query)
+    data, total = None, None
+    if "chNFe" in parametros:
+        # Versão 1: chNFe=...&dhEmi=<data em hex>&vNF=...
+        chave = parametros["chNFe"][0]
+        try:
+            emissao = bytes.fromhex(parametros.get("dhEmi", [""])[0]).decode()
+            data = datetime.fromisoformat(emissao[:19]).strftime("%Y-%m-%d")
+        except ValueError:
+            pass
+        total = _valor(parametros.get("vNF", [None])[0])
+    elif "p" in parametros:
+        # Versões 2/3: p=chave|versão|ambiente|...; em contingência |dia|vNF|...
+        partes = parametros["p"][0].split("|")
+        chave = partes[0]
+        if len(partes) >= 5 and partes[3].isdigit() and len(partes[3]) <= 2 and _valor(partes[4]) is not None:
+            data = f"20{chave[2:4]}-{chave[4:6]}-{int(partes[3]):02d}"
+            total = _valor(partes[4])
+    else:
+        return None
+
+    if not chave_valida(chave):
+        return None
+    dados = interpretar_chave(chave)
+    try:
+        dados["data"] = datetime.strptime(data, "%Y-%m-%d").strftime("%Y-%m-%d") if data else None
+    except ValueError:
+        dados["data"] = None
+    dados["total"] = total
+    return dados
+
+
+def _abrir(origem: Union[bytes, str]) -> Image.Image:
+    img = Image.open(io.BytesIO(origem) if isinstance(origem, (bytes, bytearray)) else origem)
+    img.draft("L", (NFCE_MAX_LADO, NFCE_MAX_LADO))
+    img = ImageOps.exif_transpose(img).convert("L")
+    img.thumbnail((NFCE_MAX_LADO, NFCE_MAX_LADO))
+    return img
+
+
+def ler_codigos(origem: Union[bytes, str]) -> List[str]:
+    """Textos dos QR codes e códigos de barras da foto"""
+    if zxingcpp is None:
+        return []
+    formatos = zxingcpp.barcode_formats_from_str("QRCode,Code128")
+    return [codigo.text for codigo in zxingcpp.read_barcodes(_abrir(origem), formats=formatos)]
+
+
+def ler_nfce(origem: Union[bytes, str]) -> Optional[Dict[str, Any]]:
+    """Dados da NFC-e lidos localmente, ou None (sem QR/chave legível ou desligado)"""
+    if not NFCE_QR_ATIVO or zxingcpp is None:
+        return None
+    try:
+        codigos = ler_codigos(origem)
+    except Exception as e:
+        log.warning("Falha ao ler QR code: %s", e)
+        return None
+    melhor = None
+    for conteudo in codigos:
+        dados = interpretar_qrcode(conteudo)
+        # Prefere o QR com data/total ao código de barras só com a chave
+        if dados and (melhor is None or (dados.get("total") is not None and melhor.get("total") is None)):
+            melhor = dados
+    return melhor
+
+
+def cabecalho_completo(dados: Optional[Dict[str, Any]]) -> bool:
+    """O QR trouxe data e total: o modelo só precisa dos itens"""
+    return bool(dados and dados.get("data") and dados.get("total") is not None)
+
+
+def categoria_dominante(itens: List[Dict[str, Any]]) -> str:
+    """Categoria com maior valor somado entre os itens"""
+    somas: Dict[str, float] = {}
+    for item in itens:
+        categoria = item.get("categoria") or "Outros"
+        somas[categoria] = somas.get(categoria, 0.0) + float(item.get("valor") or 0)
+    return max(somas, key=somas.get) if somas else "Outros"
+
+
+def montar_nota(dados: Dict[str, Any], extraido: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Nota no formato da extração com data e total vindos do QR; mercado e
+    itens do modelo (`extraido`), se ele foi chamado
+    """
+    extraido = extraido or {}
+    itens = extraido.get("itens", [])
+    return {
+        "mercado": extraido.get("mercado") or f"CNPJ {dados['cnpj']}",
+        "data": dados["data"],
+        "total": dados["total"],
+        "categoria": categoria_dominante(itens),
+        "itens": itens,
+        "nfce": {campo: dados[campo] for campo in ("chave", "cnpj", "uf", "modelo")},
+    }
+
+
+def conferir_com_chave(nota: Dict[str, Any], dados: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    QR só com a chave: anexa os dados da NFC-e à extração do modelo e
+    corrige a data se ela cair fora do mês de emissão gravado na chave
+    """
+    nota["nfce"] = {campo: dados[campo] for campo in ("chave", "cnpj", "uf", "modelo")}
+    data = str(nota.get("data") or "")
+    if not data.startswith(dados["ano_mes"]):
+        dia = data[8:10] if len(data) == 10 and data[8:10].isdigit() else "01"
+        try:
+            nota["data"] = datetime.strptime(f"{dados['ano_mes']}-{dia}", "%Y-%m-%d").strftime("%Y-%m-%d")
+        except ValueError:
+            nota["data"] = f"{dados['ano_mes']}-01"
+        log.info("Data da extração fora do mês da chave NFC-e", extra={"data_extraida": data or None,
+                                                                          "data_usada": nota['data']})
+    return nota
@@ -0,0 +1,60 @@
+"""
+Paginação por cursor (keyset) do feed de compras.
+O cursor guarda a chave de ordenação do último item entregue, então cada
+página continua de onde a anterior parou em vez de usar OFFSET sobre a lista inteira.
+"""
+import base64
+import json
+from datetime import date
+from typing import Optional, Tuple, List
+
+from fastapi import HTTPException
+from sqlalchemy import or_, and_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Nota
+from datas import filtrar_periodo
+
+LIMITE_PADRAO = 20
+LIMITE_MAXIMO = 100
+
+
+def codificar_cursor(chave: date, nota_id: str) -> str:
+    bruto = json.dumps([chave.isoformat(), nota_id]).encode()
+    return base64.urlsafe_b64encode(bruto).decode().rstrip("=")
+
+
+def decodificar_cursor(cursor: str) -> Tuple[date, str]:
+    try:
+        preenchido = cursor + "=" * (-len(cursor) % 4)
+        chave, nota_id = json.loads(base64.urlsafe_b64decode(preenchido))
+        return date.fromisoformat(chave), str(nota_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+
+async def buscar_pagina(db: AsyncSession, user_id: int, limite: int, cursor: Optional[str] = None,
+                        inicio: Optional[date] = None, fim: Optional[date] = None) -> Tuple[List[Nota], Optional[str]]:
+    """
+    Retorna (notas da página, cursor da próxima página ou None),
+    da compra mais recente para a mais antiga, opcionalmente dentro do período.
+    Percorre o índice (user_id, data_compra).
+    """
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+
+    query = filtrar_periodo(select(Nota).where(Nota.user_id == user_id), inicio, fim)
+    if cursor:
+        chave_cursor, id_cursor = decodificar_cursor(cursor)
+        query = query.where(or_(
+            Nota.data_compra < chave_cursor,
+            and_(Nota.data_compra == chave_cursor, Nota.id < id_cursor)
+        ))
+
+    notas = list(await db.scalars(query.order_by(Nota.data_compra.desc(), Nota.id.desc()).limit(limite + 1)))
+
+    proximo = None
+    if len(notas) > limite:
+        notas = notas[:limite]
+        proximo = codificar_cursor(notas[-1].data_compra, notas[-1].id)
+
+    return notas, proximo
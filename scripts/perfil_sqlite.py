@@ -0,0 +1,85 @@
+"""
+Perfil de desempenho do SQLite (engine compartilhada do processo da API).
+Aplica WAL, synchronous=NORMAL, cache de páginas, mmap e busy timeout em
+cada conexão nova via evento `connect`, e usa um pool de conexões de tamanho
+fixo. Com WAL, leituras do dashboard não esperam o commit dos uploads.
+"""
+import os
+from typing import Dict, Any
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.pool import QueuePool
+
+# ✅ CONFIGURAÇÃO DO PERFIL (SQLITE_PERFIL=padrao desliga os pragmas)
+SQLITE_PERFIL = os.getenv("SQLITE_PERFIL", "otimizado")
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")  # NORMAL é seguro com WAL
+SQLITE_CACHE_MB = int(os.getenv("SQLITE_CACHE_MB", "64"))
+SQLITE_MMAP_MB = int(os.getenv("SQLITE_MMAP_MB", "256"))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "8"))
+SQLITE_POOL_TIMEOUT = float(os.getenv("SQLITE_POOL_TIMEOUT", "30"))
+
+
+def pragmas_perfil() -> Dict[str, Any]:
+    """Pragmas aplicados em cada conexão (cache_size negativo = KiB)"""
+    return {
+        "journal_mode": SQLITE_JOURNAL_MODE,
+        "synchronous": SQLITE_SYNCHRONOUS,
+        "cache_size": -SQLITE_CACHE_MB * 1024,
+        "mmap_size": SQLITE_MMAP_MB * 1024 * 1024,
+        "busy_timeout": SQLITE_BUSY_TIMEOUT_MS,
+    }
+
+
+def _aplicar_pragmas(dbapi_conn, connection_record):
+    cursor = dbapi_conn.cursor()
+    try:
+        for nome, valor in pragmas_perfil().items():
+            cursor.execute(f"PRAGMA {nome}={valor}")
+    finally:
+        cursor.close()
+
+
+def criar_engine_sqlite(url: str, perfil: str = None) -> Engine:
+    """
+    Engine SQLite com o perfil configurado.
+    `perfil="padrao"` devolve a engine sem ajustes (usado no benchmark).
+    """
+    perfil = perfil or SQLITE_PERFIL
+    if perfil == "padrao":
+        return create_engine(url, connect_args={"check_same_thread": False})
+
+    engine = create_engine(
+        url,
+        connect_args={
+            "check_same_thread": False,  # Necessário para SQLite
+            "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000
+        },
+        poolclass=QueuePool,
+        pool_size=SQLITE_POOL_SIZE,
+        max_overflow=SQLITE_MAX_OVERFLOW,
+        pool_timeout=SQLITE_POOL_TIMEOUT
+    )
+    event.listen(engine, "connect", _aplicar_pragmas)
+    return engine
+
+
+def criar_engine_sqlite_assincrona(url: str, perfil: str = None) -> AsyncEngine:
+    """Mesma configuração para a engine assíncrona (sqlite+aiosqlite)"""
+    perfil = perfil or SQLITE_PERFIL
+    if perfil == "padrao":
+        return create_async_engine(url)
+
+    engine = create_async_engine(
+        url,
+        connect_args={"timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+        pool_size=SQLITE_POOL_SIZE,
+        max_overflow=SQLITE_MAX_OVERFLOW,
+        pool_timeout=SQLITE_POOL_TIMEOUT
+    )
+    event.listen(engine.sync_engine, "connect", _aplicar_pragmas)
+    return engine
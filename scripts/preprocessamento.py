@@ -0,0 +1,174 @@
+"""
+Pré-processamento das fotos de notas antes do envio ao Gemini.
+Fotos de celular de 12 MP viram um JPEG/WebP em tons de cinza de poucas
+centenas de KB, com orientação corrigida e recorte na área do papel.
+"""
+import io
+import os
+import time
+from typing import Dict, Any, Optional, Tuple, Union
+
+from PIL import Image, ImageOps, ImageFilter
+
+from ingestao import detectar_tipo_imagem
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+# ✅ CONFIGURAÇÃO DO PRÉ-PROCESSAMENTO
+PREPROC_ATIVO = os.getenv("PREPROC_ATIVO", "1") == "1"
+PREPROC_MAX_LADO = int(os.getenv("PREPROC_MAX_LADO", "1600"))  # maior lado em pixels
+PREPROC_FORMATO = os.getenv("PREPROC_FORMATO", "JPEG").upper()  # JPEG ou WEBP
+PREPROC_QUALIDADE = int(os.getenv("PREPROC_QUALIDADE", "80"))
+PREPROC_RECORTE = os.getenv("PREPROC_RECORTE", "1") == "1"
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+# O recorte só é aplicado se a área do papel ocupar ao menos esta fração da foto
+AREA_MINIMA_RECORTE = 0.2
+MARGEM_RECORTE = 0.02
+# Lado da máscara usada para achar o papel (a busca de componentes é em Python puro)
+LADO_MASCARA = 160
+
+
+def _maior_componente(mascara: Image.Image) -> Optional[Tuple[int, int, int, int]]:
+    """Caixa (esquerda, topo, direita, base) do maior componente claro 4-conexo da máscara"""
+    largura, altura = mascara.size
+    claros = bytearray(1 if p else 0 for p in mascara.getdata())
+    melhor_tamanho, melhor_caixa = 0, None
+    for inicio in range(len(claros)):
+        if not claros[inicio]:
+            continue
+        claros[inicio] = 0
+        pilha = [inicio]
+        tamanho = 0
+        esquerda, topo, direita, base = largura, altura, 0, 0
+        while pilha:
+            posicao = pilha.pop()
+            y, x = divmod(posicao, largura)
+            tamanho += 1
+            esquerda, direita = min(esquerda, x), max(direita, x)
+            topo, base = min(topo, y), max(base, y)
+            for vizinho, valido in ((posicao - 1, x > 0), (posicao + 1, x < largura - 1),
+                                    (posicao - largura, y > 0), (posicao + largura, y < altura - 1)):
+                if valido and claros[vizinho]:
+                    claros[vizinho] = 0
+                    pilha.append(vizinho)
+        if tamanho > melhor_tamanho:
+            melhor_tamanho, melhor_caixa = tamanho, (esquerda, topo, direita + 1, base + 1)
+    return melhor_caixa
+
+
+def _recortar_papel(img: Image.Image) -> Image.Image:
+    """
+    Recorte ciente da nota: o papel é a região clara da foto. Binariza uma
+    miniatura pela média de brilho e usa a caixa do maior componente claro
+    conexo, então uma luminária ou outro objeto claro separado do papel não
+    alarga o recorte. Fundo claro encostado no papel forma um componente só
+    com ele; aí a caixa cobre os dois (ou a foto toda, e nada é recortado).
+    """
+    miniatura = img.copy()
+    miniatura.thumbnail((LADO_MASCARA, LADO_MASCARA))
+    miniatura = miniatura.filter(ImageFilter.MedianFilter(5))
+    pixels = list(miniatura.getdata())
+    media = sum(pixels) / len(pixels)
+    # MaxFilter fecha as linhas de texto escuro, que partiriam o papel em faixas
+    mascara = miniatura.point(lambda p: 255 if p > media else 0).filter(ImageFilter.MaxFilter(3))
+    caixa = _maior_componente(mascara)
+    if not caixa:
+        return img
+
+    esquerda, topo, direita, base = caixa
+    area = (direita - esquerda) * (base - topo)
+    if area < AREA_MINIMA_RECORTE * miniatura.width * miniatura.height:
+        return img
+
+    escala_x = img.width / miniatura.width
+    escala_y = img.height / miniatura.height
+    margem_x = img.width * MARGEM_RECORTE
+    margem_y = img.height * MARGEM_RECORTE
+    return img.crop((
+        max(0, int(esquerda * escala_x - margem_x)),
+        max(0, int(topo * escala_y - margem_y)),
+        min(img.width, int(direita * escala_x + margem_x)),
+        min(img.height, int(base * escala_y + margem_y))
+    ))
+
+
+def _original(origem: Union[bytes, str]) -> bytes:
+    if isinstance(origem, (bytes, bytearray)):
+        return bytes(origem)
+    with open(origem, "rb") as f:
+        return f.read()
+
+
+def _mime_original(origem: Union[bytes, str]) -> str:
+    """Tipo real da foto pelos primeiros bytes (a mesma detecção da ingestão)"""
+    if isinstance(origem, (bytes, bytearray)):
+        cabecalho = bytes(origem[:32])
+    else:
+        with open(origem, "rb") as f:
+            cabecalho = f.read(32)
+    return detectar_tipo_imagem(cabecalho) or "image/jpeg"
+
+
+def preprocessar_imagem(origem: Union[bytes, str]) -> Tuple[bytes, str, Dict[str, Any]]:
+    """
+    Retorna (bytes otimizados, mime type, estatísticas).
+    `origem` pode ser os bytes da foto ou o caminho do upload em disco; neste
+    caso o PIL lê direto do arquivo e os bytes originais só são carregados
+    se for preciso enviá-los.
+    Se algo falhar, ou o resultado não ficar menor, devolve a imagem original
+    com o tipo detectado pelos primeiros bytes (GIF, BMP, TIFF... não viram JPEG).
+    """
+    inicio = time.perf_counter()
+    em_memoria = isinstance(origem, (bytes, bytearray))
+    tamanho_bytes = len(origem) if em_memoria else os.path.getsize(origem)
+    mime_original = _mime_original(origem)
+
+    if not PREPROC_ATIVO:
+        return _original(origem), mime_original, {"ativo": False, "bytes_original": tamanho_bytes}
+
+    try:
+        with Image.open(io.BytesIO(origem) if em_memoria else origem) as original:
+            tamanho_original = original.size
+
+            # JPEG: decodifica já reduzido (escala 1/2, 1/4, 1/8), bem mais rápido
+            original.draft("RGB", (PREPROC_MAX_LADO, PREPROC_MAX_LADO))
+
+            # 1. Orientação pela tag EXIF (fotos de celular vêm "deitadas")
+            img = ImageOps.exif_transpose(original)
+
+            # 2. Tons de cinza + normalização de contraste (imagem nova, o arquivo já pode fechar)
+            img = ImageOps.autocontrast(img.convert("L"), cutoff=1)
+
+        # 3. Recorte na área do papel
+        if PREPROC_RECORTE:
+            img = _recortar_papel(img)
+
+        # 4. Redução para o maior lado configurado
+        img.thumbnail((PREPROC_MAX_LADO, PREPROC_MAX_LADO), Image.Resampling.LANCZOS)
+
+        # 5. Recodificação otimizada
+        saida = io.BytesIO()
+        if PREPROC_FORMATO == "WEBP":
+            img.save(saida, "WEBP", quality=PREPROC_QUALIDADE, method=4)
+        else:
+            img.save(saida, "JPEG", quality=PREPROC_QUALIDADE, optimize=True, progressive=True)
+        dados = saida.getvalue()
+    except Exception as e:
+        log.warning("Pré-processamento falhou, enviando original: %s", e)
+        return _original(origem), mime_original, {"ativo": True, "erro": str(e), "bytes_original": tamanho_bytes}
+
+    estatisticas = {
+        "ativo": True,
+        "bytes_original": tamanho_bytes,
+        "bytes_enviados": min(len(dados), tamanho_bytes),
+        "dimensoes_original": list(tamanho_original),
+        "dimensoes_enviadas": list(img.size),
+        "tempo_ms": round((time.perf_counter() - inicio) * 1000, 1)
+    }
+
+    if len(dados) >= tamanho_bytes:
+        return _original(origem), mime_original, estatisticas
+    return dados, MIME_TYPES.get(PREPROC_FORMATO, "image/jpeg"), estatisticas
@@ -0,0 +1,339 @@
+"""
+Rastreamento (tracing) por requisição, compatível com OpenTelemetry.
+Cada requisição vira um trace: o span do servidor (middleware) e, abaixo
+dele, upload -> analisar_nota -> uma tentativa por par chave/modelo ->
+salvar_nota_no_banco. Os spans terminados vão para uma fila e uma thread
+própria grava lotes no formato OTLP/JSON (uma ExportTraceServiceRequest
+por linha), o mesmo lido pelo receiver `otlpjsonfile` do OpenTelemetry
+Collector. RASTREAMENTO_SAIDA=console escreve as linhas no stdout.
+
+Desligado (padrão), span() devolve um objeto nulo compartilhado: nenhum
+ID, relógio ou contextvar é tocado. O contexto W3C `traceparent` recebido
+no cabeçalho é respeitado, e a amostragem é decidida na raiz do trace.
+"""
+import asyncio
+import atexit
+import contextvars
+import functools
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from registro import obter_logger
+from serializacao import dumps
+
+log = obter_logger(__name__)
+
+# ✅ CONFIGURAÇÃO DO RASTREAMENTO (desligado por padrão)
+RASTREAMENTO_ATIVO = os.getenv("RASTREAMENTO_ATIVO", "0") == "1"
+RASTREAMENTO_SAIDA = os.getenv("RASTREAMENTO_SAIDA", "arquivo").lower()  # arquivo | console
+RASTREAMENTO_ARQUIVO = os.getenv("RASTREAMENTO_ARQUIVO", os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data', 'rastreamento.jsonl'))
+RASTREAMENTO_AMOSTRAGEM = float(os.getenv("RASTREAMENTO_AMOSTRAGEM", "1"))  # fração dos traces gravados
+RASTREAMENTO_SERVICO = os.getenv("RASTREAMENTO_SERVICO", "smartspend-api")
+RASTREAMENTO_FILA_MAX = int(os.getenv("RASTREAMENTO_FILA_MAX", "10000"))  # spans esperando a thread
+
+# Tipos de span do OTLP (SpanKind)
+TIPO_INTERNO = 1
+TIPO_SERVIDOR = 2
+
+# Status do OTLP
+STATUS_OK = 1
+STATUS_ERRO = 2
+
+ESCOPO = "smartspend"
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+# Span em andamento na tarefa/thread atual (tarefas filhas herdam a cópia do contexto)
+_span_atual: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("span_atual", default=None)
+
+
+def ler_traceparent(valor: Optional[str]) -> Optional[Tuple[str, str, bool]]:
+    """Cabeçalho W3C traceparent -> (trace_id, span_id pai, amostrado); None se inválido"""
+    encontrado = _TRACEPARENT.match((valor or "").strip().lower())
+    if not encontrado:
+        return None
+    trace_id, span_id, flags = encontrado.groups()
+    if trace_id == "0" * 32 or span_id == "0" * 16:
+        return None
+    return trace_id, span_id, bool(int(flags, 16) & 1)
+
+
+def _atributo_otlp(chave: str, valor: Any) -> Dict[str, Any]:
+    if isinstance(valor, bool):
+        return {"key": chave, "value": {"boolValue": valor}}
+    if isinstance(valor, int):
+        return {"key": chave, "value": {"intValue": str(valor)}}  # int64 vai como string no OTLP/JSON
+    if isinstance(valor, float):
+        return {"key": chave, "value": {"doubleValue": valor}}
+    return {"key": chave, "value": {"stringValue": str(valor)}}
+
+
+class SpanNulo:
+    """Span que não grava nada (rastreamento desligado ou trace fora da amostra)"""
+    gravando = False
+    trace_id = None
+    traceparent = None
+
+    def definir(self, chave: str, valor: Any):
+        pass
+
+    def definir_atributos(self, atributos: Dict[str, Any]):
+        pass
+
+    def renomear(self, nome: str):
+        pass
+
+    def __enter__(self) -> "SpanNulo":
+        return self
+
+    def __exit__(self, tipo, erro, tb) -> bool:
+        return False
+
+
+SPAN_NULO = SpanNulo()
+
+
+class RaizNaoAmostrada(SpanNulo):
+    """Raiz de um trace fora da amostra: fica no contexto para os filhos também não gravarem"""
+
+    def __enter__(self) -> "RaizNaoAmostrada":
+        self._token = _span_atual.set(self)
+        return self
+
+    def __exit__(self, tipo, erro, tb) -> bool:
+        _span_atual.reset(self._token)
+        return False
+
+
+class Span:
+    """Um trecho do trace; exportado quando o bloco `with` termina"""
+    gravando = True
+
+    def __init__(self, rastreador: "Rastreador", nome: str, trace_id: str, pai_id: Optional[str],
+                 tipo: int, atributos: Optional[Dict[str, Any]]):
+        self.rastreador = rastreador
+        self.nome = nome
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.pai_id = pai_id
+        self.tipo = tipo
+        self.atributos: Dict[str, Any] = dict(atributos or {})
+        self.eventos: List[Dict[str, Any]] = []
+        self.status: Optional[Tuple[int, str]] = None
+        self.inicio_ns = 0
+        self.fim_ns = 0
+        self._token = None
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def definir(self, chave: str, valor: Any):
+        if valor is not None:
+            self.atributos[chave] = valor
+
+    def definir_atributos(self, atributos: Dict[str, Any]):
+        for chave, valor in atributos.items():
+            self.definir(chave, valor)
+
+    def renomear(self, nome: str):
+        self.nome = nome
+
+    def registrar_erro(self, erro: BaseException):
+        """Evento `exception` (convenção semântica do OpenTelemetry) + status de erro"""
+        self.eventos.append({
+            "timeUnixNano": str(time.time_ns()),
+            "name": "exception",
+            "attributes": [_atributo_otlp("exception.type", type(erro).__name__),
+                           _atributo_otlp("exception.message", str(getattr(erro, "detail", None) or erro)[:500])],
+        })
+        self.status = (STATUS_ERRO, type(erro).__name__)
+
+    def __enter__(self) -> "Span":
+        self.inicio_ns = time.time_ns()
+        self._token = _span_atual.set(self)
+        return self
+
+    def __exit__(self, tipo, erro, tb) -> bool:
+        self.fim_ns = time.time_ns()
+        if isinstance(erro, asyncio.CancelledError):
+            self.definir("cancelado", True)  # perdedora do hedge, cliente desconectou...
+        elif erro is not None:
+            self.registrar_erro(erro)
+        _span_atual.reset(self._token)
+        self.rastreador.exportar(self)
+        return False
+
+    def para_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.nome,
+            "kind": self.tipo,
+            "startTimeUnixNano": str(self.inicio_ns),
+            "endTimeUnixNano": str(self.fim_ns),
+            "attributes": [_atributo_otlp(chave, valor) for chave, valor in self.atributos.items()],
+        }
+        if self.pai_id:
+            span["parentSpanId"] = self.pai_id
+        if self.eventos:
+            span["events"] = self.eventos
+        if self.status:
+            span["status"] = {"code": self.status[0], "message": self.status[1]}
+        return span
+
+
+class Rastreador:
+    """
+    Cria os spans e mantém a fila + thread que os grava. A thread só sobe
+    no primeiro span exportado; com a fila cheia o span é descartado (e
+    contado) em vez de segurar a requisição.
+    """
+
+    def __init__(self, ativo: bool = RASTREAMENTO_ATIVO, saida: str = RASTREAMENTO_SAIDA,
+                 arquivo: str = RASTREAMENTO_ARQUIVO, amostragem: float = RASTREAMENTO_AMOSTRAGEM):
+        self.ativo = ativo
+        self.saida = "console" if saida == "console" else "arquivo"
+        self.arquivo = arquivo
+        self.amostragem = amostragem
+        self._fila: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=RASTREAMENTO_FILA_MAX)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.stats = {"exportados": 0, "descartados": 0, "lotes": 0, "erros": 0}
+
+    def span(self, nome: str, atributos: Optional[Dict[str, Any]] = None, tipo: int = TIPO_INTERNO,
+             pai: Optional[str] = None):
+        """
+        Novo span filho do span atual (use com `with`). `pai` é um traceparent
+        W3C para continuar um trace vindo de fora (cabeçalho, job enfileirado).
+        """
+        if not self.ativo:
+            return SPAN_NULO
+        atual = _span_atual.get()
+        contexto = ler_traceparent(pai) if pai else None
+        if contexto is not None:
+            trace_id, pai_id, amostrado = contexto
+            if not amostrado:
+                return RaizNaoAmostrada()
+        elif atual is not None:
+            if not atual.gravando:
+                return SPAN_NULO  # a raiz não amostrada já está no contexto
+            trace_id, pai_id = atual.trace_id, atual.span_id
+        else:
+            if random.random() >= self.amostragem:
+                return RaizNaoAmostrada()
+            trace_id, pai_id = f"{random.getrandbits(128):032x}", None
+        return Span(self, nome, trace_id, pai_id, tipo, atributos)
+
+    def atual(self):
+        """Span em andamento (SPAN_NULO se não houver), para anotar atributos"""
+        return _span_atual.get() or SPAN_NULO
+
+    def rastrear(self, nome: Optional[str] = None) -> Callable:
+        """Decorador: a função (síncrona ou async) inteira vira um span"""
+        def decorador(funcao: Callable) -> Callable:
+            nome_span = nome or funcao.__name__
+
+            if asyncio.iscoroutinefunction(funcao):
+                @functools.wraps(funcao)
+                async def envoltorio_async(*args, **kwargs):
+                    if not self.ativo:
+                        return await funcao(*args, **kwargs)
+                    with self.span(nome_span):
+                        return await funcao(*args, **kwargs)
+                return envoltorio_async
+
+            @functools.wraps(funcao)
+            def envoltorio(*args, **kwargs):
+                if not self.ativo:
+                    return funcao(*args, **kwargs)
+                with self.span(nome_span):
+                    return funcao(*args, **kwargs)
+            return envoltorio
+        return decorador
+
+    # ✅ EXPORTAÇÃO (thread própria, fora do event loop)
+
+    def exportar(self, span: Span):
+        if self._thread is None:
+            self._iniciar()
+        try:
+            self._fila.put_nowait(span)
+        except queue.Full:
+            with self._lock:
+                self.stats["descartados"] += 1
+
+    def _iniciar(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._gravar, name="rastreamento", daemon=True)
+            self._thread.start()
+        atexit.register(self.parar)
+
+    def _lote_otlp(self, spans: List[Span]) -> bytes:
+        return dumps({"resourceSpans": [{
+            "resource": {"attributes": [_atributo_otlp("service.name", RASTREAMENTO_SERVICO)]},
+            "scopeSpans": [{"scope": {"name": ESCOPO}, "spans": [span.para_otlp() for span in spans]}],
+        }]}) + b"\n"
+
+    def _escrever(self, linha: bytes):
+        if self.saida == "console":
+            sys.stdout.write(linha.decode("utf-8"))
+            sys.stdout.flush()
+            return
+        os.makedirs(os.path.dirname(self.arquivo) or ".", exist_ok=True)
+        with open(self.arquivo, "ab") as destino:
+            destino.write(linha)
+
+    def _gravar(self):
+        parar = False
+        while not parar:
+            spans = []
+            item = self._fila.get()
+            # Junta o que já estiver na fila num lote só (uma linha por lote)
+            while item is not None:
+                spans.append(item)
+                if len(spans) >= 512:
+                    break
+                try:
+                    item = self._fila.get_nowait()
+                except queue.Empty:
+                    break
+            parar = item is None
+            if not spans:
+                continue
+            try:
+                self._escrever(self._lote_otlp(spans))
+                with self._lock:
+                    self.stats["exportados"] += len(spans)
+                    self.stats["lotes"] += 1
+            except Exception as e:
+                with self._lock:
+                    self.stats["erros"] += 1
+                log.warning("Falha ao gravar spans do rastreamento: %s", e)
+
+    def parar(self):
+        """Grava o que ainda está na fila e encerra a thread"""
+        thread = self._thread
+        if thread is None:
+            return
+        self._fila.put(None)
+        thread.join(timeout=5)
+        self._thread = None
+
+    def estatisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"ativo": self.ativo, "saida": self.saida, "amostragem": self.amostragem,
+                    "na_fila": self._fila.qsize(), **self.stats}
+
+
+# Instância global usada pela API
+rastreador = Rastreador()
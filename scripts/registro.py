@@ -0,0 +1,175 @@
+"""
+Logs estruturados da API.
+Cada registro vira uma linha JSON (ou texto legível, LOG_FORMATO=texto)
+com horário, nível, módulo, mensagem, ID da requisição e os campos
+passados em `extra`. O logger só enfileira o registro (QueueHandler); a
+formatação e a escrita no stdout acontecem numa thread própria
+(QueueListener), então um log nunca bloqueia o event loop.
+
+Amostragem: LOG_AMOSTRAGEM="DEBUG=0.1,INFO=1" mantém só uma fração dos
+registros de cada nível (WARNING para cima nunca é descartado). A decisão
+é pelo ID da requisição, então uma requisição amostrada sai inteira.
+Um registro pode ter a própria taxa: log.info(..., extra={"amostragem": 0.01}).
+"""
+import atexit
+import contextvars
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import uuid
+import zlib
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# ✅ CONFIGURAÇÃO DOS LOGS
+LOG_NIVEL = os.getenv("LOG_NIVEL", "INFO").upper()
+LOG_NIVEL_BIBLIOTECAS = os.getenv("LOG_NIVEL_BIBLIOTECAS", "WARNING").upper()  # httpx, sqlalchemy, aiosqlite...
+LOG_FORMATO = os.getenv("LOG_FORMATO", "json").lower()  # json | texto
+LOG_AMOSTRAGEM = os.getenv("LOG_AMOSTRAGEM", "")  # ex: DEBUG=0.1,INFO=1
+
+# Loggers da aplicação ficam sob este prefixo (nível próprio, separado das bibliotecas)
+PREFIXO = "smartspend"
+
+# ID da requisição atual (preenchido pelo middleware da API)
+id_requisicao: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("id_requisicao", default=None)
+
+# Atributos padrão do LogRecord; o resto veio de `extra`
+_ATRIBUTOS_PADRAO = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+
+def novo_id_requisicao() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def _taxas_amostragem(config: str) -> Dict[int, float]:
+    taxas = {}
+    for parte in config.split(","):
+        nivel, _, taxa = parte.partition("=")
+        if nivel.strip() and taxa.strip():
+            taxas[logging.getLevelName(nivel.strip().upper())] = float(taxa)
+    return taxas
+
+
+class FiltroContexto(logging.Filter):
+    """Anexa o ID da requisição e aplica a amostragem (roda na thread de quem loga)"""
+
+    def __init__(self, taxas: Dict[int, float]):
+        super().__init__()
+        self.taxas = taxas
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = id_requisicao.get()
+        if record.levelno >= logging.WARNING:
+            return True
+        taxa = getattr(record, "amostragem", self.taxas.get(record.levelno, 1.0))
+        if taxa >= 1:
+            return True
+        if taxa <= 0:
+            return False
+        semente = record.request_id or f"{record.created}{record.lineno}"
+        return zlib.crc32(semente.encode()) / 0xFFFFFFFF < taxa
+
+
+class FormatoJSON(logging.Formatter):
+    """Uma linha JSON por registro"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        linha = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "nivel": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        if record.request_id:
+            linha["request_id"] = record.request_id
+        for chave, valor in vars(record).items():
+            if chave not in _ATRIBUTOS_PADRAO and chave not in ("request_id", "amostragem"):
+                linha[chave] = valor
+        if record.exc_info:
+            linha["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            linha["exc"] = record.exc_text
+        # Import tardio: serializacao loga por este módulo (import circular)
+        from serializacao import dumps_texto
+        return dumps_texto(linha)
+
+
+class FormatoTexto(logging.Formatter):
+    """Formato legível para desenvolvimento (campos extras no fim da linha)"""
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s: %(message)s", "%H:%M:%S")
+
+    def format(self, record: logging.LogRecord) -> str:
+        texto = super().format(record)
+        campos = {chave: valor for chave, valor in vars(record).items()
+                  if chave not in _ATRIBUTOS_PADRAO and chave != "amostragem" and valor is not None}
+        if campos:
+            texto += " " + " ".join(f"{chave}={valor}" for chave, valor in campos.items())
+        return texto
+
+
+class FilaDeLogs(logging.handlers.QueueHandler):
+    """QueueHandler que mantém exc_info/extras para o formatador da outra thread"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.message = record.getMessage()
+        record.msg, record.args = record.message, None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SaidaPadrao(logging.StreamHandler):
+    """
+    StreamHandler que escreve no sys.stdout atual, não no da configuração
+    (quem troca o stdout, como o pytest ao capturar a saída, não quebra a thread)
+    """
+
+    @property
+    def stream(self):
+        return sys.stdout
+
+    @stream.setter
+    def stream(self, valor):
+        pass
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+def configurar_logs():
+    """Liga o root logger à fila (idempotente; chamado ao obter o primeiro logger)"""
+    global _listener
+    if _listener is not None:
+        return
+    fila: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+    saida = SaidaPadrao()
+    saida.setFormatter(FormatoTexto() if LOG_FORMATO == "texto" else FormatoJSON())
+
+    entrada = FilaDeLogs(fila)
+    entrada.addFilter(FiltroContexto(_taxas_amostragem(LOG_AMOSTRAGEM)))
+
+    raiz = logging.getLogger()
+    raiz.handlers = [entrada]
+    raiz.setLevel(LOG_NIVEL_BIBLIOTECAS)
+    logging.getLogger(PREFIXO).setLevel(LOG_NIVEL)
+    _listener = logging.handlers.QueueListener(fila, saida, respect_handler_level=True)
+    _listener.start()
+    atexit.register(parar_logs)
+
+
+def parar_logs():
+    """Esvazia a fila e para a thread de escrita"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def obter_logger(nome: str) -> logging.Logger:
+    configurar_logs()
+    return logging.getLogger(f"{PREFIXO}.{nome}")
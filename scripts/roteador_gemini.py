@@ -0,0 +1,266 @@
+"""
+Roteador de chaves/modelos Gemini com circuit breakers.
+Lembra quais chaves estouraram a cota e quais modelos não existem (404),
+evitando repetir tentativas condenadas a cada upload, e distribui a carga
+entre as chaves priorizando as que foram limitadas há mais tempo.
+"""
+import os
+import threading
+import time
+from typing import Dict, Any, List, Optional, Set, Tuple, Iterable
+
+from google.genai import errors
+
+# ✅ CONFIGURAÇÃO DOS COOLDOWNS (segundos)
+COOLDOWN_COTA = float(os.getenv("GEMINI_COOLDOWN_COTA", "60"))
+COOLDOWN_CHAVE_INVALIDA = float(os.getenv("GEMINI_COOLDOWN_CHAVE_INVALIDA", "3600"))
+COOLDOWN_MODELO_404 = float(os.getenv("GEMINI_COOLDOWN_MODELO_404", "3600"))
+COOLDOWN_SERVIDOR = float(os.getenv("GEMINI_COOLDOWN_SERVIDOR", "30"))
+COOLDOWN_MAXIMO = float(os.getenv("GEMINI_COOLDOWN_MAXIMO", "3600"))
+# Falhas de servidor (5xx/timeout) seguidas antes de abrir o circuito do modelo
+LIMITE_FALHAS_SERVIDOR = int(os.getenv("GEMINI_LIMITE_FALHAS_SERVIDOR", "3"))
+# Tempo máximo de uma sonda meio-aberta antes de liberar outra
+TIMEOUT_SONDA = 120.0
+
+# Tipos de erro
+ERRO_COTA = "cota"
+ERRO_CHAVE = "chave"
+ERRO_MODELO = "modelo"
+ERRO_SERVIDOR = "servidor"
+ERRO_REQUISICAO = "requisicao"
+
+
+def classificar_erro(e: Exception) -> str:
+    """Classifica a falha pelo código HTTP da API em vez de texto da mensagem"""
+    if isinstance(e, errors.APIError):
+        codigo = e.code or 0
+        if codigo == 429:
+            return ERRO_COTA
+        if codigo in (401, 403):
+            return ERRO_CHAVE
+        if codigo == 404:
+            return ERRO_MODELO
+        if codigo >= 500:
+            return ERRO_SERVIDOR
+        return ERRO_REQUISICAO
+    # Timeouts e erros de rede são transitórios
+    return ERRO_SERVIDOR
+
+
+class Circuito:
+    """
+    Circuit breaker simples: fechado -> aberto (cooldown) -> meio-aberto
+    (uma única sonda) -> fechado em caso de sucesso ou aberto de novo,
+    com cooldown dobrado, em caso de falha.
+    """
+
+    def __init__(self):
+        self.aberto_ate = 0.0
+        self.cooldown_atual = 0.0
+        self.falhas_consecutivas = 0
+        self.motivo: Optional[str] = None
+        self.sonda_desde: Optional[float] = None
+        self.ultimo_throttle = 0.0
+
+    def estado(self, agora: float) -> str:
+        if self.aberto_ate == 0.0:
+            return "fechado"
+        if agora < self.aberto_ate:
+            return "aberto"
+        return "meio_aberto"
+
+    def pode_tentar(self, agora: float) -> bool:
+        estado = self.estado(agora)
+        if estado == "fechado":
+            return True
+        if estado == "aberto":
+            return False
+        # Meio-aberto: só uma sonda por vez
+        return self.sonda_desde is None or agora - self.sonda_desde > TIMEOUT_SONDA
+
+    def reservar(self, agora: float):
+        if self.estado(agora) == "meio_aberto":
+            self.sonda_desde = agora
+
+    def sucesso(self):
+        self.aberto_ate = 0.0
+        self.cooldown_atual = 0.0
+        self.falhas_consecutivas = 0
+        self.motivo = None
+        self.sonda_desde = None
+
+    def abrir(self, agora: float, cooldown: float, motivo: str):
+        # Se a sonda falhou, o cooldown dobra (até o máximo)
+        if self.sonda_desde is not None and self.cooldown_atual:
+            cooldown = max(cooldown, self.cooldown_atual * 2)
+        self.cooldown_atual = min(cooldown, COOLDOWN_MAXIMO)
+        self.aberto_ate = agora + self.cooldown_atual
+        self.motivo = motivo
+        self.sonda_desde = None
+
+    def liberar_sonda(self):
+        self.sonda_desde = None
+
+
+class RoteadorGemini:
+    """
+    Escolhe o próximo par (chave, modelo) a tentar.
+    Chaves: circuito por chave (cota 429, chave inválida 401/403).
+    Modelos: circuito por modelo (404, falhas seguidas de servidor).
+    Ordem: chaves nunca limitadas primeiro, em rodízio; depois as limitadas
+    há mais tempo. Modelos na ordem de preferência configurada.
+    """
+
+    def __init__(self, api_keys: List[str], modelos: List[str]):
+        self.api_keys = list(dict.fromkeys(api_keys))  # remove chaves repetidas
+        self.modelos = list(modelos)
+        self._chaves = {k: Circuito() for k in self.api_keys}
+        self._modelos = {m: Circuito() for m in self.modelos}
+        self._lock = threading.Lock()
+        self._rodizio = 0
+        self.sucessos = 0
+        self.falhas: Dict[str, int] = {}
+
+    def _chaves_ordenadas(self) -> List[str]:
+        n = len(self.api_keys)
+        inicio = self._rodizio % n
+        return sorted(
+            self.api_keys,
+            key=lambda k: (self._chaves[k].ultimo_throttle, (self.api_keys.index(k) - inicio) % n)
+        )
+
+    def _proximo_par(self, tentados: Set[Tuple[str, str]],
+                     evitar_chaves: Iterable[str] = ()) -> Optional[Tuple[str, str]]:
+        with self._lock:
+            agora = time.monotonic()
+            if not tentados:
+                self._rodizio += 1
+
+            chaves = self._chaves_ordenadas()
+            # Chaves a evitar (ex: a que já está em uso pelo hedge) vão para o fim da fila
+            evitar = set(evitar_chaves)
+            if evitar:
+                chaves = [k for k in chaves if k not in evitar] + [k for k in chaves if k in evitar]
+            for api_key in chaves:
+                circuito_chave = self._chaves[api_key]
+                if not circuito_chave.pode_tentar(agora):
+                    continue
+                for modelo in self.modelos:
+                    if (api_key, modelo) in tentados:
+                        continue
+                    circuito_modelo = self._modelos[modelo]
+                    if not circuito_modelo.pode_tentar(agora):
+                        continue
+                    circuito_chave.reservar(agora)
+                    circuito_modelo.reservar(agora)
+                    return api_key, modelo
+
+            # Tudo em cooldown: força uma sonda no par que reabre primeiro,
+            # para que o upload tenha ao menos uma tentativa
+            if not tentados:
+                api_key = min(chaves, key=lambda k: self._chaves[k].aberto_ate)
+                modelo = min(self.modelos, key=lambda m: self._modelos[m].aberto_ate)
+                return api_key, modelo
+            return None
+
+    def candidatos(self, max_tentativas: int) -> "SequenciaCandidatos":
+        """Sequência de pares (chave, modelo) para uma nota"""
+        return SequenciaCandidatos(self, max_tentativas)
+
+    def registrar_sucesso(self, api_key: str, modelo: str):
+        with self._lock:
+            self._chaves[api_key].sucesso()
+            self._modelos[modelo].sucesso()
+            self.sucessos += 1
+
+    def registrar_falha(self, api_key: str, modelo: str, e: Exception) -> str:
+        """Atualiza os circuitos conforme o tipo de erro e retorna a classificação"""
+        tipo = classificar_erro(e)
+        with self._lock:
+            agora = time.monotonic()
+            circuito_chave = self._chaves[api_key]
+            circuito_modelo = self._modelos[modelo]
+            self.falhas[tipo] = self.falhas.get(tipo, 0) + 1
+
+            if tipo == ERRO_COTA:
+                circuito_chave.ultimo_throttle = agora
+                circuito_chave.abrir(agora, COOLDOWN_COTA, "cota esgotada (429)")
+                circuito_modelo.liberar_sonda()
+            elif tipo == ERRO_CHAVE:
+                circuito_chave.abrir(agora, COOLDOWN_CHAVE_INVALIDA, "chave sem permissão (401/403)")
+                circuito_modelo.liberar_sonda()
+            elif tipo == ERRO_MODELO:
+                circuito_modelo.abrir(agora, COOLDOWN_MODELO_404, "modelo não encontrado (404)")
+                circuito_chave.liberar_sonda()
+            elif tipo == ERRO_SERVIDOR:
+                circuito_modelo.falhas_consecutivas += 1
+                if circuito_modelo.falhas_consecutivas >= LIMITE_FALHAS_SERVIDOR or circuito_modelo.sonda_desde:
+                    circuito_modelo.abrir(agora, COOLDOWN_SERVIDOR, "falhas de servidor (5xx/timeout)")
+                circuito_chave.liberar_sonda()
+            else:
+                # Erro da própria requisição (ex: imagem inválida): não penaliza ninguém
+                circuito_chave.liberar_sonda()
+                circuito_modelo.liberar_sonda()
+        return tipo
+
+    def liberar(self, api_key: str, modelo: str):
+        """Libera sondas de uma tentativa cancelada antes de terminar"""
+        with self._lock:
+            self._chaves[api_key].liberar_sonda()
+            self._modelos[modelo].liberar_sonda()
+
+    def estado(self) -> Dict[str, Any]:
+        """Estado dos circuitos para o endpoint de diagnóstico"""
+        agora = time.monotonic()
+
+        def descrever(circuito: Circuito) -> Dict[str, Any]:
+            return {
+                "estado": circuito.estado(agora),
+                "motivo": circuito.motivo,
+                "reabre_em_s": round(max(0.0, circuito.aberto_ate - agora), 1) if circuito.aberto_ate else 0.0,
+                "falhas_consecutivas": circuito.falhas_consecutivas
+            }
+
+        with self._lock:
+            return {
+                "chaves": [
+                    {"chave": f"...{k[-4:]}", **descrever(self._chaves[k])}
+                    for k in self.api_keys
+                ],
+                "modelos": [
+                    {"modelo": m, **descrever(self._modelos[m])}
+                    for m in self.modelos
+                ],
+                "sucessos": self.sucessos,
+                "falhas": dict(self.falhas)
+            }
+
+
+class SequenciaCandidatos:
+    """
+    Entrega pares (chave, modelo) sob demanda para uma única nota. O estado
+    do roteador é reavaliado a cada pedido, então uma falha registrada já
+    afeta a escolha seguinte.
+    """
+
+    def __init__(self, roteador: RoteadorGemini, max_tentativas: int):
+        self._roteador = roteador
+        self._restantes = max_tentativas
+        self._tentados: Set[Tuple[str, str]] = set()
+
+    def proximo(self, evitar_chaves: Iterable[str] = ()) -> Optional[Tuple[str, str]]:
+        if self._restantes <= 0:
+            return None
+        par = self._roteador._proximo_par(self._tentados, evitar_chaves)
+        if par is None:
+            return None
+        self._restantes -= 1
+        self._tentados.add(par)
+        return par
+
+    def __iter__(self):
+        while True:
+            par = self.proximo()
+            if par is None:
+                return
+            yield par
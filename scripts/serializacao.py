@@ -0,0 +1,108 @@
+"""
+Serialização JSON rápida para respostas da API e colunas JSON do banco.
+Usa msgspec ou orjson quando instalados (ambos opcionais) e cai para o
+json da biblioteca padrão sem eles; a saída é sempre UTF-8 compacto, sem
+escapar acentos. JSON_BACKEND força um backend (auto | msgspec | orjson | json).
+
+A lista de itens legada (Nota.itens) é decodificada com o tipo ItemNota:
+com msgspec a validação acontece durante o parse, sem dicts intermediários.
+"""
+import json
+import os
+from typing import Any, Dict, List, Optional, Union
+
+from fastapi.responses import JSONResponse
+
+try:
+    import msgspec
+except ImportError:  # opcional
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:  # opcional
+    orjson = None
+
+from registro import obter_logger
+
+log = obter_logger(__name__)
+
+# ✅ CONFIGURAÇÃO DA SERIALIZAÇÃO
+JSON_BACKEND = os.getenv("JSON_BACKEND", "auto").lower()
+
+
+def _escolher_backend(preferido: str) -> str:
+    disponiveis = {"msgspec": msgspec is not None, "orjson": orjson is not None, "json": True}
+    if preferido in disponiveis and disponiveis[preferido]:
+        return preferido
+    if preferido not in ("auto", "json"):
+        log.warning("JSON_BACKEND=%s indisponível; usando o melhor instalado", preferido)
+    return next(nome for nome in ("msgspec", "orjson", "json") if disponiveis[nome])
+
+
+backend = _escolher_backend(JSON_BACKEND)
+
+if backend == "msgspec":
+    _codificador = msgspec.json.Encoder(enc_hook=str)
+    _decodificador = msgspec.json.Decoder()
+
+    def dumps(obj: Any) -> bytes:
+        return _codificador.encode(obj)
+
+    def loads(dados: Union[bytes, str]) -> Any:
+        return _decodificador.decode(dados)
+
+elif backend == "orjson":
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+    def loads(dados: Union[bytes, str]) -> Any:
+        return orjson.loads(dados)
+
+else:
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+    def loads(dados: Union[bytes, str]) -> Any:
+        return json.loads(dados)
+
+
+def dumps_texto(obj: Any) -> str:
+    """dumps para colunas Text/String do banco"""
+    return dumps(obj).decode("utf-8")
+
+
+class RespostaJSON(JSONResponse):
+    """JSONResponse com o backend rápido (default_response_class da API)"""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+# ✅ FORMATO TIPADO DOS ITENS
+if msgspec is not None:
+    class ItemNota(msgspec.Struct):
+        nome: Optional[str] = None
+        valor: Optional[Union[float, str]] = None
+        quantidade: Optional[Union[float, str]] = None
+        categoria: Optional[str] = None
+
+    _decodificador_itens = msgspec.json.Decoder(List[ItemNota])
+
+
+def decodificar_itens(dados: Union[bytes, str]) -> Any:
+    """
+    Lista de itens serializada -> lista de dicts. Com msgspec o parse já
+    valida o formato (lista de objetos de item); qualquer outra coisa
+    (registro serializado duas vezes, por exemplo) sai do parse genérico.
+    """
+    if msgspec is not None:
+        try:
+            return [msgspec.structs.asdict(item) for item in _decodificador_itens.decode(dados)]
+        except msgspec.ValidationError:
+            pass
+    return loads(dados)
+
+
+def estatisticas() -> Dict[str, Any]:
+    return {"backend": backend, "msgspec": msgspec is not None, "orjson": orjson is not None}
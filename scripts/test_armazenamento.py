@@ -0,0 +1,131 @@
+"""
+Testes do armazenamento das imagens (armazenamento.py) com um backend
+remoto falso: o upload guardado com manter_local=True é analisado a
+partir do disco, sem baixar de volta o objeto que acabou de subir.
+
+Rodar de dentro de scripts/:  python -m pytest -q test_armazenamento.py
+"""
+import asyncio
+import io
+import os
+
+import pytest
+from PIL import Image
+
+from armazenamento import ArmazenamentoImagens, ArmazenamentoLocal, chave_miniatura
+
+
+class BucketFalso(ArmazenamentoLocal):
+    """Backend "remoto" sobre uma pasta: baixar() devolve cópias temporárias e conta os downloads"""
+
+    nome = "s3"
+
+    def __init__(self, pasta: str):
+        super().__init__(pasta)
+        self.downloads = 0
+
+    def gravar_arquivo(self, chave: str, origem: str, mover: bool = False):
+        super().gravar_arquivo(chave, origem, mover=False)
+        if mover:
+            os.remove(origem)
+
+    def baixar(self, chave: str):
+        self.downloads += 1
+        if not self.existe(chave):
+            return None, False
+        temporario = f"{self.caminho(chave)}.baixado"
+        with open(temporario, "wb") as f:
+            f.write(self.ler(chave))
+        return temporario, True
+
+
+@pytest.fixture
+def bucket(tmp_path):
+    return BucketFalso(str(tmp_path / "bucket"))
+
+
+def receber(pasta, nome: str = "nota.jpg") -> str:
+    """Grava uma foto como se tivesse acabado de chegar em uploads/recebidos/"""
+    os.makedirs(pasta, exist_ok=True)
+    caminho = os.path.join(pasta, nome)
+    Image.new("RGB", (40, 30), "white").save(caminho, "JPEG")
+    return caminho
+
+
+async def ler_pelo_arquivo_local(imagens, chave):
+    async with imagens.arquivo_local(chave) as caminho:
+        with open(caminho, "rb") as f:
+            return caminho, f.read()
+
+
+def test_upload_mantido_em_disco_nao_e_baixado(tmp_path, bucket):
+    imagens = ArmazenamentoImagens(bucket)
+    recebido = receber(tmp_path / "recebidos")
+    with open(recebido, "rb") as f:
+        conteudo = f.read()
+
+    chave = imagens.guardar(recebido, "ab" * 32, "image/jpeg", manter_local=True)
+
+    assert bucket.existe(chave) and bucket.existe(chave_miniatura("ab" * 32))
+    assert os.path.exists(recebido)
+    caminho, lido = asyncio.run(ler_pelo_arquivo_local(imagens, chave))
+    assert caminho == recebido and lido == conteudo
+    assert bucket.downloads == 0
+    # A cópia local é apagada no fim da análise; a próxima leitura vem do bucket
+    assert not os.path.exists(recebido)
+    asyncio.run(ler_pelo_arquivo_local(imagens, chave))
+    assert bucket.downloads == 1
+
+
+def test_sem_manter_local_o_upload_e_movido(tmp_path, bucket):
+    imagens = ArmazenamentoImagens(bucket)
+    recebido = receber(tmp_path / "recebidos")
+
+    chave = imagens.guardar(recebido, "cd" * 32, "image/jpeg")
+
+    assert not os.path.exists(recebido)
+    asyncio.run(ler_pelo_arquivo_local(imagens, chave))
+    assert bucket.downloads == 1
+
+
+def test_mesma_foto_enviada_duas_vezes(tmp_path, bucket):
+    # Cada upload tem a sua cópia: uma análise não apaga o arquivo da outra
+    imagens = ArmazenamentoImagens(bucket)
+    primeiro = receber(tmp_path / "recebidos", "a.jpg")
+    segundo = receber(tmp_path / "recebidos", "b.jpg")
+    chave = imagens.guardar(primeiro, "ef" * 32, "image/jpeg", manter_local=True)
+    assert imagens.guardar(segundo, "ef" * 32, "image/jpeg", manter_local=True) == chave
+
+    async def duas_analises():
+        async with imagens.arquivo_local(chave) as caminho_a, imagens.arquivo_local(chave) as caminho_b:
+            return {caminho_a, caminho_b}, os.path.exists(caminho_a) and os.path.exists(caminho_b)
+
+    caminhos, ambos_existem = asyncio.run(duas_analises())
+    assert caminhos == {primeiro, segundo} and ambos_existem
+    assert bucket.downloads == 0
+    assert not os.path.exists(primeiro) and not os.path.exists(segundo)
+
+
+def test_copia_local_apagada_por_fora_cai_no_download(tmp_path, bucket):
+    imagens = ArmazenamentoImagens(bucket)
+    recebido = receber(tmp_path / "recebidos")
+    chave = imagens.guardar(recebido, "12" * 32, "image/jpeg", manter_local=True)
+    os.remove(recebido)
+
+    asyncio.run(ler_pelo_arquivo_local(imagens, chave))
+    assert bucket.downloads == 1
+
+
+def test_backend_local_ignora_manter_local(tmp_path):
+    backend = ArmazenamentoLocal(str(tmp_path / "uploads"))
+    imagens = ArmazenamentoImagens(backend)
+    recebido = receber(tmp_path / "recebidos")
+
+    chave = imagens.guardar(recebido, "34" * 32, "image/jpeg", manter_local=True)
+
+    # O original já é um arquivo local: o upload é movido e lido no lugar
+    assert not os.path.exists(recebido)
+    caminho, _ = asyncio.run(ler_pelo_arquivo_local(imagens, chave))
+    assert caminho == backend.caminho(chave) and os.path.exists(caminho)
+    with Image.open(io.BytesIO(imagens.ler_imagem(chave, miniatura=True)[0])) as miniatura:
+        assert miniatura.format == "WEBP"
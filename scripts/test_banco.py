@@ -0,0 +1,220 @@
+"""
+Testes do caminho assíncrono de banco (upserts dos agregados e da versão
+do dashboard, fila de jobs) contra os dois backends suportados:
+
+- SQLite (aiosqlite), sempre, num arquivo temporário;
+- PostgreSQL (asyncpg), só quando DATABASE_URL aponta para um servidor.
+  Os testes criam as tabelas que faltarem e apagam apenas as linhas que
+  inseriram, mas use um banco descartável.
+
+Rodar de dentro de scripts/:  python -m pytest -q test_banco.py
+"""
+import asyncio
+import os
+import uuid
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import delete, select, update
+
+from conexao import criar_engine, criar_engine_assincrona, normalizar_url
+from database import AsyncSessionLocal, Base
+from models import AgregadoMensal, Job, User, VersaoDashboard
+from cache_dashboard import CacheDashboard
+import agregados
+import jobs
+
+URL_POSTGRES = os.getenv("DATABASE_URL", "").strip()
+
+
+@pytest.fixture(params=["sqlite", "postgresql"])
+def url_banco(request, tmp_path):
+    """URL de cada backend; o PostgreSQL é pulado sem DATABASE_URL"""
+    if request.param == "sqlite":
+        return f"sqlite:///{tmp_path / 'teste.db'}"
+    if not URL_POSTGRES.startswith(("postgres://", "postgresql")):
+        pytest.skip("DATABASE_URL não aponta para um PostgreSQL")
+    return normalizar_url(URL_POSTGRES)
+
+
+def rodar(url: str, corpo):
+    """
+    Cria as tabelas, aponta a AsyncSessionLocal global (usada por jobs.py)
+    para a URL do teste e executa `corpo(usuario_id)` num event loop novo
+    """
+    engine = criar_engine(url)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        usuario_id = conn.execute(User.__table__.insert().values(
+            email=f"teste-{uuid.uuid4().hex}@smartspend.local", nome="Teste"
+        )).inserted_primary_key[0]
+
+    async def executar():
+        engine_assincrona = criar_engine_assincrona(url)
+        bind_original = AsyncSessionLocal.kw["bind"]
+        AsyncSessionLocal.configure(bind=engine_assincrona)
+        try:
+            await corpo(usuario_id)
+        finally:
+            AsyncSessionLocal.configure(bind=bind_original)
+            await engine_assincrona.dispose()
+
+    try:
+        asyncio.run(executar())
+    finally:
+        with engine.begin() as conn:
+            conn.execute(delete(AgregadoMensal).where(AgregadoMensal.user_id == usuario_id))
+            conn.execute(delete(VersaoDashboard).where(VersaoDashboard.user_id == usuario_id))
+            conn.execute(delete(User).where(User.id == usuario_id))
+        engine.dispose()
+
+
+async def _agregados(usuario_id: int):
+    async with AsyncSessionLocal() as db:
+        linhas = await db.scalars(select(AgregadoMensal).where(AgregadoMensal.user_id == usuario_id))
+        return {linha.categoria: linha for linha in linhas}
+
+
+def test_upsert_dos_agregados_soma_e_remove(url_banco):
+    compra = date(2026, 3, 14)
+    itens = [
+        {"nome": "Arroz", "valor": 20.0, "categoria": "Alimentação"},
+        {"nome": "Sabão", "valor": 5.5, "categoria": "Limpeza"},
+    ]
+
+    async def corpo(usuario_id):
+        # Duas notas no mesmo mês: a segunda passa pelo ON CONFLICT DO UPDATE
+        for _ in range(2):
+            async with AsyncSessionLocal() as db:
+                await agregados.aplicar_nota(db, usuario_id, compra, "Alimentação", 25.5, itens)
+                await db.commit()
+
+        linhas = await _agregados(usuario_id)
+        assert set(linhas) == {"Alimentação", "Limpeza"}
+        assert linhas["Alimentação"].mes == "2026-03"
+        assert linhas["Alimentação"].valor_itens == pytest.approx(40.0)
+        assert linhas["Alimentação"].quantidade_itens == 2
+        assert linhas["Alimentação"].valor_notas == pytest.approx(51.0)
+        assert linhas["Alimentação"].quantidade_notas == 2
+        assert linhas["Limpeza"].valor_itens == pytest.approx(11.0)
+        assert linhas["Limpeza"].quantidade_notas == 0
+
+        # Excluir as duas notas zera os totais e apaga as linhas vazias
+        for _ in range(2):
+            async with AsyncSessionLocal() as db:
+                await agregados.aplicar_nota(db, usuario_id, compra, "Alimentação", 25.5, itens, sinal=-1)
+                await db.commit()
+        assert await _agregados(usuario_id) == {}
+
+    rodar(url_banco, corpo)
+
+
+def test_upserts_concorrentes_nao_perdem_incrementos(url_banco):
+    async def corpo(usuario_id):
+        async def salvar():
+            async with AsyncSessionLocal() as db:
+                await agregados.aplicar_nota(db, usuario_id, date(2026, 4, 1), "Mercado", 10.0, [])
+                await db.commit()
+
+        await asyncio.gather(*(salvar() for _ in range(8)))
+        linha = (await _agregados(usuario_id))["Mercado"]
+        assert linha.quantidade_notas == 8
+        assert linha.valor_notas == pytest.approx(80.0)
+
+    rodar(url_banco, corpo)
+
+
+def test_versao_do_dashboard_acompanha_a_transacao(url_banco):
+    cache = CacheDashboard(ativo=True, backend="memoria")
+
+    async def corpo(usuario_id):
+        async with AsyncSessionLocal() as db:
+            assert await cache.versao(db, usuario_id) == 0
+
+        async with AsyncSessionLocal() as db:
+            await cache.invalidar(db, usuario_id)
+            await db.commit()
+        async with AsyncSessionLocal() as db:
+            primeira = await cache.versao(db, usuario_id)
+        assert primeira > 0
+
+        # Transação desfeita não avança a versão
+        async with AsyncSessionLocal() as db:
+            await cache.invalidar(db, usuario_id)
+            await db.rollback()
+        async with AsyncSessionLocal() as db:
+            assert await cache.versao(db, usuario_id) == primeira
+
+        # Outro processo (outra instância do cache) enxerga a mesma versão
+        async with AsyncSessionLocal() as db:
+            await cache.invalidar(db, usuario_id)
+            await db.commit()
+        async with AsyncSessionLocal() as db:
+            assert await CacheDashboard(ativo=True).versao(db, usuario_id) == primeira + 1
+
+    rodar(url_banco, corpo)
+
+
+async def _apagar_job(job_id: str):
+    async with AsyncSessionLocal() as db:
+        await db.execute(delete(Job).where(Job.id == job_id))
+        await db.commit()
+
+
+def test_job_e_reivindicado_por_um_so_worker(url_banco):
+    async def corpo(_):
+        job_id = await jobs.criar_job("originais/aa/teste.jpg", "image/jpeg")
+        try:
+            resultados = await asyncio.gather(*(
+                jobs.reivindicar_job(job_id, dono=f"replica-{i}") for i in range(4)
+            ))
+            assert resultados.count("originais/aa/teste.jpg") == 1
+            assert resultados.count(None) == 3
+
+            job = await jobs.buscar_job(job_id)
+            assert job["status"] == jobs.STATUS_PROCESSANDO
+        finally:
+            await _apagar_job(job_id)
+
+    rodar(url_banco, corpo)
+
+
+def test_lease_valido_nao_e_recuperado(url_banco):
+    async def corpo(_):
+        job_id = await jobs.criar_job("originais/bb/teste.jpg", "image/jpeg")
+        try:
+            assert await jobs.reivindicar_job(job_id, dono="replica-viva")
+
+            # Outra réplica reiniciando não toma o job de quem ainda bate
+            assert job_id not in await jobs.recuperar_jobs_expirados(lease_segundos=60)
+            assert await jobs.renovar_lease(job_id, dono="replica-viva")
+            assert not await jobs.renovar_lease(job_id, dono="outra-replica")
+            assert (await jobs.buscar_job(job_id))["status"] == jobs.STATUS_PROCESSANDO
+        finally:
+            await _apagar_job(job_id)
+
+    rodar(url_banco, corpo)
+
+
+def test_lease_vencido_volta_para_a_fila(url_banco):
+    async def corpo(_):
+        job_id = await jobs.criar_job("originais/cc/teste.jpg", "image/jpeg")
+        try:
+            assert await jobs.reivindicar_job(job_id, dono="replica-morta")
+            async with AsyncSessionLocal() as db:
+                await db.execute(update(Job).where(Job.id == job_id).values(
+                    atualizado_em=datetime.now() - timedelta(seconds=600)
+                ))
+                await db.commit()
+
+            assert job_id in await jobs.recuperar_jobs_expirados(lease_segundos=60)
+            job = await jobs.buscar_job(job_id)
+            assert job["status"] == jobs.STATUS_PENDENTE
+
+            # O dono antigo perdeu o job; outra réplica consegue reivindicá-lo
+            assert not await jobs.renovar_lease(job_id, dono="replica-morta")
+            assert await jobs.reivindicar_job(job_id, dono="replica-nova")
+        finally:
+            await _apagar_job(job_id)
+
+    rodar(url_banco, corpo)
@@ -0,0 +1,86 @@
+"""
+Testes do categorizador por palavras-chave (data/categorias.json) e da
+normalização dos nomes de categoria.
+
+Rodar de dentro de scripts/:  python -m pytest -q test_categorizador.py
+"""
+import pytest
+
+from categorizador import CATEGORIAS, Categorizador, categoria_canonica, categorizar_produto
+
+
+@pytest.mark.parametrize("nome, categoria", [
+    # A palavra mais longa vence na mesma posição: "agua sanitaria" antes de "agua"
+    ("agua sanitaria", "Limpeza"),
+    ("Água Sanitária Qboa 1L", "Limpeza"),
+    ("AGUA MINERAL 500ML", "Bebidas"),
+    ("Detergente Ypê Neutro", "Limpeza"),
+    ("Cerveja Skol lata", "Bebidas"),
+    ("ARROZ TIPO 1 5KG", "Alimentos"),
+    ("Dipirona 500mg", "Farmácia"),
+    ("Gasolina comum", "Combustível"),
+])
+def test_palavras_do_arquivo(nome, categoria):
+    assert categorizar_produto(nome) == categoria
+
+
+def test_acentos_e_maiusculas_nao_importam():
+    assert categorizar_produto("PÃO FRANCÊS") == categorizar_produto("pao frances") == "Alimentos"
+    assert categorizar_produto("ÁGUA SANITÁRIA") == categorizar_produto("agua  sanitaria") == "Limpeza"
+
+
+@pytest.mark.parametrize("nome", ["xyzzy 123", "", None])
+def test_item_desconhecido_vira_outros(nome):
+    assert categorizar_produto(nome) == "Outros"
+
+
+def test_padrao_configuravel_quando_nada_casa():
+    assert categorizar_produto("xyzzy", padrao="Sem categoria") == "Sem categoria"
+
+
+def test_precedencia_com_regras_proprias():
+    categorizador = Categorizador({
+        "Bebidas": ["agua", "gin"],
+        "Limpeza": ["agua sanitaria"],
+        "Alimentos": ["sal", "arroz"],
+    })
+    assert categorizador.categorizar("agua sanitaria 2l") == "Limpeza"
+    assert categorizador.categorizar("agua com gas") == "Bebidas"
+    # Vence a palavra mais à esquerda no nome
+    assert categorizador.categorizar("arroz com agua") == "Alimentos"
+    # Palavras curtas só casam inteiras; as longas também como prefixo
+    assert categorizador.categorizar("salgadinho") is None
+    assert categorizador.categorizar("sal grosso") == "Alimentos"
+    assert categorizador.categorizar("gingibre") is None
+    assert categorizador.categorizar("aguas") == "Bebidas"
+
+
+def test_primeira_categoria_da_palavra_repetida_vence():
+    categorizador = Categorizador({"Bebidas": ["cha"], "Alimentos": ["cha"]})
+    assert categorizador.categorizar("cha mate") == "Bebidas"
+
+
+@pytest.mark.parametrize("valor, canonica", [
+    ("alimentos", "Alimentos"),
+    ("ALIMENTOS", "Alimentos"),
+    ("farmacia", "Farmácia"),
+    ("Farmácia", "Farmácia"),
+    ("combustivel", "Combustível"),
+    (" servicos ", "Serviços"),
+])
+def test_alias_de_categoria(valor, canonica):
+    assert categoria_canonica(valor) == canonica
+
+
+@pytest.mark.parametrize("valor", ["comida", "", None, 42])
+def test_categoria_fora_da_lista(valor):
+    assert categoria_canonica(valor) is None
+
+
+def test_todas_as_canonicas_se_mapeiam_nelas_mesmas():
+    assert all(categoria_canonica(categoria) == categoria for categoria in CATEGORIAS)
+
+
+def test_categoria_desconhecida_no_arquivo_e_recusada():
+    with pytest.raises(ValueError):
+        Categorizador({"Eletrônicos": ["tv"]})
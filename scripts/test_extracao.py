@@ -0,0 +1,136 @@
+"""
+Testes da validação e do reparo das respostas do modelo (extracao.py):
+cercas de markdown, JSON cortado no fim, vírgulas sobrando, números como
+texto e respostas que não têm conserto.
+
+Rodar de dentro de scripts/:  python -m pytest -q test_extracao.py
+"""
+import json
+
+import pytest
+
+import extracao
+from extracao import RespostaInvalida, interpretar_resposta, reparar_json, NotaExtraida
+
+NOTA = {
+    "mercado": "Mercado Bom Preço",
+    "data": "2026-01-05",
+    "total": 30.5,
+    "categoria": "Alimentos",
+    "itens": [
+        {"nome": "Arroz", "valor": 20.0, "quantidade": 2, "categoria": "Alimentos"},
+        {"nome": "Sabão em pó", "valor": 10.5, "quantidade": 1, "categoria": "Limpeza"},
+    ],
+}
+TEXTO = json.dumps(NOTA, ensure_ascii=False)
+
+
+@pytest.fixture
+def contagem():
+    """Diferença dos contadores de respostas durante o teste"""
+    antes = dict(extracao.estatisticas_respostas)
+    return lambda: {k: v - antes[k] for k, v in extracao.estatisticas_respostas.items()}
+
+
+def nomes(nota):
+    return [item["nome"] for item in nota["itens"]]
+
+
+def test_resposta_valida_nao_passa_pelo_reparo(contagem):
+    nota = interpretar_resposta(TEXTO)
+    assert nomes(nota) == ["Arroz", "Sabão em pó"]
+    assert contagem() == {"validas": 1, "reparadas": 0, "invalidas": 0}
+
+
+def test_objeto_ja_validado_pelo_sdk():
+    nota = interpretar_resposta(None, parsed=NotaExtraida.model_validate(NOTA))
+    assert nota["total"] == 30.5
+
+
+@pytest.mark.parametrize("texto", [
+    f"```json\n{TEXTO}\n```",
+    f"```\n{TEXTO}\n```",
+    f"Aqui está a nota extraída:\n```json\n{TEXTO}\n```\nQualquer dúvida, avise.",
+])
+def test_cercas_de_markdown(texto, contagem):
+    nota = interpretar_resposta(texto)
+    assert nota["mercado"] == "Mercado Bom Preço"
+    assert nomes(nota) == ["Arroz", "Sabão em pó"]
+    assert contagem()["reparadas"] == 1
+
+
+def test_cortado_dentro_da_lista_de_itens():
+    # O segundo item ficou pela metade: é descartado, o resto é aproveitado
+    texto = TEXTO[:TEXTO.index('"Sabão') + 3]
+    assert nomes(interpretar_resposta(texto)) == ["Arroz"]
+
+
+def test_cortado_dentro_de_uma_string():
+    texto = TEXTO[:TEXTO.index("Sabão") + 3]
+    nota = interpretar_resposta(texto)
+    assert nomes(nota) == ["Arroz"]
+    assert nota["itens"][0]["quantidade"] == 2.0
+
+
+def test_cortado_logo_depois_de_um_item():
+    texto = TEXTO[:TEXTO.index(', {"nome": "Sabão')]
+    assert nomes(interpretar_resposta(texto)) == ["Arroz"]
+
+
+def test_virgulas_sobrando():
+    texto = TEXTO.replace('"Limpeza"}]}', '"Limpeza"},],}')
+    assert texto != TEXTO
+    assert nomes(interpretar_resposta(texto)) == ["Arroz", "Sabão em pó"]
+
+
+def test_literais_do_python_e_aspas_tipograficas():
+    texto = ("{'mercado': 'Padaria', 'data': '05/01/2026', 'total': 7, 'categoria': None, "
+             "'itens': [{'nome': 'Pão francês', 'valor': 7, 'quantidade': None}]}")
+    nota = interpretar_resposta(texto)
+    assert nota["data"] == "2026-01-05"
+    assert nota["categoria"] == "Outros"
+    assert nota["itens"][0]["quantidade"] == 1
+    assert json.loads(reparar_json("{“mercado”: “X”}")) == {"mercado": "X"}
+
+
+@pytest.mark.parametrize("quantidade, esperado", [("2", 2.0), ("1,5", 1.5), ("", 1.0), (None, 1.0)])
+def test_quantidade_como_texto(quantidade, esperado):
+    nota = json.loads(TEXTO)
+    nota["itens"][0]["quantidade"] = quantidade
+    assert interpretar_resposta(json.dumps(nota))["itens"][0]["quantidade"] == esperado
+
+
+def test_valores_em_reais_como_texto():
+    nota = json.loads(TEXTO)
+    nota["total"] = "R$ 1.234,56"
+    nota["itens"][0]["valor"] = "20,00"
+    resultado = interpretar_resposta(json.dumps(nota))
+    assert resultado["total"] == pytest.approx(1234.56)
+    assert resultado["itens"][0]["valor"] == 20.0
+
+
+def test_categoria_fora_da_lista_vem_do_nome_do_item():
+    nota = json.loads(TEXTO)
+    nota["itens"][1]["categoria"] = "higiene"
+    del nota["itens"][0]["categoria"]
+    itens = interpretar_resposta(json.dumps(nota))["itens"]
+    assert [item["categoria"] for item in itens] == ["Alimentos", "Limpeza"]
+
+
+@pytest.mark.parametrize("texto", [
+    "desculpe, não consegui ler a nota",
+    '{"mercado": ',
+    '{"mercado": "Mercado Bom Pr',          # cortado antes dos campos obrigatórios
+    '{"mercado": "X", "itens": ',
+    '{"mercado": "X", "data": "2026-01-05", "total": "muito", "categoria": "Alimentos", "itens": []}',
+])
+def test_sem_conserto_levanta_resposta_invalida(texto, contagem):
+    with pytest.raises(RespostaInvalida):
+        interpretar_resposta(texto)
+    assert contagem() == {"validas": 0, "reparadas": 0, "invalidas": 1}
+
+
+@pytest.mark.parametrize("texto", ["", None])
+def test_resposta_vazia(texto):
+    with pytest.raises(RespostaInvalida, match="vazia"):
+        interpretar_resposta(texto)
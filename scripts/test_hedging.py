@@ -0,0 +1,190 @@
+"""
+Testes do hedging das chamadas ao Gemini (hedging.py) com tentativas
+falsas: cada chave responde depois de um atraso configurado ou levanta.
+
+Rodar de dentro de scripts/:  python -m pytest -q test_hedging.py
+"""
+import asyncio
+
+import pytest
+
+import hedging
+from hedging import ControleHedge, PAPEL_HEDGE, PAPEL_PRINCIPAL
+from limitador import LimitadorConcorrencia
+
+ATRASO_HEDGE = 0.05  # segundos
+
+
+@pytest.fixture(autouse=True)
+def atraso_curto(monkeypatch):
+    """Sem amostras de latência o atraso é o configurado: 50 ms nos testes"""
+    monkeypatch.setattr(hedging, "GEMINI_HEDGE_ATRASO_MS", ATRASO_HEDGE * 1000)
+    monkeypatch.setattr(hedging, "GEMINI_HEDGE_ATRASO_MIN_MS", 0)
+
+
+class Candidatos:
+    """Mesma interface da SequenciaCandidatos do roteador, sobre uma lista fixa de chaves"""
+
+    def __init__(self, *chaves: str):
+        self._pares = [(chave, "modelo") for chave in chaves]
+
+    def proximo(self, evitar_chaves=()):
+        for par in self._pares:
+            if par[0] not in evitar_chaves:
+                self._pares.remove(par)
+                return par
+        return None
+
+
+class Modelo:
+    """
+    `tentar` falso: {chave: segundos até responder ou exceção a levantar}.
+    Registra as chamadas e as tentativas canceladas.
+    """
+
+    def __init__(self, respostas, limitador=None):
+        self.respostas = respostas
+        self.limitador = limitador
+        self.chamadas = []
+        self.canceladas = []
+
+    async def tentar(self, chave, modelo, largada):
+        self.chamadas.append(chave)
+        try:
+            if self.limitador is not None:
+                async with self.limitador.vaga():
+                    largada.marcar()
+                    return await self._responder(chave)
+            largada.marcar()
+            return await self._responder(chave)
+        except asyncio.CancelledError:
+            self.canceladas.append(chave)
+            raise
+
+    async def _responder(self, chave):
+        resposta = self.respostas[chave]
+        if isinstance(resposta, Exception):
+            await asyncio.sleep(0)
+            raise resposta
+        await asyncio.sleep(resposta)
+        return {"chave": chave}
+
+
+def test_sem_hedge_quando_a_principal_responde_antes_do_atraso():
+    controle = ControleHedge(ativo=True, hedges_por_minuto=10)
+    modelo = Modelo({"A": 0.01, "B": 0.01})
+
+    resultado = asyncio.run(controle.executar(modelo.tentar, Candidatos("A", "B")))
+
+    assert resultado == {"chave": "A"}
+    assert modelo.chamadas == ["A"]
+    assert controle.hedges_lancados == 0
+    assert controle.vitorias == {PAPEL_PRINCIPAL: 1, PAPEL_HEDGE: 0}
+
+
+def test_hedge_dispara_depois_do_atraso_e_a_lenta_e_cancelada():
+    controle = ControleHedge(ativo=True, hedges_por_minuto=10)
+    modelo = Modelo({"A": 5.0, "B": 0.01})
+
+    async def cenario():
+        inicio = asyncio.get_running_loop().time()
+        resultado = await controle.executar(modelo.tentar, Candidatos("A", "B"))
+        return resultado, asyncio.get_running_loop().time() - inicio
+
+    resultado, duracao = asyncio.run(cenario())
+
+    assert resultado == {"chave": "B"}
+    assert modelo.chamadas == ["A", "B"]
+    assert modelo.canceladas == ["A"]
+    assert ATRASO_HEDGE <= duracao < 1.0
+    assert controle.hedges_lancados == 1
+    assert controle.vitorias == {PAPEL_PRINCIPAL: 0, PAPEL_HEDGE: 1}
+
+
+def test_principal_que_termina_primeiro_cancela_o_hedge():
+    controle = ControleHedge(ativo=True, hedges_por_minuto=10)
+    modelo = Modelo({"A": 0.1, "B": 5.0})
+
+    resultado = asyncio.run(controle.executar(modelo.tentar, Candidatos("A", "B")))
+
+    assert resultado == {"chave": "A"}
+    assert modelo.canceladas == ["B"]
+    assert controle.vitorias[PAPEL_PRINCIPAL] == 1
+
+
+def test_orcamento_de_hedges_sob_carga():
+    controle = ControleHedge(ativo=True, hedges_por_minuto=2)
+
+    async def cenario():
+        modelos = [Modelo({"A": 0.2, "B": 0.01}) for _ in range(5)]
+        resultados = await asyncio.gather(*(
+            controle.executar(modelo.tentar, Candidatos("A", "B")) for modelo in modelos
+        ))
+        return modelos, resultados
+
+    modelos, resultados = asyncio.run(cenario())
+
+    # Só 2 das 5 notas lentas ganham hedge; as outras esperam a principal
+    assert controle.hedges_lancados == 2
+    assert controle.hedges_negados == 3
+    assert sum(modelo.chamadas == ["A", "B"] for modelo in modelos) == 2
+    assert sorted(r["chave"] for r in resultados) == ["A", "A", "A", "B", "B"]
+
+
+def test_relogio_so_comeca_com_vaga_no_limitador():
+    # A principal espera 0,2 s na fila (vaga ocupada) e depois responde em 0,01 s:
+    # a espera não conta como lentidão e o hedge não sai
+    limitador = LimitadorConcorrencia(1)
+    controle = ControleHedge(ativo=True, hedges_por_minuto=10, limitador=limitador)
+    modelo = Modelo({"A": 0.01, "B": 0.01}, limitador)
+
+    async def cenario():
+        async def ocupar():
+            async with limitador.vaga():
+                await asyncio.sleep(0.2)
+
+        ocupante = asyncio.create_task(ocupar())
+        await asyncio.sleep(0)
+        resultado = await controle.executar(modelo.tentar, Candidatos("A", "B"))
+        await ocupante
+        return resultado
+
+    assert asyncio.run(cenario()) == {"chave": "A"}
+    assert controle.hedges_lancados == 0
+
+
+def test_sem_vaga_no_limitador_nao_dispara_hedge():
+    limitador = LimitadorConcorrencia(1)
+    controle = ControleHedge(ativo=True, hedges_por_minuto=10, limitador=limitador)
+    modelo = Modelo({"A": 0.15, "B": 0.01}, limitador)
+
+    resultado = asyncio.run(controle.executar(modelo.tentar, Candidatos("A", "B")))
+
+    assert resultado == {"chave": "A"}
+    assert modelo.chamadas == ["A"]
+    assert controle.hedges_sem_vaga == 1
+    assert controle.hedges_lancados == 0
+
+
+def test_erro_da_principal_aparece_sem_hedging():
+    controle = ControleHedge(ativo=False)
+    modelo = Modelo({"A": ValueError("cota esgotada")})
+
+    with pytest.raises(ValueError, match="cota esgotada"):
+        asyncio.run(controle.executar(modelo.tentar, Candidatos("A")))
+    assert modelo.chamadas == ["A"]
+
+
+def test_falha_passa_para_o_proximo_candidato():
+    controle = ControleHedge(ativo=False)
+    modelo = Modelo({"A": ValueError("cota esgotada"), "B": 0.01})
+
+    resultado = asyncio.run(controle.executar(modelo.tentar, Candidatos("A", "B")))
+
+    assert resultado == {"chave": "B"}
+    assert modelo.chamadas == ["A", "B"]
+
+
+def test_sem_candidatos():
+    with pytest.raises(RuntimeError):
+        asyncio.run(ControleHedge(ativo=True).executar(Modelo({}).tentar, Candidatos()))
@@ -0,0 +1,154 @@
+"""
+Testes da ingestão em streaming (ingestao.py): tipo real da imagem pelos
+primeiros bytes, limites de tamanho e limpeza do arquivo parcial quando a
+cópia falha no meio.
+
+Rodar de dentro de scripts/:  python -m pytest -q test_ingestao.py
+"""
+import asyncio
+import hashlib
+import io
+import os
+
+import pytest
+from fastapi import HTTPException, UploadFile
+
+import ingestao
+from ingestao import detectar_tipo_imagem, gravar_stream, gravar_upload
+
+JPEG = b"\xff\xd8\xff\xe0\x00\x10JFIF\x00" + bytes(range(256)) * 4
+TEXTO = b"Lista de compras: arroz, feijao, sabao em po\n" * 10
+
+
+@pytest.fixture(autouse=True)
+def pasta_recebidos(tmp_path, monkeypatch):
+    """Uploads do teste vão para uma pasta temporária, em blocos de 64 bytes"""
+    pasta = tmp_path / "recebidos"
+    monkeypatch.setattr(ingestao, "PASTA_RECEBIDOS", str(pasta))
+    monkeypatch.setattr(ingestao, "UPLOAD_TAMANHO_BLOCO", 64)
+    return pasta
+
+
+def arquivos_em(pasta) -> list:
+    return sorted(os.listdir(pasta)) if os.path.isdir(pasta) else []
+
+
+class FalhaNoMeio(io.BytesIO):
+    """Origem que entrega o primeiro bloco e quebra na leitura seguinte (conexão caiu)"""
+
+    def __init__(self, conteudo: bytes):
+        super().__init__(conteudo)
+        self.leituras = 0
+
+    def read(self, tamanho=-1):
+        self.leituras += 1
+        if self.leituras > 1:
+            raise ConnectionResetError("cliente desconectou")
+        return super().read(tamanho)
+
+
+def upload(conteudo: bytes, nome: str = "nota.jpg", origem=None) -> UploadFile:
+    return UploadFile(origem or io.BytesIO(conteudo), filename=nome)
+
+
+@pytest.mark.parametrize("cabecalho, mime", [
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF", "image/jpeg"),
+    (b"\xff\xd8\xff\xe1\x00\x18Exif", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR", "image/png"),
+    (b"RIFF\x24\x00\x00\x00WEBPVP8 ", "image/webp"),
+    (b"GIF89a\x01\x00\x01\x00", "image/gif"),
+    (b"GIF87a\x01\x00\x01\x00", "image/gif"),
+    (b"BM\x36\x00\x00\x00\x00\x00", "image/bmp"),
+    (b"II*\x00\x08\x00\x00\x00", "image/tiff"),
+    (b"MM\x00*\x00\x00\x00\x08", "image/tiff"),
+])
+def test_assinaturas_aceitas(cabecalho, mime):
+    assert detectar_tipo_imagem(cabecalho) == mime
+
+
+@pytest.mark.parametrize("cabecalho", [
+    TEXTO[:32],
+    b"%PDF-1.7\n",
+    b"PK\x03\x04\x14\x00",
+    b"RIFF\x24\x00\x00\x00WAVEfmt ",   # RIFF que não é WEBP
+    b"xxxx\x24\x00\x00\x00WEBPVP8 ",   # WEBP sem RIFF
+    b"\xff\xd8",                        # curto demais
+    b"",
+])
+def test_assinaturas_recusadas(cabecalho):
+    assert detectar_tipo_imagem(cabecalho) is None
+
+
+def test_gravar_stream(pasta_recebidos):
+    gravado = gravar_stream("nota.jpg", io.BytesIO(JPEG), prefixo="lote")
+
+    assert gravado.mime == "image/jpeg"
+    assert gravado.tamanho == len(JPEG)
+    assert gravado.sha256 == hashlib.sha256(JPEG).hexdigest()
+    assert gravado.nome_arquivo.startswith("lote_") and gravado.nome_arquivo.endswith("_nota.jpg")
+    with open(gravado.caminho, "rb") as arquivo:
+        assert arquivo.read() == JPEG
+    assert arquivos_em(pasta_recebidos) == [gravado.nome_arquivo]
+
+
+def test_gravar_upload():
+    gravado = asyncio.run(gravar_upload(upload(JPEG)))
+
+    assert gravado.mime == "image/jpeg"
+    assert gravado.tamanho == len(JPEG)
+    assert gravado.sha256 == hashlib.sha256(JPEG).hexdigest()
+    with open(gravado.caminho, "rb") as arquivo:
+        assert arquivo.read() == JPEG
+
+
+def test_texto_renomeado_para_jpg_da_415(pasta_recebidos):
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(gravar_upload(upload(TEXTO, "nota.jpg")))
+    assert erro.value.status_code == 415
+    assert "nota.jpg" in erro.value.detail
+
+    with pytest.raises(HTTPException) as erro:
+        gravar_stream("nota.jpg", io.BytesIO(TEXTO))
+    assert erro.value.status_code == 415
+    assert arquivos_em(pasta_recebidos) == []
+
+
+def test_acima_do_limite_da_413_e_apaga_o_parcial(pasta_recebidos, monkeypatch):
+    monkeypatch.setattr(ingestao, "UPLOAD_MAX_BYTES", 200)
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(gravar_upload(upload(JPEG)))
+    assert erro.value.status_code == 413
+    assert arquivos_em(pasta_recebidos) == []
+
+
+def test_arquivo_vazio_da_400(pasta_recebidos):
+    with pytest.raises(HTTPException) as erro:
+        asyncio.run(gravar_upload(upload(b"")))
+    assert erro.value.status_code == 400
+    assert arquivos_em(pasta_recebidos) == []
+
+
+def test_falha_no_meio_da_copia_nao_deixa_arquivo(pasta_recebidos):
+    origem = FalhaNoMeio(JPEG)
+    with pytest.raises(ConnectionResetError, match="cliente desconectou"):
+        gravar_stream("nota.jpg", origem)
+    assert origem.leituras == 2
+    assert arquivos_em(pasta_recebidos) == []
+
+
+def test_falha_no_meio_do_upload_nao_deixa_arquivo(pasta_recebidos):
+    with pytest.raises(ConnectionResetError, match="cliente desconectou"):
+        asyncio.run(gravar_upload(upload(JPEG, origem=FalhaNoMeio(JPEG))))
+    assert arquivos_em(pasta_recebidos) == []
+
+
+def test_falha_ao_abrir_mantem_o_erro_original(pasta_recebidos, monkeypatch):
+    # O arquivo nem chega a ser criado: a limpeza não pode trocar o erro por FileNotFoundError
+    def sem_espaco(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(ingestao, "open", sem_espaco, raising=False)
+    with pytest.raises(OSError) as erro:
+        gravar_stream("nota.jpg", io.BytesIO(JPEG))
+    assert erro.value.errno == 28
+    assert arquivos_em(pasta_recebidos) == []
@@ -0,0 +1,186 @@
+"""
+Testes da expansão de ZIPs do upload em lote (lote.expandir_zip): limites
+checados pelo índice antes de descompactar, zip bombs, entradas com
+caminho (../) e mistura de imagens com outros arquivos.
+
+Rodar de dentro de scripts/:  python -m pytest -q test_lote.py
+"""
+import io
+import os
+import struct
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+from PIL import Image
+
+import ingestao
+import lote
+from lote import expandir_zip, verificar_limites_lote
+
+
+@pytest.fixture(autouse=True)
+def pasta_recebidos(tmp_path, monkeypatch):
+    """Uploads do teste vão para uma pasta temporária, com limites pequenos"""
+    pasta = tmp_path / "uploads" / "recebidos"
+    monkeypatch.setattr(ingestao, "PASTA_RECEBIDOS", str(pasta))
+    monkeypatch.setattr(lote, "UPLOAD_LOTE_MAX_ARQUIVOS", 5)
+    monkeypatch.setattr(lote, "UPLOAD_LOTE_MAX_BYTES", 200 * 1024)
+    monkeypatch.setattr(lote, "UPLOAD_LOTE_MAX_MB", 0.2)
+    return pasta
+
+
+def foto(semente: int = 0) -> bytes:
+    """JPEG pequeno de ruído (não comprime no ZIP, como uma foto de verdade)"""
+    saida = io.BytesIO()
+    Image.effect_noise((64, 64), 40 + semente).convert("RGB").save(saida, "JPEG")
+    return saida.getvalue()
+
+
+def criar_zip(entradas) -> io.BytesIO:
+    saida = io.BytesIO()
+    with zipfile.ZipFile(saida, "w", zipfile.ZIP_DEFLATED) as arquivo:
+        for nome, conteudo in entradas:
+            arquivo.writestr(nome, conteudo)
+    saida.seek(0)
+    return saida
+
+
+def arquivos_em(pasta) -> list:
+    return sorted(os.listdir(pasta)) if os.path.isdir(pasta) else []
+
+
+def todos_os_arquivos(raiz) -> list:
+    return sorted(os.path.join(base, nome) for base, _, nomes in os.walk(raiz) for nome in nomes)
+
+
+def por_nome(imagens):
+    return {nome: (gravado, erro) for nome, gravado, erro in imagens}
+
+
+def test_extrai_so_as_imagens(pasta_recebidos):
+    nota1 = foto(1)
+    zip_lote = criar_zip([
+        ("nota1.jpg", nota1),
+        ("pasta/nota2.JPEG", foto(2)),
+        ("leia-me.txt", b"nada"),
+        ("pasta/", b""),
+        ("__MACOSX/._nota1.jpg", b"metadados"),
+        (".DS_Store", b"metadados"),
+    ])
+    imagens = por_nome(expandir_zip(zip_lote, "lote"))
+
+    assert set(imagens) == {"nota1.jpg", "nota2.JPEG"}
+    assert all(erro is None for _, erro in imagens.values())
+    gravado = imagens["nota1.jpg"][0]
+    assert gravado.mime == "image/jpeg" and gravado.tamanho == len(nota1)
+    assert len(arquivos_em(pasta_recebidos)) == 2
+
+
+def test_arquivo_que_nao_e_imagem_vira_erro_so_dele(pasta_recebidos):
+    imagens = por_nome(expandir_zip(criar_zip([
+        ("boa.jpg", foto()),
+        ("falsa.jpg", b"isto e texto, nao uma foto"),
+        ("vazia.png", b""),
+    ]), "lote"))
+
+    assert imagens["boa.jpg"][1] is None
+    assert imagens["falsa.jpg"] == (None, "falsa.jpg não é uma imagem suportada (JPEG, PNG, WEBP...)")
+    assert imagens["vazia.png"] == (None, "Arquivo vazio")
+    assert len(arquivos_em(pasta_recebidos)) == 1
+
+
+def test_caminhos_com_pontos_nao_saem_da_pasta(tmp_path, pasta_recebidos):
+    imagens = expandir_zip(criar_zip([
+        ("../../fora.jpg", foto(1)),
+        ("/etc/absoluto.jpg", foto(2)),
+        ("a/../../../subiu.jpg", foto(3)),
+    ]), "lote")
+
+    assert [nome for nome, _, _ in imagens] == ["fora.jpg", "absoluto.jpg", "subiu.jpg"]
+    for _, gravado, erro in imagens:
+        assert erro is None
+        assert os.path.dirname(gravado.caminho) == str(pasta_recebidos)
+    # Nada foi gravado fora de uploads/recebidos/
+    assert all(caminho.startswith(str(pasta_recebidos)) for caminho in todos_os_arquivos(tmp_path))
+    assert not os.path.exists(tmp_path / "fora.jpg")
+
+
+def test_quantidade_acima_do_limite_recusa_antes_de_extrair(pasta_recebidos):
+    zip_lote = criar_zip([(f"nota{i}.jpg", foto(i)) for i in range(6)])
+    with pytest.raises(HTTPException) as erro:
+        expandir_zip(zip_lote, "lote")
+    assert erro.value.status_code == 413
+    assert arquivos_em(pasta_recebidos) == []
+
+
+def test_quantidade_soma_o_que_o_lote_ja_recebeu(pasta_recebidos):
+    zip_lote = criar_zip([(f"nota{i}.jpg", foto(i)) for i in range(2)])
+    with pytest.raises(HTTPException):
+        expandir_zip(zip_lote, "lote", arquivos_lote=4)
+    assert arquivos_em(pasta_recebidos) == []
+
+
+def test_tamanho_total_descompactado_acima_do_limite(pasta_recebidos, monkeypatch):
+    monkeypatch.setattr(lote, "UPLOAD_LOTE_RAZAO_MAX", 0)
+    # 3 x 80 KB descompactados passam dos 200 KB do lote, mesmo comprimindo para quase nada
+    zip_lote = criar_zip([(f"nota{i}.jpg", b"\xff\xd8\xff" + bytes(80 * 1024)) for i in range(3)])
+    with pytest.raises(HTTPException) as erro:
+        expandir_zip(zip_lote, "lote")
+    assert erro.value.status_code == 413
+    assert "descompactado" in erro.value.detail
+    assert arquivos_em(pasta_recebidos) == []
+
+
+def test_foto_acima_do_limite_vira_erro_so_dela(pasta_recebidos, monkeypatch):
+    monkeypatch.setattr(lote, "UPLOAD_MAX_BYTES", 10 * 1024)
+    monkeypatch.setattr(lote, "UPLOAD_MAX_MB", 0.01)
+    monkeypatch.setattr(lote, "UPLOAD_LOTE_RAZAO_MAX", 0)
+    imagens = por_nome(expandir_zip(criar_zip([
+        ("grande.jpg", b"\xff\xd8\xff" + bytes(20 * 1024)),
+        ("boa.jpg", foto()),
+    ]), "lote"))
+
+    assert imagens["grande.jpg"] == (None, "grande.jpg excede 0.01 MB")
+    assert imagens["boa.jpg"][1] is None
+    assert len(arquivos_em(pasta_recebidos)) == 1
+
+
+def test_taxa_de_compressao_suspeita(pasta_recebidos):
+    imagens = por_nome(expandir_zip(criar_zip([
+        ("bomba.jpg", b"\xff\xd8\xff" + bytes(100 * 1024)),
+        ("boa.jpg", foto()),
+    ]), "lote"))
+
+    assert imagens["bomba.jpg"] == (None, "bomba.jpg tem taxa de compressão suspeita")
+    assert imagens["boa.jpg"][1] is None
+    assert len(arquivos_em(pasta_recebidos)) == 1
+
+
+def test_indice_que_mente_o_tamanho(pasta_recebidos, monkeypatch):
+    monkeypatch.setattr(lote, "UPLOAD_LOTE_RAZAO_MAX", 0)
+    conteudo = criar_zip([("mentirosa.jpg", b"\xff\xd8\xff" + bytes(50 * 1024)), ("boa.jpg", foto())]).getvalue()
+    # Central directory da primeira entrada declara 100 bytes descompactados
+    bruto = bytearray(conteudo)
+    struct.pack_into("<I", bruto, bruto.find(b"PK\x01\x02") + 24, 100)
+
+    imagens = por_nome(expandir_zip(io.BytesIO(bytes(bruto)), "lote"))
+
+    assert imagens["mentirosa.jpg"] == (None, "mentirosa.jpg está corrompido no ZIP")
+    assert imagens["boa.jpg"][1] is None
+    # O arquivo parcial da entrada corrompida foi apagado
+    assert len(arquivos_em(pasta_recebidos)) == 1
+
+
+def test_zip_invalido():
+    with pytest.raises(HTTPException) as erro:
+        expandir_zip(io.BytesIO(b"isto nao e um zip"), "lote")
+    assert erro.value.status_code == 400
+
+
+def test_verificar_limites_lote():
+    verificar_limites_lote(5, 200 * 1024)
+    for arquivos, tamanho in ((6, 0), (1, 200 * 1024 + 1)):
+        with pytest.raises(HTTPException) as erro:
+            verificar_limites_lote(arquivos, tamanho)
+        assert erro.value.status_code == 413
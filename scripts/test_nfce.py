@@ -0,0 +1,118 @@
+"""
+Testes da chave de acesso (dígito módulo 11) e da leitura do conteúdo do
+QR code da NFC-e, versões 1 e 2/3 (online e em contingência).
+
+Rodar de dentro de scripts/:  python -m pytest -q test_nfce.py
+"""
+import pytest
+
+from nfce import chave_valida, digito_verificador, interpretar_chave, interpretar_qrcode
+
+# SP, jan/2026, CNPJ 12.345.678/0001-95, NFC-e série 1 nº 12345, emissão normal; DV = 9
+CHAVE = "35260112345678000195650010000123451123456789"
+# Mesma loja, nº 12346, emitida em contingência offline (tpEmis 9); DV = 5
+CHAVE_CONTINGENCIA = "35260112345678000195650010000123469876543215"
+
+URL_SEFAZ = "https://www.nfce.fazenda.sp.gov.br/NFCeConsultaPublica/Paginas/ConsultaQRCode.aspx"
+
+
+def test_digito_verificador_modulo_11():
+    assert digito_verificador(CHAVE[:43]) == 9
+    assert digito_verificador(CHAVE_CONTINGENCIA[:43]) == 5
+    # Restos 0 e 1 dão dígito 0
+    assert digito_verificador("0" * 43) == 0
+
+
+@pytest.mark.parametrize("chave", [CHAVE, CHAVE_CONTINGENCIA])
+def test_chave_valida(chave):
+    assert chave_valida(chave)
+
+
+@pytest.mark.parametrize("posicao", [0, 10, 25, 42, 43])
+def test_um_digito_trocado_e_recusado(posicao):
+    trocado = str((int(CHAVE[posicao]) + 1) % 10)
+    chave = CHAVE[:posicao] + trocado + CHAVE[posicao + 1:]
+    assert not chave_valida(chave)
+
+
+@pytest.mark.parametrize("chave", [
+    CHAVE[:43],                      # curta
+    CHAVE + "0",                     # longa
+    "99" + CHAVE[2:],                # UF inexistente
+    CHAVE[:4] + "13" + CHAVE[6:],    # mês 13
+    CHAVE[:-1] + "X",                # não numérica
+])
+def test_chave_malformada(chave):
+    assert not chave_valida(chave)
+
+
+def test_campos_da_chave():
+    dados = interpretar_chave(CHAVE)
+    assert dados["uf"] == "SP"
+    assert dados["ano_mes"] == "2026-01"
+    assert dados["cnpj"] == "12.345.678/0001-95"
+    assert dados["modelo"] == "NFC-e"
+    assert (dados["serie"], dados["numero"]) == (1, 12345)
+    assert dados["contingencia"] is False
+    assert interpretar_chave(CHAVE_CONTINGENCIA)["contingencia"] is True
+
+
+@pytest.mark.parametrize("conteudo", [CHAVE, f"  {CHAVE}\n", " ".join(CHAVE[i:i + 4] for i in range(0, 44, 4))])
+def test_codigo_de_barras_so_com_a_chave(conteudo):
+    dados = interpretar_qrcode(conteudo)
+    assert dados["chave"] == CHAVE
+    assert "total" not in dados
+
+
+def test_qrcode_versao_1():
+    emissao = "2026-01-05T10:30:00-03:00".encode().hex()
+    dados = interpretar_qrcode(f"{URL_SEFAZ}?chNFe={CHAVE}&nVersao=100&tpAmb=1&dhEmi={emissao}"
+                               f"&vNF=123.45&vICMS=0.00&digVal=abc&cIdToken=000001&cHashQRCode=ff")
+    assert dados["chave"] == CHAVE
+    assert dados["data"] == "2026-01-05"
+    assert dados["total"] == 123.45
+
+
+def test_qrcode_versao_1_com_data_ilegivel():
+    dados = interpretar_qrcode(f"{URL_SEFAZ}?chNFe={CHAVE}&dhEmi=zz&vNF=abc")
+    assert dados["chave"] == CHAVE
+    assert dados["data"] is None and dados["total"] is None
+
+
+def test_qrcode_versao_2_online_so_traz_a_chave():
+    dados = interpretar_qrcode(f"{URL_SEFAZ}?p={CHAVE}|2|1|1|0A1B2C3D")
+    assert dados["chave"] == CHAVE
+    assert dados["data"] is None and dados["total"] is None
+
+
+def test_qrcode_versao_2_em_contingencia():
+    dados = interpretar_qrcode(f"{URL_SEFAZ}?p={CHAVE_CONTINGENCIA}|2|1|05|87.90|6a6b6c|1|0A1B2C3D")
+    assert dados["chave"] == CHAVE_CONTINGENCIA
+    assert dados["contingencia"] is True
+    assert dados["data"] == "2026-01-05"
+    assert dados["total"] == 87.90
+
+
+def test_qrcode_versao_2_sem_separadores():
+    # p= só com a chave (sem os campos separados por |): vale a chave, sem data nem total
+    dados = interpretar_qrcode(f"{URL_SEFAZ}?p={CHAVE}")
+    assert dados["chave"] == CHAVE
+    assert dados["data"] is None and dados["total"] is None
+
+
+def test_qrcode_versao_2_dia_invalido_descarta_a_data():
+    dados = interpretar_qrcode(f"{URL_SEFAZ}?p={CHAVE_CONTINGENCIA}|2|1|32|87.90|6a6b6c|1|0A")
+    assert dados["chave"] == CHAVE_CONTINGENCIA
+    assert dados["data"] is None
+    assert dados["total"] == 87.90
+
+
+@pytest.mark.parametrize("conteudo", [
+    f"{URL_SEFAZ}?p={CHAVE[:-1]}0|2|1|1|0A",       # dígito verificador errado
+    f"{URL_SEFAZ}?chNFe={CHAVE[:-1]}0&vNF=10.00",
+    f"{URL_SEFAZ}?chave={CHAVE}",                   # sem chNFe nem p=
+    "https://exemplo.com/promocao",
+    "texto qualquer",
+])
+def test_qrcode_recusado(conteudo):
+    assert interpretar_qrcode(conteudo) is None
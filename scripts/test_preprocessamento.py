@@ -0,0 +1,83 @@
+"""
+Testes do pré-processamento (preprocessamento.py): tipo da foto original
+quando ela é enviada sem alteração e arquivo do upload fechado ao final.
+
+Rodar de dentro de scripts/:  python -m pytest -q test_preprocessamento.py
+"""
+import io
+
+import pytest
+from PIL import Image
+
+import preprocessamento
+from preprocessamento import preprocessar_imagem
+
+
+def foto(formato: str, tamanho=(8, 8)) -> bytes:
+    saida = io.BytesIO()
+    Image.new("RGB", tamanho, "white").save(saida, formato)
+    return saida.getvalue()
+
+
+@pytest.mark.parametrize("formato, mime", [
+    ("GIF", "image/gif"), ("BMP", "image/bmp"), ("TIFF", "image/tiff"), ("PNG", "image/png"),
+])
+def test_original_mantem_o_tipo_detectado(formato, mime, monkeypatch):
+    monkeypatch.setattr(preprocessamento, "PREPROC_ATIVO", False)
+    dados = foto(formato)
+    assert preprocessar_imagem(dados)[:2] == (dados, mime)
+
+
+def test_original_menor_que_o_resultado_mantem_o_tipo():
+    # GIF de 8x8 é menor que qualquer JPEG recodificado: vai o original, como GIF
+    dados = foto("GIF")
+    enviado, mime, estatisticas = preprocessar_imagem(dados)
+    assert (enviado, mime) == (dados, "image/gif")
+    assert estatisticas["dimensoes_original"] == [8, 8]
+
+
+def test_imagem_ilegivel_vai_como_original(monkeypatch):
+    dados = b"\xff\xd8\xff" + b"\x00" * 64
+    enviado, mime, estatisticas = preprocessar_imagem(dados)
+    assert (enviado, mime) == (dados, "image/jpeg")
+    assert "erro" in estatisticas
+
+
+@pytest.fixture
+def imagens_abertas(monkeypatch):
+    """Guarda as imagens abertas pelo pré-processamento para conferir se foram fechadas"""
+    abertas = []
+    abrir_original = Image.open
+
+    def abrir(*args, **kwargs):
+        abertas.append(abrir_original(*args, **kwargs))
+        return abertas[-1]
+
+    monkeypatch.setattr(preprocessamento.Image, "open", abrir)
+    return abertas
+
+
+def test_arquivo_do_upload_e_fechado(tmp_path, imagens_abertas):
+    caminho = tmp_path / "nota.bmp"
+    caminho.write_bytes(foto("BMP", (600, 800)))
+
+    enviado, mime, _ = preprocessar_imagem(str(caminho))
+
+    assert mime == "image/jpeg" and enviado[:3] == b"\xff\xd8\xff"
+    # Image.close() solta o arquivo: fp volta None
+    assert len(imagens_abertas) == 1 and imagens_abertas[0].fp is None
+
+
+def test_arquivo_fechado_quando_o_processamento_falha(tmp_path, imagens_abertas, monkeypatch):
+    caminho = tmp_path / "nota.png"
+    caminho.write_bytes(foto("PNG"))
+
+    def falhar(img):
+        raise ValueError("EXIF corrompido")
+
+    monkeypatch.setattr(preprocessamento.ImageOps, "exif_transpose", falhar)
+    enviado, mime, estatisticas = preprocessar_imagem(str(caminho))
+
+    assert (enviado, mime) == (caminho.read_bytes(), "image/png")
+    assert estatisticas["erro"] == "EXIF corrompido"
+    assert imagens_abertas[0].fp is None
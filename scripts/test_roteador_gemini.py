@@ -0,0 +1,212 @@
+"""
+Testes dos circuit breakers do roteador de chaves/modelos (roteador_gemini.py)
+com relógio falso: fechado -> aberto -> meio-aberto (uma sonda) -> fechado,
+e a troca de chave/modelo conforme o tipo de falha.
+
+Rodar de dentro de scripts/:  python -m pytest -q test_roteador_gemini.py
+"""
+import pytest
+from google.genai import errors
+
+import roteador_gemini
+from roteador_gemini import (Circuito, RoteadorGemini, classificar_erro, COOLDOWN_COTA, COOLDOWN_MODELO_404,
+                             COOLDOWN_SERVIDOR, LIMITE_FALHAS_SERVIDOR, TIMEOUT_SONDA,
+                             ERRO_CHAVE, ERRO_COTA, ERRO_MODELO, ERRO_REQUISICAO, ERRO_SERVIDOR)
+
+
+class Relogio:
+    """Substitui o módulo time do roteador: monotonic() só anda quando o teste manda"""
+
+    def __init__(self):
+        self.agora = 1000.0
+
+    def monotonic(self) -> float:
+        return self.agora
+
+    def avancar(self, segundos: float):
+        self.agora += segundos
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(roteador_gemini, "time", relogio)
+    return relogio
+
+
+def erro_api(codigo: int) -> errors.APIError:
+    classe = errors.ServerError if codigo >= 500 else errors.ClientError
+    return classe(codigo, {"error": {"code": codigo, "message": "falso", "status": "FALSO"}})
+
+
+COTA = erro_api(429)
+
+
+@pytest.mark.parametrize("erro, tipo", [
+    (erro_api(429), ERRO_COTA),
+    (erro_api(401), ERRO_CHAVE),
+    (erro_api(403), ERRO_CHAVE),
+    (erro_api(404), ERRO_MODELO),
+    (erro_api(500), ERRO_SERVIDOR),
+    (erro_api(503), ERRO_SERVIDOR),
+    (erro_api(400), ERRO_REQUISICAO),
+    (TimeoutError(), ERRO_SERVIDOR),
+])
+def test_classificar_erro(erro, tipo):
+    assert classificar_erro(erro) == tipo
+
+
+def test_circuito_aberto_meio_aberto_fechado():
+    circuito = Circuito()
+    assert circuito.estado(0) == "fechado" and circuito.pode_tentar(0)
+
+    circuito.abrir(0, 60, "cota")
+    assert circuito.estado(59) == "aberto"
+    assert not circuito.pode_tentar(59)
+
+    # Depois do cooldown: meio-aberto, uma sonda só
+    assert circuito.estado(60) == "meio_aberto"
+    assert circuito.pode_tentar(60)
+    circuito.reservar(60)
+    assert not circuito.pode_tentar(61)
+    # Sonda que nunca respondeu não prende o circuito para sempre
+    assert circuito.pode_tentar(60 + TIMEOUT_SONDA + 1)
+
+    circuito.sucesso()
+    assert circuito.estado(61) == "fechado"
+    assert circuito.pode_tentar(61)
+
+
+def test_sonda_que_falha_dobra_o_cooldown():
+    circuito = Circuito()
+    circuito.abrir(0, 60, "cota")
+    circuito.reservar(60)
+    circuito.abrir(60, 60, "cota")
+    assert circuito.cooldown_atual == 120
+    assert circuito.estado(179) == "aberto"
+    assert circuito.estado(180) == "meio_aberto"
+
+
+def test_cota_troca_de_chave_e_pula_a_aberta(relogio):
+    roteador = RoteadorGemini(["chave-A", "chave-B"], ["modelo-1", "modelo-2"])
+    candidatos = roteador.candidatos(4)
+
+    chave, modelo = candidatos.proximo()
+    assert roteador.registrar_falha(chave, modelo, COTA) == ERRO_COTA
+    outra = "chave-B" if chave == "chave-A" else "chave-A"
+
+    # A chave esgotada não aparece mais: as próximas tentativas usam a outra
+    assert candidatos.proximo() == (outra, "modelo-1")
+    assert candidatos.proximo() == (outra, "modelo-2")
+    assert candidatos.proximo() is None
+
+    # Nova nota durante o cooldown também pula a chave aberta
+    relogio.avancar(COOLDOWN_COTA - 1)
+    assert [par[0] for par in roteador.candidatos(4)] == [outra, outra]
+
+
+def test_uma_sonda_depois_do_cooldown_e_sucesso_fecha(relogio):
+    roteador = RoteadorGemini(["chave-A"], ["modelo-1"])
+    roteador.registrar_falha("chave-A", "modelo-1", COTA)
+    assert roteador.estado()["chaves"][0]["estado"] == "aberto"
+
+    relogio.avancar(COOLDOWN_COTA)
+    assert roteador.estado()["chaves"][0]["estado"] == "meio_aberto"
+
+    # A primeira nota leva a sonda; uma nota concorrente não ganha outra
+    assert roteador.candidatos(1).proximo() == ("chave-A", "modelo-1")
+    assert roteador._proximo_par({("outra", "x")}) is None
+
+    roteador.registrar_sucesso("chave-A", "modelo-1")
+    estado = roteador.estado()["chaves"][0]
+    assert estado["estado"] == "fechado" and estado["motivo"] is None
+    assert roteador.candidatos(1).proximo() == ("chave-A", "modelo-1")
+
+
+def test_sonda_que_falha_reabre_com_cooldown_maior(relogio):
+    roteador = RoteadorGemini(["chave-A"], ["modelo-1"])
+    roteador.registrar_falha("chave-A", "modelo-1", COTA)
+    relogio.avancar(COOLDOWN_COTA)
+    roteador.candidatos(1).proximo()
+    roteador.registrar_falha("chave-A", "modelo-1", COTA)
+
+    relogio.avancar(COOLDOWN_COTA)
+    assert roteador.estado()["chaves"][0]["estado"] == "aberto"
+    relogio.avancar(COOLDOWN_COTA)
+    assert roteador.estado()["chaves"][0]["estado"] == "meio_aberto"
+
+
+def test_sonda_cancelada_e_liberada(relogio):
+    roteador = RoteadorGemini(["chave-A"], ["modelo-1"])
+    roteador.registrar_falha("chave-A", "modelo-1", COTA)
+    relogio.avancar(COOLDOWN_COTA)
+    assert roteador._proximo_par({("outra", "x")}) == ("chave-A", "modelo-1")
+    assert roteador._proximo_par({("outra", "x")}) is None
+
+    roteador.liberar("chave-A", "modelo-1")
+    assert roteador._proximo_par({("outra", "x")}) == ("chave-A", "modelo-1")
+
+
+def test_modelo_404_troca_de_modelo_para_todas_as_chaves(relogio):
+    roteador = RoteadorGemini(["chave-A", "chave-B"], ["modelo-1", "modelo-2"])
+    candidatos = roteador.candidatos(4)
+    chave, modelo = candidatos.proximo()
+    assert modelo == "modelo-1"
+    assert roteador.registrar_falha(chave, modelo, erro_api(404)) == ERRO_MODELO
+
+    # A mesma chave continua valendo, só o modelo muda; o modelo-1 some de todas
+    assert candidatos.proximo() == (chave, "modelo-2")
+    assert all(par[1] == "modelo-2" for par in roteador.candidatos(4))
+
+    relogio.avancar(COOLDOWN_MODELO_404)
+    assert roteador.estado()["modelos"][0]["estado"] == "meio_aberto"
+
+
+def test_falhas_de_servidor_so_abrem_depois_do_limite(relogio):
+    roteador = RoteadorGemini(["chave-A"], ["modelo-1", "modelo-2"])
+    for _ in range(LIMITE_FALHAS_SERVIDOR - 1):
+        roteador.registrar_falha("chave-A", "modelo-1", erro_api(503))
+    assert roteador.estado()["modelos"][0]["estado"] == "fechado"
+
+    roteador.registrar_falha("chave-A", "modelo-1", TimeoutError())
+    assert roteador.estado()["modelos"][0]["estado"] == "aberto"
+    # A chave não é penalizada por falha do servidor
+    assert roteador.estado()["chaves"][0]["estado"] == "fechado"
+    assert roteador.candidatos(1).proximo() == ("chave-A", "modelo-2")
+
+    relogio.avancar(COOLDOWN_SERVIDOR)
+    assert roteador.estado()["modelos"][0]["estado"] == "meio_aberto"
+
+
+def test_erro_da_requisicao_nao_abre_nada(relogio):
+    roteador = RoteadorGemini(["chave-A"], ["modelo-1"])
+    assert roteador.registrar_falha("chave-A", "modelo-1", erro_api(400)) == ERRO_REQUISICAO
+    estado = roteador.estado()
+    assert estado["chaves"][0]["estado"] == estado["modelos"][0]["estado"] == "fechado"
+
+
+def test_tudo_aberto_forca_uma_sonda_no_que_reabre_primeiro(relogio):
+    roteador = RoteadorGemini(["chave-A", "chave-B"], ["modelo-1"])
+    roteador.registrar_falha("chave-A", "modelo-1", COTA)
+    relogio.avancar(10)
+    roteador.registrar_falha("chave-B", "modelo-1", COTA)
+
+    candidatos = roteador.candidatos(3)
+    assert candidatos.proximo() == ("chave-A", "modelo-1")
+    assert candidatos.proximo() is None
+
+
+def test_chave_limitada_ha_mais_tempo_vem_primeiro(relogio):
+    roteador = RoteadorGemini(["chave-A", "chave-B"], ["modelo-1"])
+    roteador.registrar_falha("chave-A", "modelo-1", COTA)
+    relogio.avancar(5)
+    roteador.registrar_falha("chave-B", "modelo-1", COTA)
+    relogio.avancar(COOLDOWN_COTA + 5)
+    roteador.registrar_sucesso("chave-A", "modelo-1")
+    roteador.registrar_sucesso("chave-B", "modelo-1")
+
+    assert [roteador.candidatos(1).proximo()[0] for _ in range(3)] == ["chave-A"] * 3
+
+
+def test_chaves_repetidas_sao_removidas():
+    assert RoteadorGemini(["a", "b", "a"], ["m"]).api_keys == ["a", "b"]